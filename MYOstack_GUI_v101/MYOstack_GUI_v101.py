@@ -29,15 +29,106 @@
 
 from PyQt5 import QtCore, QtWidgets, QtGui
 from PyQt5.QtCore import Qt
+import os
 import sys
-import serial
 import pyqtgraph as pg
 import numpy as np
 import time
-from scipy.signal import butter, lfilter
-import serial.tools.list_ports
-from datetime import datetime
-from scipy.fftpack import fft
+from myostack import Recorder, Processor, Pipeline, Publisher, PyramidWriter, Pyramid, open_source
+from myostack.settings import Settings
+from myostack.pyramid import MEAN, envelope_curve
+from myostack.features import FEATURES
+from myostack.render import minmax_decimate, ChangeTracker, FpsCounter
+
+# Sensor colors (repeated when there are more than 9 sensors)
+COLORS = ((153, 0, 0), (229, 104, 19), (221, 180, 10), (30, 180, 30), (11, 50, 51),
+          (29, 160, 191), (30, 30, 188), (75, 13, 98), (139, 0, 55))
+
+# Grid rows (first row, row span) of sensor plots: 9 sensors - original layout, otherwise evenly over 15 rows
+def plotRows(channels):
+    if channels == 9:
+        return ((0, 1), (1, 1), (2, 1), (3, 1), (4, 4), (8, 1), (9, 1), (10, 1), (11, 4))
+    rows = max(15, channels)
+    return tuple((i*rows//channels, max(1, (i + 1)*rows//channels - i*rows//channels)) for i in range(channels))
+
+# Long history of a session from its pyramid (see myostack/pyramid.py): pan and zoom with the mouse,
+# every view change reads only the bins it shows
+class HistoryWindow(QtWidgets.QMainWindow):
+    # Custom constructor
+    def __init__(self, path, parent=None):
+        super(HistoryWindow, self).__init__(parent)
+        self.setWindowIcon(QtGui.QIcon('img/icon.png'))
+        self.channel = 0 # Shown sensor
+        
+        self.pw = pg.PlotWidget(background=(21 , 21, 21, 255))
+        self.pw.showGrid(x=True, y=True, alpha=0.7)
+        self.pw.setLabel('bottom', 'Time', 's')
+        self.p = self.pw.plot()
+        self.p.setPen(color=(100, 255, 255), width=0.8)
+        self.pe = self.pw.plot()
+        self.pe.setPen(color=(255, 0, 0), width=1)
+        self.pw.getViewBox().sigXRangeChanged.connect(self.updateView)
+        
+        self.sensorNumber = QtWidgets.QSpinBox()
+        self.sensorNumber.valueChanged.connect(self.setChannel)
+        self.follow = QtWidgets.QCheckBox("Follow")
+        self.follow.setChecked(True)
+        openButton = QtWidgets.QPushButton("Open...")
+        openButton.clicked.connect(self.openPyramid)
+        
+        centralWidget = QtWidgets.QWidget()
+        centralWidget.setStyleSheet("color: rgb(255, 255, 255); background-color: rgb(13, 13, 13);")
+        layout = QtWidgets.QGridLayout()
+        layout.addWidget(self.pw, 0, 0, 1, 4)
+        layout.addWidget(QtWidgets.QLabel("Sensor number:"), 1, 0)
+        layout.addWidget(self.sensorNumber, 1, 1)
+        layout.addWidget(self.follow, 1, 2)
+        layout.addWidget(openButton, 1, 3)
+        centralWidget.setLayout(layout)
+        self.setCentralWidget(centralWidget)
+        self.resize(1200, 500)
+        self.load(path)
+        
+        # Follow a session being recorded
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.followEnd)
+        self.timer.start(1000)
+    # Open pyramid, show its last minute
+    def load(self, path):
+        self.pyramid = Pyramid(path)
+        self.processed = self.pyramid.meta['kind'] == 'processed' # Columns: filtered data, then envelope
+        self.channels = self.pyramid.columns//2 if self.processed else self.pyramid.columns
+        self.setWindowTitle("MYOstack history | " + os.path.basename(path.rstrip('/\\')))
+        self.sensorNumber.setRange(1, self.channels)
+        end = self.pyramid.duration
+        self.pw.setXRange(max(0, end - 60), max(end, 1))
+        self.updateView()
+    # Choose session pyramid (past sessions)
+    def openPyramid(self):
+        path = QtWidgets.QFileDialog.getExistingDirectory(self, "Open session history (.pyr)")
+        if path:
+            self.follow.setChecked(False)
+            self.load(path)
+    # Select sensor
+    def setChannel(self, value):
+        self.channel = value - 1
+        self.updateView()
+    # Keep the end of a growing session in view
+    def followEnd(self):
+        if self.follow.isChecked():
+            start, end = self.pw.getViewBox().viewRange()[0]
+            duration = self.pyramid.duration
+            if duration > end:
+                self.pw.setXRange(start + duration - end, duration, padding=0)
+    # Read bins of the visible range and draw them
+    def updateView(self, *args):
+        start, end = self.pw.getViewBox().viewRange()[0]
+        columns = [self.channel, self.channels + self.channel] if self.processed else [self.channel]
+        t, data = self.pyramid.query(start, end, self.pw.width(), columns)
+        x, y = envelope_curve(t, data, 0)
+        self.p.setData(x=x, y=y)
+        if self.processed:
+            self.pe.setData(x=t, y=data[:, MEAN, 1])
 
 # Main window
 class GUI(QtWidgets.QMainWindow):
@@ -48,43 +139,55 @@ class GUI(QtWidgets.QMainWindow):
     # Custom constructor
     def initUI(self): 
         # Values
-        COM = '' # Example: COM='COM6'
+        COM = '' # Example: COM='COM6', 'sim' - simulated device, file name - replay of recording, 'COM5, COM6' or 'all' - several devices
         baudRate = 1000000 # Serial frequency
-        self.delay = 0.06 # Delay for graphic update
-        
-        self.gain = [1, 1, 1, 1, 1, 1, 1, 1, 1] # Sensors gain, index is the sensor number
+        self.fps = 16 # Graphic update frequency in Hz (independent of data acquisition)
         
         self.setWindowTitle("MYOstack GUI v1.0.1 | ELEMYO" + "    ( COM Port not found )")
         self.setWindowIcon(QtGui.QIcon('img/icon.png'))
-        self.f = open(datetime.now().strftime("%Y_%m_%d_%H_%M_%S") + ".txt", "w") # Data file creation
-        self.f.write(datetime.now().strftime("Date: %Y.%m.%d\rTime: %H:%M:%S") + "\r\n") # Data file head
-        self.f.write("File format: \r\nseconds | data1 | data2 | data3 | data4 | data5 | data6 | data7| data8 | data9 \r\n") # Data file format
-        self.l = 0 # Current data point
-        self.dt = 0.002 # Time between two signal measurements in s
-        self.fs = 1/self.dt # Signal discretization frequency in Hz
+        self.fs = 500.0 # Nominal signal discretization frequency in Hz (actual one is measured from data)
         self.passLowFrec = 10 # Low frequency for passband filter
         self.passHighFrec = 200 # Low frequency for passband filter
-        self.dataWidth = int(6.2/self.dt) # Maximum count of ploting data points (6.2 secondes vindow)
-        self.Time = [0]*self.dataWidth # Time array
         self.timeWidth = 5 # Time width of plot
-        self.Data = np.zeros((9, self.dataWidth)) # Raw data matrix, first index - sensor number, second index - sensor data 
-        self.DataEnvelope = np.zeros((9, self.dataWidth)) # Envelope of row data, first index - sensor number, second index - sensor data 
-        
-        # Accessory variables for envelope (for moving average method)
-        self.MA = np.zeros((9, 3)) 
-        self.MA_alpha = 0.95
-        self.Y0 = np.zeros(9)
-        self.X0 = np.zeros(9)
-        
-        # Accessory variables for data read from serial
-        self.ms_len = 0;
-        self.msg_end = np.array([0])
-        
-        self.loopNumber = 0; # Loop number
-        self.FFT = 0 # Fast Fourier transform data
+        self.recordFormat = 'txt' # Data file format: 'txt' - text, 'bin' - binary float32 (.myo)
+        self.publishAddress = None # Network stream: 'tcp://127.0.0.1:5555', 'udp://host:port', 'unix:///path', None - off
+        self.historyDirectory = '.' # Directory of session history pyramids (<date>.pyr), None - off
+        self.metricsPort = None # Local metrics endpoint port (http://127.0.0.1:<port>/metrics), None - off
+        self.metricsTextfile = None # Prometheus textfile updated every second, None - off
+        self.metricsJson = 'myostack_metrics.json' # Metrics dump written on exit, None - off
+        self.sharedMemory = 'myostack' # Name of shared memory window for other processes (myostack.shared.SharedReader), None - off
+        self.protocol = None # Requested device protocol: 'binary12', 'binary16', 'ascii', None - device default
+        # Serial monitor (stage 1); with several devices the plots show the channels of all of them
+        self.monitor = open_source(COM, baudRate, protocol=self.protocol)
+        channels = getattr(self.monitor, 'channels', 9) # Channels of all devices
+        self.recorder = Recorder(self.recordFormat, channels, self.fs) # Data file writer (background thread)
+        # Processing chain (parsing, filters, envelope, FFT), runs in the DSP worker thread
+        self.publisher = Publisher(self.publishAddress) if self.publishAddress else None
+        self.pyramid = PyramidWriter(self.historyDirectory, 2*channels, self.fs) if self.historyDirectory is not None else None
+        self.historyWindow = None
+        self.processor = Processor(channels, self.fs, 6.2, self.recorder, publisher=self.publisher, pyramid=self.pyramid,
+                                   shared=self.sharedMemory)
+        if self.sharedMemory is not None:
+            self.sharedMemory = self.processor.buffer.name # Another name if a running session owns the default one
+        self.channels = channels # Number of sensors
+        self.dataWidth = self.processor.dataWidth # Maximum count of ploting data points (6.2 secondes vindow)
+        self.MA_alpha = 0.95 # Envelope smoothing
+        # Filters, gains and plot style: changed only by widget signals, processor follows every change
+        self.settings = Settings(channels)
+        self.settings.update(low=self.passLowFrec, high=self.passHighFrec, alpha=self.MA_alpha)
+        self.settings.attach(self.processor)
+        self.settings.listeners.append(self._on_settings_changed)
+        self.title = "MYOstack GUI v1.0.1 | ELEMYO" # Window title without port
+        self.lastVersion = -1 # Data version at last plot update
+        self.plotChanges = ChangeTracker() # Last drawn state of curves, axes and bars
+        self.fpsCounter = FpsCounter() # Achieved graphic update frequency
+        self.metrics = self.processor.metrics # Stage latency histograms and counters
+        self.metrics.gauge('render_fps', lambda: self.fpsCounter.fps)
+        self.metricsUpdated = 0 # Time of last overlay/textfile update
         
         self.selectedSensor = 1 # Sensor number selected from GUI
         self.selectedGain = 1 # Sensor gain selected from GUI
+        self.barFeature = None # Feature shown in histogram (index in FEATURES), None - envelope
 
         # Menu panel
         stopAction = QtGui.QAction(QtGui.QIcon('img/pause.png'), 'Stop/Start (Space)', self)
@@ -96,18 +199,42 @@ class GUI(QtWidgets.QMainWindow):
         exitAction = QtGui.QAction(QtGui.QIcon('img/out.png'), 'Exit (Esc)', self)
         exitAction.setShortcut('Esc')
         exitAction.triggered.connect(self.close)
+        historyAction = QtGui.QAction('History (H)', self)
+        historyAction.setShortcut('h')
+        historyAction.triggered.connect(self.showHistory)
+        metricsAction = QtGui.QAction('Metrics (M)', self)
+        metricsAction.setShortcut('m')
+        metricsAction.triggered.connect(self.toggleMetrics)
+        calibrateAction = QtGui.QAction('Calibrate rest (C)', self)
+        calibrateAction.setShortcut('c')
+        calibrateAction.triggered.connect(self.calibrate)
+        saveProfileAction = QtGui.QAction('Save profile', self)
+        saveProfileAction.triggered.connect(self.saveProfile)
+        loadProfileAction = QtGui.QAction('Load profile', self)
+        loadProfileAction.triggered.connect(self.loadProfile)
         
         # Toolbar
         toolbar = self.addToolBar('Tool')
         toolbar.addAction(stopAction)
         toolbar.addAction(refreshAction)
         toolbar.addAction(exitAction)
-        
-        # Plot widgets for 1-9 sensor
+        toolbar.addAction(historyAction)
+        toolbar.addAction(metricsAction)
+        toolbar.addAction(calibrateAction)
+        toolbar.addAction(saveProfileAction)
+        toolbar.addAction(loadProfileAction)
+        
+        # Metrics overlay (hidden until toggled)
+        self.metricsOverlay = QtWidgets.QLabel(self)
+        self.metricsOverlay.setStyleSheet("font-family: monospace; color: rgb(255, 255, 255); background-color: rgba(0, 0, 0, 200); padding: 6px;")
+        self.metricsOverlay.move(20, 60)
+        self.metricsOverlay.setVisible(False)
+        
+        # Plot widgets for every sensor
         self.pw = [] # Plot widget array, index - sensor number
         self.p = [] # Raw data plot, index - sensor number
         self.pe = [] # Envelope data plot, index - sensor number
-        for i in range(9):
+        for i in range(self.channels):
             self.pw.append(pg.PlotWidget(background=(21 , 21, 21, 255)))
             self.pw[i].showGrid(x=True, y=True, alpha=0.7) 
             self.p.append(self.pw[i].plot())
@@ -121,21 +248,15 @@ class GUI(QtWidgets.QMainWindow):
         self.pFFT = self.pwFFT.plot()
         self.pFFT.setPen(color=(100, 255, 255), width=1)
         self.pwFFT.setLabel('bottom', 'Frequency', 'Hz')
+        self.pwFFT.setLabel('left', 'PSD', 'mV²/Hz')
         
         # Histogram widget
         self.pb = [] # Histogram item array, index - sensor number
         self.pbar = pg.PlotWidget(background=(13 , 13, 13, 255))
         self.pbar.showGrid(x=True, y=True, alpha=0.7)            
-        self.pb.append(pg.BarGraphItem(x=np.linspace(1, 2, num=1), height=np.linspace(1, 2, num=1), width=0.3, pen=QtGui.QColor(153, 0, 0), brush=QtGui.QColor(153, 0, 0)))
-        self.pb.append(pg.BarGraphItem(x=np.linspace(2, 3, num=1), height=np.linspace(2, 3, num=1), width=0.3, pen=QtGui.QColor(229, 104, 19), brush=QtGui.QColor(229, 104, 19)))
-        self.pb.append(pg.BarGraphItem(x=np.linspace(3, 4, num=1), height=np.linspace(3, 4, num=1), width=0.3, pen=QtGui.QColor(221, 180, 10), brush=QtGui.QColor(221, 180, 10)))
-        self.pb.append(pg.BarGraphItem(x=np.linspace(4, 5, num=1), height=np.linspace(4, 5, num=1), width=0.3, pen=QtGui.QColor(30, 180, 30), brush=QtGui.QColor(30, 180, 30)))
-        self.pb.append(pg.BarGraphItem(x=np.linspace(5, 6, num=1), height=np.linspace(5, 6, num=1), width=0.3, pen=QtGui.QColor(11, 50, 51), brush=QtGui.QColor(11, 50, 51)))
-        self.pb.append(pg.BarGraphItem(x=np.linspace(6, 7, num=1), height=np.linspace(6, 7, num=1), width=0.3, pen=QtGui.QColor(29, 160, 191), brush=QtGui.QColor(29, 160, 191)))
-        self.pb.append(pg.BarGraphItem(x=np.linspace(7, 8, num=1), height=np.linspace(7, 8, num=1), width=0.3, pen=QtGui.QColor(30, 30, 188), brush=QtGui.QColor(30, 30, 188)))
-        self.pb.append(pg.BarGraphItem(x=np.linspace(8, 9, num=1), height=np.linspace(8, 9, num=1), width=0.3, pen=QtGui.QColor(75, 13, 98), brush=QtGui.QColor(75, 13, 98)))
-        self.pb.append(pg.BarGraphItem(x=np.linspace(9, 10, num=1), height=np.linspace(9, 10, num=1), width=0.3, pen=QtGui.QColor(139, 0, 55), brush=QtGui.QColor(139, 0, 55)))
-        for i in range(9):
+        for i in range(self.channels):
+            color = QtGui.QColor(*COLORS[i % len(COLORS)])
+            self.pb.append(pg.BarGraphItem(x=np.linspace(i + 1, i + 2, num=1), height=np.linspace(i + 1, i + 2, num=1), width=0.3, pen=color, brush=color))
             self.pbar.addItem(self.pb[i])  
         self.pbar.setLabel('bottom', 'Sensor number')
         
@@ -174,36 +295,43 @@ class GUI(QtWidgets.QMainWindow):
         self.sensorGain.setMaximumWidth(100)
         self.sensorGain.setStyleSheet(editStyle)
         
+        # Value shown in histogram: envelope or one of EMG features
+        self.barSourceText = QtWidgets.QLabel("Histogram:")
+        self.barSource = QtWidgets.QComboBox()
+        self.barSource.addItems(["Envelope"] + [name.upper() for name in FEATURES])
+        self.barSource.currentIndexChanged.connect(self._on_bar_source_changed)
+        
         # Buttons for selecting sensor for FFT analysis
         fftButton = []
-        for i in range(9):
+        for i in range(self.channels):
             fftButton.append(QtWidgets.QRadioButton(str(i + 1)))
             fftButton[i].Value = i + 1
         fftButton[0].setChecked(True)
         self.button_group = QtWidgets.QButtonGroup()
-        for i in range(9):
+        for i in range(self.channels):
             self.button_group.addButton(fftButton[i], i + 1)
         self.button_group.buttonClicked.connect(self._on_radio_button_clicked)
         
+        # Settings follow widgets only when they are edited
+        self.passLowFreq.editingFinished.connect(lambda: self._on_edit(self.passLowFreq, 'low', self.settings.low))
+        self.passHighFreq.editingFinished.connect(lambda: self._on_edit(self.passHighFreq, 'high', self.settings.high))
+        self.envelopeSmoothingСoefficient.editingFinished.connect(
+            lambda: self._on_edit(self.envelopeSmoothingСoefficient, 'alpha', self.settings.alpha))
+        self.sensorNumber.editingFinished.connect(self._on_gain_edited)
+        self.sensorGain.editingFinished.connect(self._on_gain_edited)
+        for box, name in ((self.bandstop50, 'notch50'), (self.bandstop60, 'notch60'), (self.bandpass, 'bandpass'),
+                          (self.signal, 'showSignal'), (self.envelope, 'showEnvelope')):
+            box.toggled.connect(lambda checked, name=name: self.settings.update(**{name: checked}))
         
-        # Numbering of graphs
+        
+        # Numbering of graphs (dark background behind every second number)
         backLabel = []
-        for i in range(5):
+        numberLabel = []
+        for i in range(self.channels):
             backLabel.append(QtWidgets.QLabel(""))
             backLabel[i].setStyleSheet("font-size: 25px; background-color: rgb(21, 21, 21);")
-        
-        numberLabel = []
-        for i in range(9):
             numberLabel.append(QtWidgets.QLabel(" " + str(i+1) + " "))
-        numberLabel[0].setStyleSheet("font-size: 25px; background-color: rgb(153, 0, 0); border-radius: 14px;")
-        numberLabel[1].setStyleSheet("font-size: 25px; background-color: rgb(229, 104, 19); border-radius: 14px;") 
-        numberLabel[2].setStyleSheet("font-size: 25px; background-color: rgb(221, 180, 10); border-radius: 14px;")
-        numberLabel[3].setStyleSheet("font-size: 25px; background-color: rgb(30, 180, 30); border-radius: 14px;")
-        numberLabel[4].setStyleSheet("font-size: 25px; background-color: rgb(11, 50, 51); border-radius: 14px;")
-        numberLabel[5].setStyleSheet("font-size: 25px; background-color: rgb(29, 160, 191); border-radius: 14px;")
-        numberLabel[6].setStyleSheet("font-size: 25px; background-color: rgb(30, 30, 188); border-radius: 14px;")
-        numberLabel[7].setStyleSheet("font-size: 25px; background-color: rgb(75, 13, 98); border-radius: 14px;")
-        numberLabel[8].setStyleSheet("font-size: 25px; background-color: rgb(139, 0, 55); border-radius: 14px;")
+            numberLabel[i].setStyleSheet("font-size: 25px; background-color: rgb(%d, %d, %d); border-radius: 14px;" % COLORS[i % len(COLORS)])
         
         # Main widget
         centralWidget = QtWidgets.QWidget()
@@ -213,44 +341,19 @@ class GUI(QtWidgets.QMainWindow):
         vbox = QtWidgets.QVBoxLayout()
         
         layout = QtWidgets.QGridLayout()
-        layout.addWidget(backLabel[0], 0, 1)
-        layout.addWidget(numberLabel[0], 0, 1, Qt.AlignVCenter)
-        layout.addWidget(numberLabel[1], 1, 1, Qt.AlignVCenter)
-        layout.addWidget(backLabel[1], 2, 1)
-        layout.addWidget(numberLabel[2], 2, 1, Qt.AlignVCenter)
-        layout.addWidget(numberLabel[3], 3, 1, Qt.AlignVCenter)
-        layout.addWidget(backLabel[2], 4, 1, 4, 1)
-        layout.addWidget(numberLabel[4], 4, 1, 4, 1, Qt.AlignVCenter)
-        layout.addWidget(numberLabel[5], 8, 1, Qt.AlignVCenter)
-        layout.addWidget(backLabel[3], 9, 1)
-        layout.addWidget(numberLabel[6], 9, 1, Qt.AlignVCenter)
-        layout.addWidget(numberLabel[7], 10, 1, Qt.AlignVCenter)
-        layout.addWidget(backLabel[4], 11, 1, 4, 1)
-        layout.addWidget(numberLabel[8], 11, 1, 4, 1, Qt.AlignVCenter)
-        
-        layout.addWidget(self.pw[0], 0, 2, 1, 2)
-        layout.addWidget(self.pw[1], 1, 2, 1, 2)
-        layout.addWidget(self.pw[2], 2, 2, 1, 2)
-        layout.addWidget(self.pw[3], 3, 2, 1, 2)
-        layout.addWidget(self.pw[4], 4, 2, 4, 2)
-        layout.addWidget(self.pw[5], 8, 2, 1, 2)
-        layout.addWidget(self.pw[6], 9, 2, 1, 2)
-        layout.addWidget(self.pw[7], 10, 2, 1, 2)
-        layout.addWidget(self.pw[8], 11, 2, 4, 2)
+        for i, (row, span) in enumerate(plotRows(self.channels)):
+            if i % 2 == 0:
+                layout.addWidget(backLabel[i], row, 1, span, 1)
+            layout.addWidget(numberLabel[i], row, 1, span, 1, Qt.AlignVCenter)
+            layout.addWidget(self.pw[i], row, 2, span, 2)
         layout.addWidget(self.pbar, 0, 4, 4, 10)
         layout.addWidget(self.pwFFT, 4, 4, 7, 10)
         layout.setColumnStretch(2, 2)
         
 
-        layout.addWidget(fftButton[0], 4, 10)
-        layout.addWidget(fftButton[1], 4, 11) 
-        layout.addWidget(fftButton[2], 4, 12) 
-        layout.addWidget(fftButton[3], 5, 10)
-        layout.addWidget(fftButton[4], 5, 11)  
-        layout.addWidget(fftButton[5], 5, 12)
-        layout.addWidget(fftButton[6], 6, 10)
-        layout.addWidget(fftButton[7], 6, 11)  
-        layout.addWidget(fftButton[8], 6, 12)      
+        columns = max(3, -(-self.channels//3)) # FFT buttons in 3 rows
+        for i in range(self.channels):
+            layout.addWidget(fftButton[i], 4 + i//columns, 10 + i % columns)
         layout.addWidget(filtersText, 11, 4) 
         layout.addWidget(self.bandstop50, 11, 5) 
         layout.addWidget(self.bandstop60, 11, 6)
@@ -266,286 +369,209 @@ class GUI(QtWidgets.QMainWindow):
         layout.addWidget(self.sensorNumber, 13, 5)
         layout.addWidget(self.sensorGainText, 13, 6)
         layout.addWidget(self.sensorGain, 13, 7)
+        layout.addWidget(self.barSourceText, 13, 8)
+        layout.addWidget(self.barSource, 13, 9)
         
         vbox.addLayout(layout)
         centralWidget.setLayout(vbox)
         self.setCentralWidget(centralWidget)  
         self.showMaximized()
         self.show()
-        # Serial monitor
-        self.monitor = SerialMonitor(COM, baudRate, self.delay)
-        self.monitor.bufferUpdated.connect(self.updateListening, QtCore.Qt.QueuedConnection)
+        # DSP worker (stage 2) and graphic update timer (stage 3)
+        self.pipeline = Pipeline(self.monitor, self.processor)
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.updatePlot)
     # Start working
     def start(self):
-        self.monitor.running = True
+        if self.metricsPort is not None:
+            self.metrics.serve(self.metricsPort)
         self.monitor.start()
+        self.pipeline.start()
+        self.timer.start(int(1000/self.fps))
     # Pause
     def stop(self):
         if self.monitor.running == False:
-            self.monitor.running = True
             self.monitor.start()
         else:
-            self.monitor.running = False
+            self.monitor.stop()
     # Refresh
     def refresh(self):
-        self.l = 0 #Current point
-        self.Time = [0]*self.dataWidth #Tine array
-        self.Data = np.zeros((9, self.dataWidth))
-        self.DataEnvelope = np.zeros((9, self.dataWidth))
-        self.Time = [0]*self.dataWidth
-        self.msg_end = 0        
-        self.loopNumber = 0;
-    # Update
-    def updateListening(self, msg):
-        # Update variables
-        self.setWindowTitle("MYOstack GUI v1.0.1 | ELEMYO " + 
-                            "    ( " + self.monitor.COM + " , " + str(self.monitor.baudRate) + " baud )")
-        s = self.passLowFreq.text()
-        if s.isdigit():
-            self.passLowFrec = float(s)
-        s = self.passHighFreq.text()
-        if s.isdigit():
-            self.passHighFrec = float(self.passHighFreq.text())
-        
-        s = self.envelopeSmoothingСoefficient.text()
-        try:
-            if (float(s) >= 0) and (float(s) <= 1):
-                self.MA_alpha= float(s)
-        except ValueError:
-            pass
-        
-        s = self.sensorNumber.text()
-        if s.isdigit():
-            self.selectedSensor = int(s)
-        
-        s = self.sensorGain.text()
-        try:
-            self.selectedGain = float(s)
-            if (self.selectedSensor in range(1, 10)) and (self.selectedGain in range(1, 12)):
-                self.gain[self.selectedSensor - 1] = self.selectedGain
-        except ValueError:
-            pass
-        
-        # Parsing data from serial buffer
-        msg = msg.decode(errors='ignore')
-        if len(msg) >= 2:
-            msg_end_n = msg.rfind("\r", 1)
-            msg_begin = self.msg_end
-            self.msg_end = msg[msg_end_n:len(msg)]
-            if(self.l > 2):
-                msg = msg_begin + msg[0:msg_end_n]
-            for st in msg.split('\r\n'):
-                s = st.split(';')
-                if (len(s) == 9) :
-                    if ( self.l == self.dataWidth):
-                        self.l = 0
-                    for i in range(9):
-                        if s[i].isdigit():
-                            self.Data[i][self.l] = int(s[i])/4.094*3.3/self.gain[i]
-                        else:
-                            self.Data[i][self.l] = 0;
-                        
-                    self.Time[self.l] = self.Time[self.l - 1] + self.dt
-                    self.f.write(str(round(self.Time[self.l], 3)) + " " + str(self.Data[0][self.l]) + " " + str(self.Data[1][self.l]) + " "
-                                 + str(self.Data[2][self.l]) + " " + str(self.Data[3][self.l]) + " "
-                                 + str(self.Data[4][self.l]) + " " + str(self.Data[5][self.l]) + " "
-                                 + str(self.Data[6][self.l]) + " " + str(self.Data[7][self.l]) + " "
-                                 + str(self.Data[8][self.l]) + "\r\n")
-                    
-                    self.l = self.l + 1
-                    self.loopNumber += 1
-                    self.ms_len += 1
-                
-        # Filtering
-        Data = np.zeros((9, self.dataWidth))
-        for i in range(9):
-            Data[i] = np.concatenate((self.Data[i][self.l: self.dataWidth], self.Data[i][0: self.l]))
-         
-        Time = self.Time[self.l + 1: self.dataWidth-1] + self.Time[0: self.l]
-        
-        self.monitor.delay = self.delay
-        if self.bandstop50.isChecked() == 1:
-            if self.fs > 110: 
-                for i in range(9): Data[i] = self.butter_bandstop_filter(Data[i], 48, 52, self.fs)
-            if self.fs > 210: 
-                for i in range(9): Data[i] = self.butter_bandstop_filter(Data[i], 98, 102, self.fs)
-            if self.fs > 310: 
-                for i in range(9): Data[i] = self.butter_bandstop_filter(Data[i], 148, 152, self.fs)
-            self.monitor.delay = self.delay + 0.03
-        if self.bandstop60.isChecked() == 1:
-            if self.fs > 130:
-                for i in range(9): Data[i] = self.butter_bandstop_filter(Data[i], 58, 62, self.fs)
-            if self.fs > 230:
-                for i in range(9): Data[i] = self.butter_bandstop_filter(Data[i], 118, 122, self.fs)
-            if self.fs > 330:
-                for i in range(9): Data[i] = self.butter_bandstop_filter(Data[i], 158, 162, self.fs)
-            self.monitor.delay = self.delay + 0.03
-        if ((self.bandpass.isChecked() == 1 or (self.signal.isChecked() == 1 and self.envelope.isChecked() == 1)) and self.passLowFrec < self.passHighFrec 
-            and self.passLowFrec > 0 and self.fs > 2*self.passHighFrec):
-            for i in range(9):
-                Data[i] = self.butter_bandpass_filter(Data[i], self.passLowFrec, self.passHighFrec, self.fs)
-            self.monitor.delay = self.delay + 0.04
-        
-        for i in range(9):
-            self.DataEnvelope[i][0: self.dataWidth - self.ms_len] = self.DataEnvelope[i][self.ms_len:self.dataWidth]
-        for j in range (self.dataWidth - self.ms_len, self.dataWidth):
-            for i in range(9):
-                self.DataEnvelope[i][j] = self.movingAverage(i, Data[i][j], self.MA_alpha)
-        self.ms_len = 0
-               
-        l = 0 # length of filter fluctuation tail
-        # Removing filter fluctuation tail from plot
-        if self.bandpass.isChecked() == 1 or self.bandstop50.isChecked() == 1 or self.bandstop60.isChecked() == 1 or self.envelope.isChecked() == 1:
-            l = int(1/self.dt)
-            if self.loopNumber < self.dataWidth:
-                for i in range(9): 
-                    if self.l >= l: 
-                        Data[i][0: self.dataWidth - self.l + l] = Data[i][self.dataWidth - self.l + l]
-                        self.DataEnvelope[i][0: self.dataWidth - self.l + l]=self.DataEnvelope[i][self.dataWidth - self.l + l]
-                    else:
-                        Data[i] = Data[i][self.dataWidth - self.l]
-                        self.DataEnvelope[i] = self.DataEnvelope[i][self.dataWidth - self.l]
-                l = 0
-        if self.loopNumber < self.dataWidth:
-            l = self.dataWidth - self.l
+        self.processor.refresh()
+    # Calibrate activation detection baseline (muscles relaxed)
+    def calibrate(self):
+        self.processor.calibrate()
+    # Open long history window of this session
+    def showHistory(self):
+        if self.pyramid is None:
+            return
+        if self.historyWindow is None:
+            self.historyWindow = HistoryWindow(self.pyramid.path)
+        self.historyWindow.show()
+        self.historyWindow.raise_()
+    # Show or hide metrics overlay
+    def toggleMetrics(self):
+        self.metricsOverlay.setVisible(not self.metricsOverlay.isVisible())
+        self.metricsUpdated = 0
+    # Update metrics overlay and textfile (once per second)
+    def updateMetrics(self):
+        now = time.perf_counter()
+        if now - self.metricsUpdated < 1:
+            return
+        self.metricsUpdated = now
+        if self.metricsOverlay.isVisible():
+            self.metricsOverlay.setText(self.metrics.overview())
+            self.metricsOverlay.adjustSize()
+            self.metricsOverlay.raise_()
+        if self.metricsTextfile is not None:
+            self.metrics.write_textfile(self.metricsTextfile)
+    # Update plot
+    def updatePlot(self):
+        t0 = time.perf_counter()
+        # Window title (settings are applied by widget signals, not here)
+        port = (self.monitor.COM, self.monitor.baudRate)
+        if self.plotChanges.changed('title', port):
+            self.setWindowTitle(self.title + "     ( %s , %s baud )" % port)
+        
+        # Latest processed data
+        snapshot = self.pipeline.snapshot()
+        if snapshot.version == self.lastVersion and self.monitor.running == False:
+            return
+        self.lastVersion = snapshot.version
+        Time = snapshot.time
+        Data = snapshot.filtered
+        DataEnvelope = snapshot.envelope
+        l = self.dataWidth - snapshot.filled # Start of filled part of the window
+        showSignal = self.settings.showSignal
+        showEnvelope = self.settings.showEnvelope
+        pixels = self.pw[0].width() # Horizontal size of plots in pixels
         
         # Shift the boundaries of the graph
-        timeCount = self.Time[self.l - 1] // self.timeWidth
-        for i in range(9):
-            self.pw[i].setXRange(self.timeWidth*timeCount, self.timeWidth*(timeCount + 1))            
-        
-        # Update plot
-        
-        # Plot raw and envelope data
-        if  self.signal.isChecked() == 1 and self.envelope.isChecked() == 1:
-            for i in range(9):
-                try:
-                    self.p[i].setData(y=Data[i][l: self.dataWidth - 2], x=Time[l: self.dataWidth - 1])
-                except ValueError:
-                    pass
-                try:
-                    self.pe[i].setData(y=self.DataEnvelope[i][l: self.dataWidth - 2], x=Time[l: self.dataWidth - 1])
-                except ValueError:
-                    pass
-            self.monitor.delay += 0.02
-        
-        # Plot envelope data            
-        if self.signal.isChecked() == 0 and self.envelope.isChecked() == 1:
-            for i in range(9):
-                try:
-                    self.pe[i].setData(y=self.DataEnvelope[i][l: self.dataWidth - 2], x=Time[l: self.dataWidth - 1])
-                except ValueError:
-                    pass
-                self.p[i].clear()
-                
-        # Plot raw data 
-        if self.signal.isChecked() == 1 and self.envelope.isChecked() == 0:
-            for i in range(9):
-                try:
-                    self.p[i].setData(y=Data[i][l: self.dataWidth - 2], x=Time[l: self.dataWidth - 1])
-                except ValueError:
-                    pass
-                self.pe[i].clear()
+        timeCount = Time[-1] // self.timeWidth
+        if self.plotChanges.changed('range', timeCount):
+            for i in range(self.channels):
+                self.pw[i].setXRange(self.timeWidth*timeCount, self.timeWidth*(timeCount + 1))            
+        
+        # Show or hide raw and envelope data
+        if self.plotChanges.changed('visible', (showSignal, showEnvelope)):
+            for i in range(self.channels):
+                self.p[i].setVisible(showSignal)
+                self.pe[i].setVisible(showEnvelope)
+        
+        # Update plot (min/max decimation: about 2 points per pixel), only when data changed
+        if self.plotChanges.changed('data', (snapshot.version, showSignal, showEnvelope, pixels)):
+            if showSignal:
+                x, y = minmax_decimate(Time[l:], Data[:, l:], pixels)
+                for i in range(self.channels):
+                    self.p[i].setData(y=y[i], x=x[i])
+            if showEnvelope:
+                x, y = minmax_decimate(Time[l:], DataEnvelope[:, l:], pixels)
+                for i in range(self.channels):
+                    self.pe[i].setData(y=y[i], x=x[i])
                         
         # Plot histogram
-        for i in range(9):
-            self.pb[i].setOpts(height=2*self.DataEnvelope[i][-2])
-        
-        # Plot FFT data
-        Y = abs(fft(Data[self.button_group.checkedId() - 1][-500: -2]))/498
-        X = 1/self.dt*np.linspace(0, 1, 498)
-        self.FFT = (1-0.85)*Y + 0.85*self.FFT
-        self.pFFT.setData(y=self.FFT[2: int(len(self.FFT)/2)], x=X[2: int(len(X)/2)]) 
-                    
-    # Values for butterworth bandpass filter
-    def butter_bandpass(self, lowcut, highcut, fs, order=4):
-        nyq = 0.5*fs
-        low = lowcut/nyq
-        high = highcut/nyq
-        b, a = butter(order, [low, high], btype='bandpass')
-        return b, a
-    # Butterworth bandpass filter
-    def butter_bandpass_filter(self, data, lowcut, highcut, fs, order=4):
-        b, a = self.butter_bandpass(lowcut, highcut, fs, order=order)
-        y = lfilter(b, a, data)
-        return y
-    # Values for butterworth bandstop filter
-    def butter_bandstop(self, lowcut, highcut, fs, order=2):
-        nyq = 0.5*fs
-        low = lowcut/nyq
-        high = highcut/nyq
-        b, a = butter(order, [low, high], btype='bandstop')
-        return b, a
-    # Butterworth bandstop filter
-    def butter_bandstop_filter(self, data, lowcut, highcut, fs, order=4):
-        b, a = self.butter_bandstop(lowcut, highcut, fs, order=order)
-        y = lfilter(b, a, data)
-        return y
-    def movingAverage(self, i, data, alpha):
-        wa = 2.0*self.fs*np.tan(3.1416*1/self.fs)
-        HPF = (2*self.fs*(data-self.X0[i]) - (wa-2*self.fs)*self.Y0[i])/(2*self.fs+wa)
-        self.Y0[i] = HPF
-        self.X0[i] = data
-        data = HPF
-        if data < 0:
-            data = -data
-        self.MA[i][0] = (1 - alpha)*data + alpha*self.MA[i][0];
-        self.MA[i][1] = (1 - alpha)*(self.MA[i][0]) + alpha*self.MA[i][1];
-        self.MA[i][2] = (1 - alpha)*(self.MA[i][1]) + alpha*self.MA[i][2];
-        return self.MA[i][2]*2
+        heights = 2*DataEnvelope[:, -1] if self.barFeature is None else snapshot.features[self.barFeature]
+        if self.plotChanges.changed('bars', heights):
+            for i in range(self.channels):
+                self.pb[i].setOpts(height=heights[i])
+        
+        # Plot FFT data (Welch PSD) and fatigue metrics of selected sensor
+        ch = self.processor.fftChannel
+        if self.plotChanges.changed('fft', (snapshot.version, ch)):
+            self.pFFT.setData(y=snapshot.fftY[2:], x=snapshot.fftX[2:])
+            self.pwFFT.setTitle("MNF: %.1f Hz   MDF: %.1f Hz" % (snapshot.meanFreq[ch], snapshot.medianFreq[ch]))
+        
+        # Stage timings
+        self.metrics.time('render', t0)
+        self.updateMetrics()
+        self.statusBar().showMessage("  ".join("%s: %.2f ms" % (k, v) for k, v in list(self.processor.timing.items())) + 
+                                     "  |  %.1f FPS" % self.fpsCounter.tick() +
+                                     "  |  %.2f Hz" % snapshot.fs +
+                                     "  |  protocol: %s" % (self.processor.parser.protocol or "-") +
+                                     "  |  active: %s" % self.activeSensors() +
+                                     ("  |  shared memory: %s" % self.sharedMemory if self.sharedMemory else "") +
+                                     "  |  dropped frames: " + str(self.processor.droppedFrames))
+    # Sensors with detected muscle activation, as text for the status bar
+    def activeSensors(self):
+        onsets = self.processor.onsets
+        if not onsets.calibrated:
+            return "calibrating"
+        return ", ".join(str(i + 1) for i in np.flatnonzero(onsets.active)) or "-"
     # Change gain
     def _on_radio_button_clicked(self, button):
-        if self.monitor.COM != '':
-            self.monitor.ser.write(bytearray([button.Value]))
+        self.monitor.write(bytearray([button.Value]))
+        self.settings.update(fftChannel=button.Value - 1)
+    
+    # Edited line of a numeric setting: invalid text is replaced by the current value
+    def _on_edit(self, edit, name, value):
+        try:
+            self.settings.update(**{name: float(edit.text())})
+        except ValueError:
+            edit.setText(str(value))
+    
+    # Edited sensor number or gain: gain of the selected sensor; invalid text is replaced by the
+    # last selected sensor and its current gain
+    def _on_gain_edited(self):
+        sensor = self.selectedSensor
+        try:
+            self.selectedSensor = int(self.sensorNumber.text())
+            self.selectedGain = float(self.sensorGain.text())
+            self.settings.set_gain(self.selectedSensor, self.selectedGain)
+        except ValueError:
+            self.selectedSensor = sensor
+            self.selectedGain = self.settings.gains[self.selectedSensor - 1]
+            self.sensorNumber.setText(str(self.selectedSensor))
+            self.sensorGain.setText("%g" % self.selectedGain)
+    
+    # Settings changed (also by a loaded profile): widgets show them
+    def _on_settings_changed(self, settings, changed):
+        for edit, name in ((self.passLowFreq, 'low'), (self.passHighFreq, 'high'),
+                           (self.envelopeSmoothingСoefficient, 'alpha')):
+            if name in changed and edit.text() != str(getattr(settings, name)):
+                edit.setText(str(getattr(settings, name)))
+        for box, name in ((self.bandstop50, 'notch50'), (self.bandstop60, 'notch60'), (self.bandpass, 'bandpass'),
+                          (self.signal, 'showSignal'), (self.envelope, 'showEnvelope')):
+            if name in changed and box.isChecked() != getattr(settings, name):
+                box.setChecked(getattr(settings, name))
+        if 'fftChannel' in changed:
+            self.button_group.button(settings.fftChannel + 1).setChecked(True)
+        if 'gains' in changed:
+            self.sensorGain.setText("%g" % settings.gains[self.selectedSensor - 1] if
+                                    1 <= self.selectedSensor <= self.channels else self.sensorGain.text())
+    
+    # Save settings profile
+    def saveProfile(self):
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save settings profile", "", "Profile (*.json)")
+        if path:
+            self.settings.save(path)
+    
+    # Load settings profile
+    def loadProfile(self):
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Load settings profile", "", "Profile (*.json)")
+        if path:
+            try:
+                self.settings.load(path)
+            except (OSError, ValueError, TypeError) as e:
+                self.statusBar().showMessage("Profile not loaded: %s" % e)
+    
+    # Histogram value selection
+    def _on_bar_source_changed(self, index):
+        self.barFeature = index - 1 if index > 0 else None
+        self.pbar.setLabel('left', self.barSource.currentText())
     # Exit event
     def closeEvent(self, event):
-        self.f.close()
-        self.monitor.ser.close()
+        self.pipeline.stop()
+        self.recorder.close()
+        if self.pyramid is not None:
+            self.pyramid.close()
+        self.monitor.close()
+        if self.publisher is not None:
+            self.publisher.close()
+        self.processor.close()
+        if self.metricsJson is not None:
+            self.metrics.dump_json(self.metricsJson)
+        self.metrics.close()
         event.accept()
 
-# Serial monitor class
-class SerialMonitor(QtCore.QThread):
-    bufferUpdated = QtCore.pyqtSignal(bytes)
-    # Custom constructor
-    def __init__(self, COM, baudRate, delay):
-        QtCore.QThread.__init__(self)
-        self.running = False
-        self.filter = False
-        self.COM = COM
-        self.baudRate = baudRate
-        self.baudRate = baudRate
-        self.checkPort = 1
-        self.delay = delay
-
-    # Listening port
-    def run(self):
-        while self.running is True:
-            while self.COM == '': 
-                ports = serial.tools.list_ports.comports(include_links=False)
-                for port in ports :
-                    self.COM = port.device
-                if self.COM != '':
-                    time.sleep(0.5)
-                    self.ser = serial.Serial(self.COM, self.baudRate)
-                    self.checkPort = 0
-            while self.checkPort:
-                ports = serial.tools.list_ports.comports(include_links=False)
-                for port in ports :
-                    if self.COM == port.device:
-                        time.sleep(0.5)
-                        self.ser = serial.Serial(self.COM, self.baudRate)
-                        self.checkPort = 0
-                   
-            # Waiting for data
-            while (self.ser.inWaiting() == 0):
-                pass
-            # Reading data
-            msg = self.ser.read( self.ser.inWaiting() )
-            if msg:
-                #Parsing data
-                self.bufferUpdated.emit(msg)
-                time.sleep(self.delay)
-                
 # Starting program       
 if __name__ == '__main__':
     app = QtCore.QCoreApplication.instance()
@@ -0,0 +1,49 @@
+# Acquisition and signal processing core for ELEMYO MYOstack sensors
+# Qt-free: everything in this package can be used without PyQt5/pyqtgraph
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+#
+# Names are imported from their modules on first use, so running a module of the package as a
+# script (python -m myostack.recorder ...) does not import it twice
+
+import importlib
+
+_MODULES = { # Module -> public names
+    'parser': ('FrameParser', 'ADC_TO_MV'),
+    'protocol': ('BinaryParser', 'ProtocolParser'),
+    'filters': ('FilterBank', 'design_sos'),
+    'envelope': ('EnvelopeDetector',),
+    'ringbuffer': ('RingBuffer',),
+    'recorder': ('Recorder', 'read_blocks', 'convert'),
+    'reader': ('SerialReader',),
+    'processor': ('Processor', 'Snapshot'),
+    'pipeline': ('Pipeline',),
+    'sources': ('Source', 'SimulatedSource', 'ReplaySource', 'open_source'),
+    'multidevice': ('MultiDevice', 'Aligner'),
+    'batch': ('BatchProcessor',),
+    'timeline': ('Timeline',),
+    'features': ('FeatureExtractor',),
+    'onset': ('OnsetDetector',),
+    'metrics': ('Metrics', 'Histogram'),
+    'publisher': ('Publisher',),
+    'client': ('Subscriber',),
+    'pyramid': ('PyramidWriter', 'Pyramid'),
+    'shared': ('SharedRingBuffer', 'SharedReader'),
+    'settings': ('Settings',),
+}
+_NAMES = {name: module for module, names in _MODULES.items() for name in names} # Public name -> module
+
+__all__ = list(_NAMES)
+
+# Public name, imported from its module on first use
+def __getattr__(name):
+    if name not in _NAMES:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module('.' + _NAMES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+# Public names for dir() and completion
+def __dir__():
+    return sorted(set(globals()) | set(_NAMES))
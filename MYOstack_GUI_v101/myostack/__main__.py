@@ -0,0 +1,4 @@
+# python -m myostack <command> ...
+from .cli import main
+
+main()
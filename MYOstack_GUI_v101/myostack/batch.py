@@ -0,0 +1,182 @@
+# Offline batch processing of recordings: the live filter/envelope chain (optionally zero-phase)
+# applied in chunks, files and channel groups spread over a process pool, summary statistics.
+# Memory stays bounded by the chunk size: data goes through memory-mapped binary files.
+#
+#   python -m myostack batch <recordings...> [--zerophase] [--workers 4] [--band 10 200] ...
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from .filters import FilterBank
+from .envelope import EnvelopeDetector
+from .recorder import (BIN_MAGIC, BIN_HEADER, BIN_HEADER_SIZE, BIN_DTYPE, FORMATS, file_format,
+                       open_bin, convert)
+
+# Running statistics of filtered data and envelope per channel
+class SummaryStats:
+    # Custom constructor
+    def __init__(self, channels):
+        self.count = 0
+        self.sum = np.zeros(channels)
+        self.sumsq = np.zeros(channels)
+        self.min = np.full(channels, np.inf)
+        self.max = np.full(channels, -np.inf)
+        self.envelopeSum = np.zeros(channels)
+        self.envelopeMax = np.zeros(channels)
+
+    # Add blocks (channels, N) of filtered data and envelope
+    def update(self, filtered, envelope):
+        if filtered.shape[1] == 0:
+            return
+        self.count += filtered.shape[1]
+        self.sum += filtered.sum(axis=1)
+        self.sumsq += (filtered**2).sum(axis=1)
+        self.min = np.minimum(self.min, filtered.min(axis=1))
+        self.max = np.maximum(self.max, filtered.max(axis=1))
+        self.envelopeSum += envelope.sum(axis=1)
+        self.envelopeMax = np.maximum(self.envelopeMax, envelope.max(axis=1))
+
+    # Per channel dictionaries: mean, std, rms, min, max, envelope mean and max
+    def summary(self):
+        n = max(self.count, 1)
+        mean = self.sum/n
+        rms = np.sqrt(self.sumsq/n)
+        std = np.sqrt(np.maximum(rms**2 - mean**2, 0))
+        return [{'mean': mean[i], 'std': std[i], 'rms': rms[i], 'min': self.min[i], 'max': self.max[i],
+                 'envelopeMean': self.envelopeSum[i]/n, 'envelopeMax': self.envelopeMax[i]}
+                for i in range(len(mean))]
+
+# Create binary file of frames (N, channels) filled by workers through memory mapping
+def create_bin(path, frames, channels, fs, t0):
+    with open(path, 'wb') as f:
+        f.write(BIN_HEADER.pack(BIN_MAGIC, channels, fs, t0).ljust(BIN_HEADER_SIZE, b'\0'))
+        f.truncate(BIN_HEADER_SIZE + frames*channels*np.dtype(BIN_DTYPE).itemsize)
+
+# Worker: filter and envelope of the channel group `columns` of a binary recording, written to columns
+# c (filtered) and channels + c (envelope) of output. Returns (columns, statistics).
+def process_channels(source, output, columns, notch50=False, notch60=False, band=None, alpha=0.95,
+                     zerophase=False, chunk=65536):
+    data, channels, fs, t0 = open_bin(source)
+    out = np.memmap(output, dtype=BIN_DTYPE, mode='r+', offset=BIN_HEADER_SIZE, shape=(len(data), 2*channels))
+    columns = [int(c) for c in columns]
+    envelopeColumns = [channels + c for c in columns]
+    n = len(data)
+    filters = FilterBank(len(columns))
+    filters.configure(fs, notch50, notch60, band)
+    # Forward pass
+    for start in range(0, n, chunk):
+        block = np.asarray(data[start: start + chunk, columns], dtype=float).T
+        out[start: start + chunk, columns] = filters.process(block).T
+    # Backward pass (zero-phase): stored result filtered again from the end
+    if zerophase and filters.active:
+        filters.reset()
+        for end in range(n, 0, -chunk):
+            start = max(0, end - chunk)
+            block = np.asarray(out[start: end, columns], dtype=float).T[:, ::-1]
+            out[start: end, columns] = filters.process(block)[:, ::-1].T
+    # Envelope and statistics
+    envelope = EnvelopeDetector(fs, len(columns), alpha)
+    stats = SummaryStats(len(columns))
+    for start in range(0, n, chunk):
+        filtered = np.asarray(out[start: start + chunk, columns], dtype=float).T
+        env = envelope.process(filtered)
+        out[start: start + chunk, envelopeColumns] = env.T
+        stats.update(filtered, env)
+    out.flush()
+    del out
+    return columns, stats.summary()
+
+# Processes files (and channel groups of every file) in a process pool. Outputs are
+# <name>_processed.<ext> with filtered data and envelope (2*channels columns, like the live
+# processed recording). Returns one summary per file: path, output, channels, fs, samples, stats.
+class BatchProcessor:
+    # Custom constructor
+    def __init__(self, notch50=False, notch60=False, band=None, alpha=0.95, zerophase=False,
+                 workers=None, chunk=65536, directory=None, fmt=None):
+        self.settings = dict(notch50=notch50, notch60=notch60, band=tuple(band) if band else None,
+                             alpha=alpha, zerophase=zerophase, chunk=chunk)
+        self.workers = workers or os.cpu_count() or 1
+        self.directory = directory # Output directory (None - next to input)
+        self.fmt = fmt # Output format (None - as input)
+
+    # Output path of a recording
+    def output_path(self, path):
+        fmt = self.fmt or file_format(path)
+        name = os.path.splitext(os.path.basename(path))[0] + '_processed' + FORMATS[fmt]
+        return os.path.join(self.directory or os.path.dirname(path), name)
+
+    # Process all files, returns summaries in the order of paths. Temporary binary files (converted
+    # inputs, unfinished text outputs) are removed also when processing fails.
+    def run(self, paths):
+        paths = list(paths)
+        groups = max(1, self.workers//max(len(paths), 1)) # Channel groups per file
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        jobs = []
+        temporary = []
+        try:
+            with ProcessPoolExecutor(self.workers) as pool:
+                # Text recordings are converted to binary once (streamed, in parallel), then memory-mapped
+                sources = {}
+                for path in paths:
+                    if file_format(path) == 'bin':
+                        sources[path] = (path, None)
+                    else:
+                        source = self.output_path(path) + '.tmp' + FORMATS['bin']
+                        temporary.append(source)
+                        sources[path] = (source, pool.submit(convert, path, source))
+                for path in paths:
+                    source, conversion = sources[path]
+                    if conversion is not None:
+                        conversion.result()
+                    output = self.output_path(path)
+                    data, channels, fs, t0 = open_bin(source)
+                    frames = len(data)
+                    del data
+                    target = output if file_format(output) == 'bin' else output + '.part' + FORMATS['bin']
+                    if target != output:
+                        temporary.append(target)
+                    create_bin(target, frames, 2*channels, fs, t0)
+                    futures = []
+                    if frames > 0:
+                        futures = [pool.submit(process_channels, source, target, columns, **self.settings)
+                                   for columns in np.array_split(np.arange(channels), min(groups, channels))]
+                    jobs.append((path, output, source, target, channels, fs, frames, futures))
+                summaries = []
+                finals = [] # Conversions of results to text
+                for path, output, source, target, channels, fs, frames, futures in jobs:
+                    stats = SummaryStats(channels).summary()
+                    for future in futures:
+                        columns, parts = future.result()
+                        for c, part in zip(columns, parts):
+                            stats[c] = part
+                    if target != output:
+                        finals.append((target, pool.submit(convert, target, output)))
+                    if source != path:
+                        os.remove(source)
+                    summaries.append({'path': path, 'output': output, 'channels': channels, 'fs': fs,
+                                      'samples': frames, 'stats': stats})
+                for target, conversion in finals:
+                    conversion.result()
+                    os.remove(target)
+        finally:
+            for path in temporary:
+                if os.path.exists(path):
+                    os.remove(path)
+        return summaries
+
+# Write summaries as CSV: one row per file and channel
+def write_summary(path, summaries):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        keys = ['mean', 'std', 'rms', 'min', 'max', 'envelopeMean', 'envelopeMax']
+        writer.writerow(['file', 'channel', 'samples', 'fs'] + keys)
+        for s in summaries:
+            for i, stats in enumerate(s['stats']):
+                writer.writerow([s['path'], i + 1, s['samples'], '%.3f' % s['fs']] +
+                                ['%.6g' % stats[k] for k in keys])
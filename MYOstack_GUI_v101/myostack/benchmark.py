@@ -0,0 +1,611 @@
+# Benchmarks for the MYOstack processing core
+# Run: python -m myostack.benchmark
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+from .parser import FrameParser, ADC_TO_MV
+from .envelope import EnvelopeDetector
+from .ringbuffer import RingBuffer
+from .processor import Processor
+from .filters import FilterBank
+from .spectrum import SpectrumAnalyzer
+from .pipeline import Pipeline
+from .sources import SimulatedSource, encode_ascii
+from .render import minmax_decimate
+from .multidevice import MultiDevice, Aligner
+from .batch import BatchProcessor
+from .recorder import open_writer, write_block
+from .publisher import Publisher
+from .client import Subscriber
+from .pyramid import PyramidWriter, Pyramid
+from .features import FeatureExtractor
+from .protocol import BinaryParser, ProtocolParser, encode_binary
+from .shared import SharedRingBuffer, SharedReader
+from .settings import Settings
+
+# Synthetic ASCII stream: n frames of 9 random 12-bit values
+def make_ascii(n, channels=9, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.integers(0, 4096, size=(n, channels))
+    return ''.join(';'.join(map(str, row)) + '\r\n' for row in values).encode()
+
+# Failed benchmark check
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+# Best time of several runs
+def best_of(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+# Per-line/per-field loop as it was in GUI.updateListening (reference)
+def legacy_parse(msg, gain):
+    out = []
+    msg = msg.decode(errors='ignore')
+    for st in msg.split('\r\n'):
+        s = st.split(';')
+        if len(s) == 9:
+            row = [0.0]*9
+            for i in range(9):
+                if s[i].isdigit():
+                    row[i] = int(s[i])/4.094*3.3/gain[i]
+            out.append(row)
+    return out
+
+# Parser benchmark: chunks of n frames (500 Hz device at 16 Hz tick -> ~32 frames)
+def bench_parser(sizes=(32, 500, 5000)):
+    gain = np.ones(9)
+    print("Parser (frames per chunk | legacy loop | FrameParser | speedup)")
+    for n in sizes:
+        chunk = make_ascii(n)
+        parser = FrameParser()
+        t_old = best_of(lambda: legacy_parse(chunk, gain))
+        t_new = best_of(lambda: parser.parse(chunk)[0]*ADC_TO_MV/gain[:, None])
+        print("  %6d | %9.3f ms | %9.3f ms | x%.1f" % (n, t_old*1e3, t_new*1e3, t_old/t_new))
+
+# Scalar envelope as it was in GUI.movingAverage (reference), state: (X0, Y0, MA)
+def legacy_envelope(block, fs, alpha, state):
+    X0, Y0, MA = state
+    out = np.zeros(block.shape)
+    for j in range(block.shape[1]):
+        for i in range(block.shape[0]):
+            data = block[i][j]
+            wa = 2.0*fs*np.tan(3.1416*1/fs)
+            HPF = (2*fs*(data-X0[i]) - (wa-2*fs)*Y0[i])/(2*fs+wa)
+            Y0[i] = HPF
+            X0[i] = data
+            data = abs(HPF)
+            MA[i][0] = (1 - alpha)*data + alpha*MA[i][0]
+            MA[i][1] = (1 - alpha)*(MA[i][0]) + alpha*MA[i][1]
+            MA[i][2] = (1 - alpha)*(MA[i][1]) + alpha*MA[i][2]
+            out[i][j] = MA[i][2]*2
+    return out
+
+# Envelope benchmark: one GUI tick (16 Hz) of new samples at several sampling rates, and the largest
+# difference from the legacy loop over consecutive ticks (state carried between them)
+def bench_envelope(rates=(500, 2000, 10000), tick=1/16, ticks=4):
+    rng = np.random.default_rng(0)
+    print("Envelope per tick (fs | samples | legacy loop | EnvelopeDetector | speedup | max difference)")
+    for fs in rates:
+        n = int(fs*tick)
+        blocks = rng.normal(1650, 100, size=(ticks, 9, n))
+        state = (np.zeros(9), np.zeros(9), np.zeros((9, 3)))
+        detector = EnvelopeDetector(fs)
+        error = max(np.max(np.abs(detector.process(block) - legacy_envelope(block, fs, 0.95, state)))
+                    for block in blocks)
+        t_old = best_of(lambda: legacy_envelope(blocks[0], fs, 0.95, state), repeat=3)
+        t_new = best_of(lambda: detector.process(blocks[0]))
+        print("  %6d | %5d | %9.3f ms | %9.3f ms | x%.0f | %.1e mV" %
+              (fs, n, t_old*1e3, t_new*1e3, t_old/t_new, error))
+
+# Filters per tick: old full-window lfilter (3 notches + bandpass, butter() every call) vs FilterBank
+def bench_filters(width=3100, n=32, fs=500.0):
+    from scipy.signal import butter, lfilter
+    rng = np.random.default_rng(0)
+    window = rng.normal(1650, 100, size=(9, width))
+    def legacy():
+        D = window.copy()
+        for low, high in ((48, 52), (98, 102), (148, 152)):
+            for i in range(9):
+                b, a = butter(4, [low/(fs/2), high/(fs/2)], btype='bandstop')
+                D[i] = lfilter(b, a, D[i])
+        for i in range(9):
+            b, a = butter(4, [10/(fs/2), 200/(fs/2)], btype='bandpass')
+            D[i] = lfilter(b, a, D[i])
+        return D
+    bank = FilterBank(9)
+    bank.configure(fs, True, False, (10, 200))
+    block = window[:, -n:]
+    t_old = best_of(legacy, repeat=3)
+    t_new = best_of(lambda: bank.process(block), repeat=20)
+    print("Filters per tick (%d new samples | legacy full window | FilterBank | speedup)" % n)
+    print("  %9.3f ms | %9.3f ms | x%.0f" % (t_old*1e3, t_new*1e3, t_old/t_new))
+
+# Spectrum per tick: old fft of 498 samples of one channel vs Welch PSD of all 9 channels
+def bench_spectrum(n=32, fs=500.0):
+    from scipy.fftpack import fft
+    rng = np.random.default_rng(0)
+    window = rng.normal(size=(9, 3100))
+    state = [0]
+    def legacy():
+        Y = abs(fft(window[0][-500: -2]))/498
+        X = fs*np.linspace(0, 1, 498)
+        state[0] = (1-0.85)*Y + 0.85*state[0]
+        return X
+    analyzer = SpectrumAnalyzer(9, fs)
+    block = window[:, -n:]
+    t_old = best_of(legacy, repeat=20)
+    t_new = best_of(lambda: analyzer.process(block), repeat=20)
+    print("Spectrum per tick (%d new samples | legacy 1 channel | SpectrumAnalyzer 9 channels + MNF/MDF)" % n)
+    print("  %9.3f ms | %9.3f ms" % (t_old*1e3, t_new*1e3))
+
+# Window update benchmark: per-tick copies of the old GUI vs RingBuffer.append + view
+def bench_ringbuffer(width=3100, n=32):
+    rng = np.random.default_rng(0)
+    block = rng.normal(size=(28, n))
+    Data = np.zeros((9, width))
+    DataEnvelope = np.zeros((9, width))
+    Time = [0]*width
+    l = 1000
+    def legacy():
+        D = np.zeros((9, width))
+        for i in range(9):
+            D[i] = np.concatenate((Data[i][l: width], Data[i][0: l]))
+        T = Time[l + 1: width-1] + Time[0: l]
+        for i in range(9):
+            DataEnvelope[i][0: width - n] = DataEnvelope[i][n: width]
+        return D, T
+    ring = RingBuffer(28, width)
+    def new():
+        ring.append(block)
+        return ring.view(slice(10, 19)), ring.view(0)
+    t_old = best_of(legacy, repeat=50)
+    t_new = best_of(new, repeat=50)
+    print("Window update (%d samples, %d new | legacy copies | RingBuffer | speedup)" % (width, n))
+    print("  %9.3f ms | %9.3f ms | x%.0f" % (t_old*1e3, t_new*1e3, t_old/t_new))
+
+# Headless processing throughput: serial bytes -> parse -> notch + bandpass -> envelope -> buffer
+def bench_processor(frames=50000, chunk=1000):
+    data = make_ascii(frames)
+    size = len(data)*chunk//frames
+    chunks = [data[i: i + size] for i in range(0, len(data), size)]
+    processor = Processor()
+    processor.configure(True, False, (10, 200))
+    t = time.perf_counter()
+    for msg in chunks:
+        processor.feed(msg)
+    t = time.perf_counter() - t
+    print("Processor (%d frames, %d per chunk): %.0f samples/s, %.1f MB/s" %
+          (processor.loopNumber, chunk, processor.loopNumber/t, len(data)/t/1e6))
+
+# Start-up time of the headless CLI (must not import Qt)
+def bench_startup():
+    t = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', "import sys, myostack.cli; print('PyQt5' in sys.modules)"],
+                         capture_output=True, text=True)
+    print("CLI start-up: %.0f ms, PyQt5 imported: %s" % ((time.perf_counter() - t)*1e3, out.stdout.strip()))
+
+# End-to-end: simulator -> reader queue -> DSP worker; samples/s at maximum speed and latency at real time
+def bench_endtoend(seconds=2.0):
+    for fs, speed in ((500.0, 1.0), (10000.0, 1.0), (500.0, 0)):
+        source = SimulatedSource(fs=fs, speed=speed)
+        processor = Processor(9, fs)
+        processor.configure(True, False, (10, min(200, fs/2 - 1)))
+        pipeline = Pipeline(source, processor)
+        source.start()
+        pipeline.start()
+        time.sleep(seconds)
+        source.stop()
+        pipeline.stop()
+        latency = processor.timing.get('latency', 0)
+        print("End-to-end fs %5.0f Hz, %s: %8.0f samples/s, latency %.2f ms, overruns %d, dropped frames %d" %
+              (fs, "real time" if speed else "max speed", processor.loopNumber/seconds, latency,
+               source.overruns, processor.droppedFrames))
+
+# Rendering path without Qt: snapshot copy taken by the renderer each frame
+def bench_render():
+    processor = Processor()
+    processor.feed(make_ascii(5000))
+    t = best_of(processor.snapshot, repeat=50)
+    print("Render snapshot (%d samples window): %.3f ms/frame" % (processor.dataWidth, t*1e3))
+    snapshot = processor.snapshot()
+    for pixels in (400, 1000):
+        t = best_of(lambda: minmax_decimate(snapshot.time, snapshot.filtered, pixels), repeat=20)
+        x, y = minmax_decimate(snapshot.time, snapshot.filtered, pixels)
+        print("  min/max decimation to %d px: %.3f ms, points per curve %d -> %d" %
+              (pixels, t*1e3, snapshot.filtered.shape[1], y.shape[1]))
+
+# Several simulated devices at maximum speed, one acquisition process each, merged and processed
+def bench_multidevice(seconds=3.0, counts=(1, 2, 4)):
+    for devices in counts:
+        source = MultiDevice(['sim']*devices, speed=0)
+        processor = Processor(source.channels)
+        processor.configure(True, False, (10, 200))
+        pipeline = Pipeline(source, processor)
+        source.start()
+        pipeline.start()
+        time.sleep(1.0) # Process start-up
+        start, n = time.perf_counter(), processor.loopNumber
+        time.sleep(seconds)
+        rate = (processor.loopNumber - n)/(time.perf_counter() - start)
+        source.close()
+        pipeline.stop()
+        print("Multi-device %d x 9 channels: %8.0f merged samples/s (%8.0f channel samples/s), latency %.2f ms" %
+              (devices, rate, rate*source.channels, processor.timing.get('latency', 0)))
+    # One of 3 devices stops for 10 s: output goes on at the full rate, its channels are filled in
+    aligner = Aligner(3, 9)
+    sent = [0]*3
+    output = 0
+    start = time.perf_counter()
+    for step in range(2500):
+        t = step*0.024
+        for device in range(3):
+            if device != 2 or not 20 < t < 30:
+                aligner.add(device, sent[device], t, np.zeros((9, 12), dtype=np.int32))
+                sent[device] += 12
+        output += aligner.take(t).shape[1]
+    print("Multi-device, 1 of 3 stopped for 10 s: %d of %d samples output, %d dropout, %d samples filled, "
+          "%.1f us per 12-sample block" % (output, 2500*12, aligner.dropouts.sum(), aligner.filled.sum(),
+                                          (time.perf_counter() - start)/2500*1e6))
+
+# Offline batch processing of binary recordings with 1 and all CPUs
+def bench_batch(files=4, seconds=600.0, fs=500.0):
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for k in range(files):
+            block = SimulatedSource(fs).frames_block(int(seconds*fs))*ADC_TO_MV
+            paths.append(os.path.join(directory, "session%d.myo" % k))
+            with open_writer(paths[-1], 'bin', 9, fs) as f:
+                write_block(f, 'bin', None, block)
+        for workers in sorted({1, os.cpu_count() or 1}):
+            for zerophase in (False, True):
+                processor = BatchProcessor(True, False, (10, 200), zerophase=zerophase, workers=workers)
+                start = time.perf_counter()
+                processor.run(paths)
+                t = time.perf_counter() - start
+                print("Batch %d x %.0f s recordings, %d workers%s: %.2f s (%.0fx real time)" %
+                      (files, seconds, workers, ", zero-phase" if zerophase else "", t, files*seconds/t))
+
+# Cost of instrumentation: one stage timing (average + histogram) and a full export
+def bench_metrics(n=100000):
+    metrics = Processor().metrics
+    t0 = time.perf_counter()
+    start = time.perf_counter()
+    for i in range(n):
+        metrics.time('stage', t0)
+    t = (time.perf_counter() - start)/n
+    print("Metrics: %.2f us per stage timing, Prometheus export %.3f ms, JSON %.3f ms" %
+          (t*1e6, best_of(metrics.prometheus)*1e3, best_of(metrics.to_dict)*1e3))
+
+# Network publishing on loopback: latency (publish -> decoded by client) at the device rate and
+# throughput at maximum rate, for TCP, UDP and a Unix socket
+def bench_publisher(seconds=2.0, channels=9, chunk=32):
+    urls = ['tcp://127.0.0.1:0', 'udp://127.0.0.1:%d' % (45000 + os.getpid() % 1000)]
+    if hasattr(socket, 'AF_UNIX'):
+        urls.append('unix://' + os.path.join(tempfile.gettempdir(), 'myostack_bench_%d.sock' % os.getpid()))
+    block = np.random.default_rng(0).standard_normal((channels, chunk))
+    for url in urls:
+        for rate in (500.0, None):
+            if url.startswith('udp'):
+                client = Subscriber(url, timeout=1.0)
+                publisher = Publisher(url)
+            else:
+                publisher = Publisher(url)
+                address = publisher.address
+                client = Subscriber(url if url.startswith('unix') else 'tcp://%s:%d' % address, timeout=1.0)
+                time.sleep(0.1) # Accepted
+            latencies = []
+            received = [0]
+            def consume():
+                for b in client:
+                    latencies.append(time.time() - b.timestamp)
+                    received[0] += b.data.shape[1]
+            thread = threading.Thread(target=consume, daemon=True)
+            thread.start()
+            start = time.perf_counter()
+            first = 0
+            while time.perf_counter() - start < seconds:
+                publisher.publish(first, 500.0, block, block, block)
+                first += chunk
+                if rate:
+                    time.sleep(chunk/rate)
+            sent = time.perf_counter() - start
+            time.sleep(0.2)
+            dropped = publisher.dropped
+            publisher.close()
+            client.close()
+            thread.join(2)
+            latencies = np.array(latencies)*1e3 if latencies else np.zeros(1)
+            print("Publish %-5s %s: %9.0f samples/s received (3 streams x %d channels), latency p50 %.3f ms, "
+                  "p99 %.3f ms, lost %d, dropped %d" %
+                  (url.partition(':')[0], "%4.0f Hz" % rate if rate else " max  ", received[0]/3/sent, channels,
+                   np.percentile(latencies, 50), np.percentile(latencies, 99), client.lost, dropped))
+
+# History pyramid: building cost and view queries (pan/zoom) over a long session
+def bench_pyramid(hours=2.0, fs=500.0, columns=18, chunk=32, pixels=1000):
+    n = int(hours*3600*fs)
+    block = np.random.default_rng(0).standard_normal((columns, chunk))
+    with tempfile.TemporaryDirectory() as directory:
+        writer = PyramidWriter(directory, columns, fs, blocking=True)
+        start = time.perf_counter()
+        for i in range(n//chunk):
+            writer.add(block)
+        t = time.perf_counter() - start
+        writer.close()
+        print("Pyramid build: %.2f us per %d-sample block, %.0fx real time (%.1f h, %d columns)" %
+              (t/(n//chunk)*1e6, chunk, n/fs/t, hours, columns))
+        pyramid = Pyramid(writer.path)
+        for seconds in (hours*3600, 600, 60, 5):
+            end = pyramid.duration
+            tq = best_of(lambda: pyramid.query(end/2, end/2 + seconds, pixels, [0, columns//2]), repeat=20)
+            tb, data = pyramid.query(end/2, end/2 + seconds, pixels, [0, columns//2])
+            print("  view of %7.0f s: %.3f ms, %d bins" % (seconds, tq*1e3, len(tb)))
+
+# Features of one window recomputed from scratch (reference)
+def naive_features(x, threshold=0.0):
+    d = np.diff(x, axis=1)
+    return np.stack((np.sqrt(np.mean(x**2, axis=1)), np.mean(np.abs(x), axis=1), np.sum(np.abs(d), axis=1),
+                     np.sum((x[:, 1:]*x[:, :-1] < 0) & (np.abs(d) >= threshold), axis=1),
+                     np.sum(d[:, :-1]*d[:, 1:] < 0, axis=1)))
+
+# Feature extraction: cost per hop with device-sized blocks, prefix sums against recomputing
+# every window, for growing window lengths
+def bench_features(channels=9, fs=500.0, chunk=12, seconds=60.0):
+    x = np.random.default_rng(0).standard_normal((channels, int(seconds*fs)))
+    for window in (0.1, 0.25, 1.0, 4.0):
+        extractor = FeatureExtractor(channels, fs, window)
+        w = extractor.windowSamples
+        start = time.perf_counter()
+        results = [extractor.process(x[:, i: i + chunk]) for i in range(0, x.shape[1], chunk)]
+        index = np.concatenate([r[0] for r in results])
+        t = (time.perf_counter() - start)/len(index)
+        start = time.perf_counter()
+        naive = np.array([naive_features(x[:, end - w + 1: end + 1]) for end in index])
+        tn = (time.perf_counter() - start)/len(index)
+        error = np.max(np.abs(np.concatenate([r[1] for r in results]) - naive))
+        print("Features %4.2f s window (%4d samples): %6.1f us per hop, recomputing %6.1f us (%.1fx), max difference %.1e" %
+              (window, w, t*1e6, tn*1e6, tn/t, error))
+
+# Wire protocols: decoding cost, exact loss reporting on a damaged stream, and sustainable sample
+# rates over an emulated 1 Mbaud link (simulator drops frames that do not fit into the link)
+def bench_protocol(frames=5000, channels=9, seconds=1.0, rates=(1000, 2000, 3000, 4000, 5000)):
+    rng = np.random.default_rng(0)
+    counts = rng.integers(0, 4096, (channels, frames))
+    streams = {'ascii': encode_ascii(counts), 'binary12': encode_binary(counts, 0, 12),
+               'binary16': encode_binary(counts, 0, 16)}
+    for name, msg in streams.items():
+        parser = FrameParser(channels) if name == 'ascii' else BinaryParser(channels, int(name[6:]))
+        t = best_of(lambda: parser.parse(msg))
+        print("Protocol %-8s: %5.1f bytes/frame, decode %6.2f ms per %d frames (%.1f M frames/s)" %
+              (name, len(msg)/frames, t*1e3, frames, frames/t/1e6))
+    # Damaged binary stream: 1% of frames removed, 0.5% with a flipped bit
+    size = len(streams['binary12'])//frames
+    rows = np.frombuffer(streams['binary12'], dtype=np.uint8).reshape(frames, size).copy()
+    removed = rng.random(frames) < 0.01
+    flipped = (rng.random(frames) < 0.005) & ~removed
+    rows[flipped, 4 + rng.integers(0, size - 6, np.count_nonzero(flipped))] ^= 0x08
+    parser = BinaryParser(channels, 12)
+    data, lost = parser.parse(rows[~removed].tobytes())
+    print("  damaged stream: %d frames removed + %d corrupted, reported lost %d, output %d frames" %
+          (np.count_nonzero(removed), np.count_nonzero(flipped), lost, data.shape[1]))
+    check(lost == np.count_nonzero(removed | flipped) and data.shape[1] == frames,
+          "damaged stream: lost frames not reported exactly")
+    # Stream split at random read boundaries (frames spanning several reads, protocol switches)
+    # (last part: binary16 with the removed frames missing, the gaps must be reported exactly)
+    tail = np.frombuffer(streams['binary16'], dtype=np.uint8).reshape(frames, -1)[3000:]
+    switching = (encode_ascii(counts[:, :1000]) + encode_binary(counts[:, 1000:2500], 0, 12) +
+                 encode_ascii(counts[:, 2500:3000]) + tail[~removed[3000:]].tobytes())
+    kept = np.flatnonzero(~removed[3000:])
+    gaps = kept[-1] - kept[0] + 1 - len(kept)
+    print("  switching stream: ascii, binary12, ascii, binary16 with %d frames removed" % gaps)
+    for name, msg, frames, lost in (('binary12', streams['binary12'], frames, 0), ('binary16', streams['binary16'], frames, 0),
+                                    ('switching', switching, 3000 + len(kept), gaps)):
+        for sizes in ((5,), (7,), (10,), (1, 3, 64, 700)):
+            parser = ProtocolParser(channels)
+            cuts = np.cumsum(rng.choice(sizes, len(msg)))
+            cuts = np.concatenate(([0], cuts[cuts < len(msg)], [len(msg)]))
+            received = sum(parser.parse(msg[i: j])[0].shape[1] for i, j in zip(cuts[:-1], cuts[1:]))
+            print("  %-9s in reads of %-14s: %d of %d frames, reported lost %d" %
+                  (name, '/'.join(map(str, sizes)) + ' bytes', received - parser.dropped, frames, parser.dropped))
+            check(received - parser.dropped == frames and parser.dropped == lost,
+                  "%s in reads of %s bytes: frames or gaps not reported exactly" % (name, sizes))
+    # Link: every gap between received binary frames is reported (ASCII has no frame counter), and
+    # binary12 sustains a rate at which ASCII already loses frames
+    print("  at 1 Mbaud (fs | protocol | received frames/s | lost on link | reported lost)")
+    sustained = {protocol: 0 for protocol in streams} # Highest rate without frames lost on the link
+    for fs in rates:
+        for protocol in streams:
+            source = SimulatedSource(fs, channels, speed=1.0, baudRate=1000000)
+            source.protocol = protocol
+            parser = ProtocolParser(channels)
+            received = 0
+            source.start()
+            start = time.perf_counter()
+            while time.perf_counter() - start < seconds:
+                source.dataReady.wait(0.05)
+                received += parser.parse(source.take())[0].shape[1]
+            source.close()
+            received += parser.parse(source.take())[0].shape[1]
+            elapsed = time.perf_counter() - start
+            print("  %5d Hz | %-8s | %8.0f | %6d | %6d" %
+                  (fs, parser.protocol, (received - parser.dropped)/elapsed, source.framesLost, parser.dropped))
+            visible = source.framesLost - source.framesLostBefore - source.framesLostAfter if protocol != 'ascii' else 0
+            check(parser.dropped == visible, "%s at %d Hz: %d frames lost on the link between received frames, "
+                  "%d reported" % (protocol, fs, visible, parser.dropped))
+            if source.framesLost == 0:
+                sustained[protocol] = max(sustained[protocol], fs)
+    check(sustained['binary12'] > sustained['ascii'], "binary12 does not sustain a higher rate than ascii")
+    print("  sustained at 1 Mbaud: %s" % ", ".join("%s %d Hz" % item for item in sustained.items()))
+
+# Activation detection: accuracy against bursts at known samples (12-sample device blocks) and
+# latency from serial bytes received to event callback with the simulator in real time
+def bench_onset(channels=9, fs=500.0, bursts=4, seconds=8.0):
+    rng = np.random.default_rng(0)
+    n = int((5 + 6*bursts)*fs)
+    x = 2047 + 5*rng.standard_normal((channels, n))
+    truth = []
+    for ch in range(channels):
+        for k in range(bursts):
+            start, length = int((5 + 6*k + 2*rng.random())*fs), int((1 + rng.random())*fs)
+            x[ch, start: start + length] += 300*rng.standard_normal(length)
+            truth.append((ch, start, start + length))
+    processor = Processor(channels, fs)
+    processor.configure(True, False, (20, 200))
+    events = []
+    processor.onsets.listeners.append(events.append)
+    counts = np.round(x).astype(np.int64)
+    for i in range(0, n, 12):
+        processor.feed_counts(counts[:, i: i + 12])
+    delays = {'onset': [], 'offset': []}
+    matched = 0
+    for ch, on, off in truth:
+        for kind, index in (('onset', on), ('offset', off)):
+            near = [e.index - index for e in events if e.channel == ch and e.kind == kind and abs(e.index - index) < fs]
+            if near:
+                delays[kind].append(near[0]*1e3/fs)
+                matched += 1
+    print("Onsets: %d bursts, %d events, %d matched; detection delay onset median %.1f ms (max %.1f), "
+          "offset median %.1f ms (max %.1f); detector %.2f us per block" %
+          (len(truth), len(events), matched, np.median(delays['onset']), np.max(delays['onset']),
+           np.median(delays['offset']), np.max(delays['offset']), processor.metrics.histograms['onsets'].mean*1e3))
+    source = SimulatedSource(fs, channels, burstRate=0.3)
+    processor = Processor(channels, fs)
+    processor.configure(True, False, (20, 200))
+    pipeline = Pipeline(source, processor)
+    source.start()
+    pipeline.start()
+    time.sleep(seconds)
+    source.stop()
+    pipeline.stop()
+    h = processor.metrics.histograms.get('event_latency')
+    if h is not None:
+        print("  real time: %d events, bytes received -> callback p50 %.2f ms, p99 %.2f ms, max %.2f ms" %
+              (h.count, h.quantile(0.5), h.quantile(0.99), h.max))
+
+# Reader process of bench_shared: reads new samples until stopped, reports (samples, lost, retries, reads)
+def shared_reader(name, stop, results):
+    reader = SharedReader(name)
+    samples = lost = reads = 0
+    while not stop.is_set():
+        if reader.wait(0.1, 0.0005):
+            first, data, n = reader.read_new()
+            samples += data.shape[1]
+            lost += max(n, 0)
+            reads += 1
+    results.put((samples, lost, reader.retries, reads))
+    reader.close()
+
+# Shared memory window: writer cost with 0..N reader processes attached (readers copy new samples)
+def bench_shared(seconds=2.0, readers=(0, 1, 2, 4), channels=9, chunk=12, width=3100):
+    import multiprocessing
+    block = np.random.default_rng(0).standard_normal((3*channels, chunk))
+    local = RingBuffer(3*channels, width)
+    for k in readers:
+        name = 'myostack_bench_%d' % os.getpid()
+        buffer = SharedRingBuffer(3*channels, width, name, channels)
+        stop = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=shared_reader, args=(name, stop, results)) for _ in range(k)]
+        for w in workers:
+            w.start()
+        time.sleep(0.5) # Readers attached
+        appends = []
+        locals_ = []
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            t0 = time.perf_counter()
+            buffer.append(block)
+            t1 = time.perf_counter()
+            local.append(block)
+            locals_.append(time.perf_counter() - t1)
+            appends.append(t1 - t0)
+            time.sleep(chunk/500.0/4) # 4x device rate
+        stop.set()
+        stats = [results.get() for _ in workers]
+        for w in workers:
+            w.join()
+        buffer.close()
+        appends = np.array(appends)*1e6
+        line = "Shared window, %d readers: append %.1f us median (local RingBuffer %.1f us), p99 %.1f us" % (
+            k, np.median(appends), np.median(locals_)*1e6, np.percentile(appends, 99))
+        if stats:
+            line += "; per reader %.0f samples/s, lost %d, retries %d" % (
+                np.mean([s[0] for s in stats])/seconds, sum(s[1] for s in stats), sum(s[2] for s in stats))
+        print(line)
+
+# Per-tick settings polling as it was in GUI.updatePlot (widget texts as strings) against the
+# event-driven settings, which cost nothing per tick and only work when a value is edited
+def bench_settings(ticks=2000, channels=9, fs=500.0):
+    processor = Processor(channels, fs)
+    processor.feed_counts(np.full((channels, int(6.2*fs)), 2047))
+    texts = {'low': '10', 'high': '200', 'alpha': '0.95', 'sensor': '1', 'gain': '1'}
+    def legacy_tick():
+        low = float(texts['low']) if texts['low'].isdigit() else 10
+        high = float(texts['high']) if texts['high'].isdigit() else 200
+        alpha = float(texts['alpha'])
+        sensor = int(texts['sensor'])
+        gain = float(texts['gain'])
+        if sensor in range(1, channels + 1) and gain in range(1, 12):
+            processor.gain[sensor - 1] = gain
+        band = (low, high) if 0 < low < high and processor.fs > 2*high else None
+        processor.configure(True, False, band, alpha)
+        processor.fftChannel = 0
+    t_legacy = best_of(lambda: [legacy_tick() for _ in range(ticks)])/ticks
+    settings = Settings(channels)
+    settings.update(notch50=True, bandpass=True)
+    settings.attach(processor)
+    # What a plot update still reads from the settings
+    def tick():
+        return settings.showSignal, settings.showEnvelope
+    t_tick = best_of(lambda: [tick() for _ in range(ticks)])/ticks
+    highs = iter(range(100, 100000))
+    t_edit = best_of(lambda: settings.update(high=next(highs) % 200 + 50))
+    t_gain = best_of(lambda: settings.set_gain(1, next(highs) % 11 + 1))
+    print("Settings: polling %.1f us per tick (%.1f ms/s at 16 FPS), event-driven %.2f us per tick; "
+          "one edited frequency %.2f ms (redesign and refilter), one edited gain %.1f us" %
+          (t_legacy*1e6, t_legacy*16e3, t_tick*1e6, t_edit*1e3, t_gain*1e6))
+
+BENCHMARKS = {
+    'parser': bench_parser,
+    'filters': bench_filters,
+    'envelope': bench_envelope,
+    'spectrum': bench_spectrum,
+    'ringbuffer': bench_ringbuffer,
+    'processor': bench_processor,
+    'startup': bench_startup,
+    'endtoend': bench_endtoend,
+    'render': bench_render,
+    'multidevice': bench_multidevice,
+    'batch': bench_batch,
+    'metrics': bench_metrics,
+    'publisher': bench_publisher,
+    'pyramid': bench_pyramid,
+    'features': bench_features,
+    'protocol': bench_protocol,
+    'onset': bench_onset,
+    'shared': bench_shared,
+    'settings': bench_settings,
+}
+
+def main(argv=None):
+    names = (argv if argv is not None else sys.argv[1:]) or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+# Headless command line interface (no PyQt5/pyqtgraph needed)
+#
+#   python -m myostack record [--port COM6|sim|recording.txt] [--duration 60] [--format bin] [--processed] ...
+#   python -m myostack process <recording.txt|.myo> [--output out.txt] [--notch50] [--band 10 200] ...
+#   python -m myostack batch <recordings...> [--zerophase] [--workers 4] [--summary summary.csv] ...
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import argparse
+import os
+import sys
+import time
+
+from .processor import Processor
+from .recorder import Recorder, FORMATS, read_blocks, file_info
+
+# Options shared by all commands: filters and envelope
+def add_processing_options(parser):
+    parser.add_argument('--notch50', action='store_true', help="notch filter 50 Hz and harmonics")
+    parser.add_argument('--notch60', action='store_true', help="notch filter 60 Hz and harmonics")
+    parser.add_argument('--band', nargs=2, type=float, metavar=('LOW', 'HIGH'), help="bandpass filter in Hz")
+    parser.add_argument('--alpha', type=float, help="envelope smoothing coefficient (0..1), default 0.95")
+    parser.add_argument('--profile', help="settings profile saved by the GUI (options given here override it)")
+
+# Command line parser
+def make_parser():
+    parser = argparse.ArgumentParser(prog='myostack', description="MYOstack headless acquisition and processing")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record = commands.add_parser('record', help="record from serial port")
+    record.add_argument('--port', default='', help="serial port (default - last port found), 'sim', a recording to replay, "
+                        "several comma-separated ports or 'all' (merged devices)")
+    record.add_argument('--speed', type=float, default=1.0, help="simulator/replay speed, 0 - as fast as possible")
+    record.add_argument('--baud', type=int, default=1000000, help="baud rate")
+    record.add_argument('--protocol', choices=['ascii', 'binary12', 'binary16'],
+                        help="protocol requested from the device (falls back to ASCII), default - device default")
+    record.add_argument('--fs', type=float, default=500.0, help="sampling frequency in Hz")
+    record.add_argument('--channels', type=int, default=9)
+    record.add_argument('--duration', type=float, help="seconds to record, default - until Ctrl+C")
+    record.add_argument('--format', choices=sorted(FORMATS), default='txt', help="data file format")
+    record.add_argument('--directory', default='.', help="output directory")
+    record.add_argument('--rotate', type=float, help="start a new file every ROTATE seconds")
+    record.add_argument('--processed', action='store_true', help="also write filtered data and envelope")
+    record.add_argument('--pyramid', action='store_true', help="also build a history pyramid (<date>.pyr)")
+    record.add_argument('--events', metavar='CSV', help="write muscle activation onsets/offsets to CSV")
+    record.add_argument('--shm', metavar='NAME', help="share the processed window in shared memory NAME "
+                        "(myostack.shared.SharedReader)")
+    record.add_argument('--features', action='store_true', help="also write RMS, MAV, WL, ZC, SSC of every sensor")
+    record.add_argument('--publish', metavar='URL',
+                        help="publish blocks to tcp://host:port, udp://host:port or unix:///path")
+    record.add_argument('--publish-kinds', nargs='+', choices=['raw', 'filtered', 'envelope', 'features'],
+                        default=['raw', 'filtered', 'envelope'], help="published streams")
+    record.add_argument('--metrics-port', type=int, help="serve metrics on http://127.0.0.1:PORT/metrics")
+    record.add_argument('--metrics-textfile', help="Prometheus textfile updated every second")
+    record.add_argument('--metrics-json', help="metrics dump written at the end")
+    add_processing_options(record)
+
+    process = commands.add_parser('process', help="filter a recorded file and compute its envelope")
+    process.add_argument('input', help="recording (.txt or .myo)")
+    process.add_argument('--output', help="output file, default - <input>_processed.<ext>")
+    process.add_argument('--format', choices=sorted(FORMATS), help="output format, default - as input")
+    add_processing_options(process)
+
+    batch = commands.add_parser('batch', help="process many recordings in parallel, with summary statistics")
+    batch.add_argument('inputs', nargs='+', help="recordings (.txt or .myo)")
+    batch.add_argument('--directory', help="output directory, default - next to inputs")
+    batch.add_argument('--format', choices=sorted(FORMATS), help="output format, default - as input")
+    batch.add_argument('--zerophase', action='store_true', help="zero-phase filtering (forward and backward)")
+    batch.add_argument('--workers', type=int, help="worker processes, default - number of CPUs")
+    batch.add_argument('--chunk', type=int, default=65536, help="samples per chunk (bounds memory use)")
+    batch.add_argument('--summary', help="summary statistics CSV file")
+    add_processing_options(batch)
+    return parser
+
+# Configure processor filters from options
+def configure(processor, args):
+    settings(args, processor.channels).attach(processor)
+
+# Settings of profile and options
+def settings(args, channels=9):
+    from .settings import Settings
+    result = Settings(channels)
+    if args.profile:
+        result.load(args.profile)
+    values = {name: True for name in ('notch50', 'notch60') if getattr(args, name)}
+    if args.band:
+        values.update(bandpass=True, low=args.band[0], high=args.band[1])
+    if args.alpha is not None:
+        values['alpha'] = args.alpha
+    result.update(**values)
+    return result
+
+# Print summary line
+def report(processor, seconds):
+    rate = processor.loopNumber/seconds if seconds > 0 else 0
+    print("%d samples in %.2f s (%.0f samples/s), dropped frames: %d" %
+          (processor.loopNumber, seconds, rate, processor.droppedFrames))
+
+# Record command
+def record(args):
+    from .sources import open_source
+    from .pipeline import Pipeline
+    reader = open_source(args.port, args.baud, args.speed, args.protocol)
+    channels = getattr(reader, 'channels', args.channels) # Merged devices: channels of all devices
+    recorder = Recorder(args.format, channels, args.fs, args.directory, rotateSeconds=args.rotate)
+    processed = None
+    if args.processed:
+        processed = Recorder(args.format, 2*channels, args.fs, args.directory,
+                             rotateSeconds=args.rotate, suffix='_processed')
+    featureRecorder = None
+    if args.features:
+        from .features import FEATURES, FeatureExtractor
+        rate = args.fs/FeatureExtractor(channels, args.fs).hopSamples
+        featureRecorder = Recorder(args.format, len(FEATURES)*channels, rate, args.directory,
+                                   rotateSeconds=args.rotate, suffix='_features')
+    publisher = None
+    if args.publish:
+        from .publisher import Publisher
+        publisher = Publisher(args.publish, args.publish_kinds)
+        print("Publishing to", args.publish)
+    pyramid = None
+    if args.pyramid:
+        from .pyramid import PyramidWriter
+        pyramid = PyramidWriter(args.directory, 2*channels, args.fs)
+    processor = Processor(channels, args.fs, recorder=recorder, processedRecorder=processed, publisher=publisher,
+                          pyramid=pyramid, featureRecorder=featureRecorder, shared=args.shm)
+    if args.shm:
+        print("Shared memory:", processor.buffer.name)
+    configure(processor, args)
+    events = None
+    if args.events:
+        events = open(args.events, 'w')
+        events.write("kind,sensor,sample,time_s,level_mV,latency_ms\n")
+        processor.onsets.listeners.append(lambda e: events.write("%s,%d,%d,%.4f,%.3f,%.3f\n" % (
+            e.kind, e.channel + 1, e.index, e.time, e.level, e.latency if e.latency is not None else float('nan'))))
+    print("Waiting for data source...")
+    while not reader.open():
+        time.sleep(0.5)
+    print("Recording from %s, Ctrl+C to stop" % reader.COM)
+    pipeline = Pipeline(reader, processor)
+    metrics = processor.metrics
+    if args.metrics_port is not None:
+        print("Metrics: http://127.0.0.1:%d/metrics" % metrics.serve(args.metrics_port))
+    start = time.perf_counter()
+    written = start
+    reader.start()
+    pipeline.start()
+    try:
+        while ((args.duration is None or time.perf_counter() - start < args.duration)
+               and not (reader.finished and reader.depth == 0)):
+            time.sleep(0.1)
+            if args.metrics_textfile and time.perf_counter() - written >= 1:
+                metrics.write_textfile(args.metrics_textfile)
+                written = time.perf_counter()
+    except KeyboardInterrupt:
+        pass
+    reader.close()
+    pipeline.stop()
+    metrics.close()
+    processor.close()
+    if publisher is not None:
+        publisher.close()
+    if args.metrics_textfile:
+        metrics.write_textfile(args.metrics_textfile)
+    if args.metrics_json:
+        metrics.dump_json(args.metrics_json)
+    for r in (recorder, processed, featureRecorder):
+        if r is not None:
+            r.close()
+            print("Written:", ", ".join(r.files))
+    if pyramid is not None:
+        pyramid.close()
+        print("History:", pyramid.path)
+    if events is not None:
+        events.close()
+        print("Activation events: %d in %s" % (processor.onsets.eventCount, args.events))
+    report(processor, time.perf_counter() - start)
+
+# Process command
+def process(args):
+    channels, fs = file_info(args.input)
+    fmt = args.format or ('bin' if args.input.endswith(FORMATS['bin']) else 'txt')
+    output = args.output or os.path.splitext(args.input)[0] + '_processed' + FORMATS[fmt]
+    recorder = Recorder(fmt, 2*channels, fs, path=output, blocking=True)
+    processor = Processor(channels, fs, processedRecorder=recorder)
+    configure(processor, args)
+    start = time.perf_counter()
+    for t, block in read_blocks(args.input):
+        processor.feed_block(block)
+    recorder.close()
+    print("Written:", ", ".join(recorder.files))
+    report(processor, time.perf_counter() - start)
+
+# Batch command
+def batch(args):
+    from .batch import BatchProcessor, write_summary
+    s = settings(args)
+    processor = BatchProcessor(s.notch50, s.notch60, s.band, s.alpha, args.zerophase,
+                               args.workers, args.chunk, args.directory, args.format)
+    start = time.perf_counter()
+    summaries = processor.run(args.inputs)
+    seconds = time.perf_counter() - start
+    for s in summaries:
+        rms = ", ".join("%.1f" % c['rms'] for c in s['stats'])
+        print("%s: %d samples, RMS [%s]" % (s['output'], s['samples'], rms))
+    if args.summary:
+        write_summary(args.summary, summaries)
+        print("Summary:", args.summary)
+    samples = sum(s['samples'] for s in summaries)
+    print("%d files, %d samples in %.2f s (%.0f samples/s)" %
+          (len(summaries), samples, seconds, samples/seconds if seconds > 0 else 0))
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    {'record': record, 'process': process, 'batch': batch}[args.command](args)
+
+if __name__ == '__main__':
+    sys.exit(main())
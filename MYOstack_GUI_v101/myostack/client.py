@@ -0,0 +1,120 @@
+# Client of the MYOstack network stream (see publisher.py): decodes blocks into numpy arrays without copying
+#
+#   from myostack.client import Subscriber
+#   for block in Subscriber('tcp://127.0.0.1:5555'):
+#       print(block.kind, block.first, block.data.shape)
+#
+# Needs only numpy. Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import socket
+import struct
+from collections import namedtuple
+import numpy as np
+
+# Message: header + float32 samples (channels, n) in C order.
+# Header: magic, kind, reserved, channels, sequence (per kind), first sample index, publish time (time.time()), fs, n
+MAGIC = b'MYO1'
+HEADER = struct.Struct('<4sBBHIQddI')
+DTYPE = np.dtype('<f4')
+KINDS = ('raw', 'filtered', 'envelope', 'features') # Kind code -> name
+FEATURES = ('rms', 'mav', 'wl', 'zc', 'ssc') # Rows of a features block
+UDP_PAYLOAD = 1400 # Maximal datagram size (fits a typical MTU)
+
+# Decoded block: data is a read-only view into the received buffer, shape (channels, n)
+Block = namedtuple('Block', 'kind sequence first timestamp fs data')
+
+# Feature vectors of a 'features' block as (features, channels, n) view; first is the sample index
+# of the first window end, fs the rate of feature vectors
+def feature_view(block):
+    return block.data.reshape(len(FEATURES), -1, block.data.shape[1])
+
+# Encode a block: header and samples as one bytes object
+def encode(kind, sequence, first, timestamp, fs, data):
+    data = np.ascontiguousarray(data, dtype=DTYPE)
+    return HEADER.pack(MAGIC, kind, 0, data.shape[0], sequence & 0xFFFFFFFF, first, timestamp, fs,
+                       data.shape[1]) + data.tobytes()
+
+# Decode header of a message, returns (kind, sequence, first, timestamp, fs, channels, n)
+def decode_header(buffer):
+    magic, kind, _, channels, sequence, first, timestamp, fs, n = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError("Not a MYOstack stream message")
+    return kind, sequence, first, timestamp, fs, channels, n
+
+# Block from a buffer holding a whole message (no copy)
+def decode(buffer):
+    kind, sequence, first, timestamp, fs, channels, n = decode_header(buffer)
+    data = np.frombuffer(buffer, DTYPE, channels*n, HEADER.size).reshape(channels, n)
+    return Block(KINDS[kind], sequence, first, timestamp, fs, data)
+
+# 'tcp://host:port', 'udp://host:port' or 'unix:///path' -> (scheme, address)
+def parse_address(url):
+    scheme, _, rest = url.partition('://')
+    if scheme == 'unix':
+        return scheme, rest
+    if scheme not in ('tcp', 'udp'):
+        raise ValueError("Address must be tcp://host:port, udp://host:port or unix:///path: " + url)
+    host, _, port = rest.rpartition(':')
+    return scheme, (host or '127.0.0.1', int(port))
+
+# Receives blocks from a publisher; iterate over it or call receive(). Sequence numbers of every
+# kind are checked, lost messages (slow client, UDP loss) are counted in `lost`.
+class Subscriber:
+    # Custom constructor
+    def __init__(self, url, timeout=None):
+        self.scheme, self.address = parse_address(url)
+        if self.scheme == 'udp':
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.bind(self.address)
+        else:
+            family = socket.AF_UNIX if self.scheme == 'unix' else socket.AF_INET
+            self.sock = socket.socket(family, socket.SOCK_STREAM)
+            self.sock.connect(self.address)
+            if family == socket.AF_INET:
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(timeout)
+        self.next = {} # Expected sequence number per kind
+        self.received = 0 # Messages received
+        self.lost = 0 # Messages missing in sequence
+
+    # Read exactly len(view) bytes from the stream
+    def _read_into(self, view):
+        got = 0
+        while got < len(view):
+            n = self.sock.recv_into(view[got:])
+            if n == 0:
+                raise ConnectionError("Publisher closed the connection")
+            got += n
+
+    # Next block (blocks until it arrives)
+    def receive(self):
+        if self.scheme == 'udp':
+            buffer = bytearray(UDP_PAYLOAD)
+            n = self.sock.recv_into(buffer)
+            block = decode(memoryview(buffer)[:n])
+        else:
+            header = bytearray(HEADER.size)
+            self._read_into(memoryview(header))
+            channels, n = decode_header(header)[5:]
+            buffer = bytearray(HEADER.size + channels*n*DTYPE.itemsize)
+            buffer[:HEADER.size] = header
+            self._read_into(memoryview(buffer)[HEADER.size:])
+            block = decode(buffer)
+        self.received += 1
+        expected = self.next.get(block.kind)
+        if expected is not None and block.sequence != expected:
+            self.lost += (block.sequence - expected) & 0xFFFFFFFF
+        self.next[block.kind] = (block.sequence + 1) & 0xFFFFFFFF
+        return block
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.receive()
+            except (ConnectionError, OSError):
+                return
+
+    # Close connection
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,47 @@
+# Multi-channel envelope detector: high-pass -> rectify -> 3-stage exponential moving average
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import numpy as np
+from scipy.signal import lfilter
+
+# Envelope for a block (channels, N), state is carried between calls
+class EnvelopeDetector:
+    # Custom constructor
+    def __init__(self, fs, channels=9, alpha=0.95, cutoff=1.0):
+        self.channels = channels
+        self.cutoff = cutoff # High-pass cutoff frequency in Hz
+        self.alpha = alpha # Smoothing coefficient, 0..1
+        self.set_fs(fs)
+        self.reset()
+
+    # Sampling frequency, rebuilds high-pass coefficients
+    def set_fs(self, fs):
+        self.fs = fs
+        wa = 2.0*fs*np.tan(np.pi*self.cutoff/fs) # Pre-warped cutoff (bilinear transform)
+        self.hp_b = np.array([2*fs, -2*fs])/(2*fs + wa)
+        self.hp_a = np.array([1.0, (wa - 2*fs)/(2*fs + wa)])
+
+    # Clear state
+    def reset(self):
+        self.X0 = np.zeros(self.channels) # Last high-pass input
+        self.Y0 = np.zeros(self.channels) # Last high-pass output
+        self.MA = np.zeros((self.channels, 3)) # Last output of each moving average stage
+
+    # Envelope of block (channels, N)
+    def process(self, block):
+        block = np.asarray(block, dtype=float)
+        if block.shape[-1] == 0:
+            return np.zeros_like(block)
+        zi = self.hp_b[1]*self.X0 - self.hp_a[1]*self.Y0
+        y, _ = lfilter(self.hp_b, self.hp_a, block, axis=-1, zi=zi[:, None])
+        self.X0 = block[:, -1].copy()
+        self.Y0 = y[:, -1].copy()
+        y = np.abs(y)
+        b = [1 - self.alpha]
+        a = [1, -self.alpha]
+        for k in range(3):
+            y, _ = lfilter(b, a, y, axis=-1, zi=self.alpha*self.MA[:, k][:, None])
+            self.MA[:, k] = y[:, -1]
+        return 2*y
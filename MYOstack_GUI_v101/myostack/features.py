@@ -0,0 +1,116 @@
+# Incremental EMG time-domain features over sliding windows: RMS, MAV, WL, ZC, SSC
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import numpy as np
+
+FEATURES = ('rms', 'mav', 'wl', 'zc', 'ssc') # Row order of feature arrays
+RMS, MAV, WL, ZC, SSC = range(len(FEATURES))
+
+# Features of every channel over the last `window` seconds, computed every `hop` seconds.
+# Every sample contributes x^2, |x|, |dx|, a zero crossing and a slope sign change. Prefix sums of
+# the contributions are kept in a ring (one cumsum per block), so a window sum is one difference
+# of two prefixes, taken only at hop ends: a block costs O(new samples) whatever the window length.
+# WL and ZC of a window use its w - 1 sample differences, SSC its w - 2 inner samples.
+# ZC and SSC ignore changes smaller than `threshold` (noise dead zone, mV).
+class FeatureExtractor:
+    # Custom constructor
+    def __init__(self, channels=9, fs=500.0, window=0.2, hop=0.025, threshold=0.0, maxBlock=512):
+        self.channels = channels
+        self.window = window # Window length in s
+        self.hop = hop # Time between feature vectors in s
+        self.threshold = threshold
+        self.maxBlock = maxBlock # Longest block processed at once (longer ones are split)
+        self.fs = fs
+        self.windowSamples = max(1, int(round(window*fs)))
+        self.hopSamples = max(1, int(round(hop*fs)))
+        self.reset()
+
+    # Sampling frequency. Windows keep their length in samples (and their state) while it stays within
+    # one sample or 2% of window and hop at the new fs; otherwise they are resized and restarted.
+    def set_fs(self, fs):
+        self.fs = fs
+        if all(abs(samples - seconds*fs) <= max(1, 0.02*seconds*fs)
+               for samples, seconds in ((self.windowSamples, self.window), (self.hopSamples, self.hop))):
+            return
+        self.windowSamples = max(1, int(round(self.window*fs)))
+        self.hopSamples = max(1, int(round(self.hop*fs)))
+        self.reset()
+
+    # Clear state
+    def reset(self):
+        w = self.windowSamples
+        self.size = w + self.maxBlock + 1 # Ring length: a window and a block, and the prefix before them
+        self.prefix = np.zeros((len(FEATURES), self.channels, self.size)) # Sums of contributions of samples 0..i at i % size
+        # Flat prefix index of every (feature, channel) and contributions summed per window
+        self.offsets = np.arange(len(FEATURES)*self.channels)*self.size
+        self.lengths = np.repeat(np.maximum([w, w, w - 1, w - 1, w - 2], 0), self.channels)
+        self.scale = np.repeat([1/w, 1/w, 1, 1, 1], self.channels) # Sums to means (RMS, MAV)
+        self.last = None # Last sample and difference (2 channels)
+        self.sinceHop = 0 # Samples since last feature vector
+        self.count = 0 # Samples processed
+        self.values = np.zeros((len(FEATURES), self.channels)) # Latest feature vector
+        self.index = -1 # Sample index (end of window) of latest feature vector
+
+    # Per-sample contributions (features, channels, N) of block (channels, N)
+    def _contributions(self, block):
+        n, ch = block.shape[1], self.channels
+        # Samples over differences (2 channels, N + 1), led by the last ones of the previous block
+        z = np.empty((2*ch, n + 1))
+        z[:, 0] = self.last if self.last is not None else np.concatenate((block[:, 0], np.zeros(ch)))
+        z[:ch, 1:] = block
+        np.subtract(block, z[:ch, :-1], out=z[ch:, 1:])
+        self.last = z[:, -1]
+        c = np.empty((len(FEATURES), ch, n))
+        np.multiply(block, block, out=c[RMS])
+        np.abs(z[:, 1:], out=c[MAV:WL + 1].reshape(2*ch, n))
+        # Sign changes of samples (zero crossing) and of differences (slope sign change at the previous
+        # sample, it needs this one: counted one sample late)
+        product = z[:, 1:]*z[:, :-1]
+        if self.threshold > 0:
+            product[:ch][c[WL] < self.threshold] = 0
+            product[ch:][product[ch:] > -self.threshold**2] = 0
+        np.less(product, 0, out=c[ZC:].reshape(2*ch, n))
+        return c
+
+    # Add block (channels, N); returns (index, features): sample indices (H,) of window ends and
+    # feature vectors (H, features, channels) of every hop completed in the block
+    def process(self, block):
+        n = block.shape[1]
+        if n > self.maxBlock:
+            parts = [self.process(block[:, i: i + self.maxBlock]) for i in range(0, n, self.maxBlock)]
+            return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+        if n == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, len(FEATURES), self.channels))
+        c = self._contributions(block)
+        start = self.count % self.size
+        if start + n > self.size:
+            # Ring wraps: continue from the last prefix rebased to zero (keeps sums small, counts exact)
+            self.prefix -= self.prefix[:, :, start - 1, None].copy()
+            c.cumsum(axis=2, out=c)
+            head = self.size - start
+            self.prefix[:, :, start:] = c[:, :, :head]
+            self.prefix[:, :, :n - head] = c[:, :, head:]
+        else:
+            c[:, :, 0] += self.prefix[:, :, start - 1]
+            c.cumsum(axis=2, out=self.prefix[:, :, start: start + n])
+        # Window sums only at hop ends (1-based offsets in block) of full windows
+        first = self.hopSamples - self.sinceHop
+        if self.count + first < self.windowSamples:
+            first += -(-(self.windowSamples - self.count - first)//self.hopSamples)*self.hopSamples
+        end = self.count + first - 1
+        self.sinceHop = (self.sinceHop + n) % self.hopSamples
+        self.count += n
+        if end >= self.count:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, len(FEATURES), self.channels))
+        index = np.arange(end, self.count, self.hopSamples)
+        # Prefixes never decrease (non-negative contributions), so sums of squares are not negative
+        ends = index[:, None]
+        sums = self.prefix.take(self.offsets + ends % self.size) - self.prefix.take(self.offsets + (ends - self.lengths) % self.size)
+        sums *= self.scale
+        features = sums.reshape(-1, len(FEATURES), self.channels)
+        np.sqrt(features[:, RMS], out=features[:, RMS])
+        self.values = features[-1]
+        self.index = index[-1]
+        return index, features
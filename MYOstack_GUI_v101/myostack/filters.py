@@ -0,0 +1,69 @@
+# Streaming Butterworth filter bank (notch + bandpass) with persistent per-channel state
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+from functools import lru_cache
+import numpy as np
+from scipy.signal import butter, sosfilt, sosfilt_zi
+
+# Notch bands (low, high, minimal sampling frequency) for the mains frequency and its harmonics
+NOTCH_50 = ((48, 52, 110), (98, 102, 210), (148, 152, 310))
+NOTCH_60 = ((58, 62, 130), (118, 122, 230), (158, 162, 330))
+
+# Second-order sections of a butterworth filter, cached on (type, band, fs, order)
+@lru_cache(maxsize=64)
+def design_sos(btype, lowcut, highcut, fs, order=4):
+    nyq = 0.5*fs
+    sos = butter(order, [lowcut/nyq, highcut/nyq], btype=btype, output='sos')
+    sos.setflags(write=False)
+    return sos
+
+# Filter chain for all channels, filters only newly arrived samples
+class FilterBank:
+    # Custom constructor
+    def __init__(self, channels=9):
+        self.channels = channels
+        self.key = () # Current chain: ((type, low, high, fs, order), ...)
+        self.sos = np.zeros((0, 6))
+        self.zi = None # Filter state, shape (sections, channels, 2)
+
+    # Set filter chain, returns True if it changed (coefficients are rebuilt only then)
+    def configure(self, fs, notch50=False, notch60=False, band=None, order=4):
+        key = []
+        for enabled, bands in ((notch50, NOTCH_50), (notch60, NOTCH_60)):
+            if enabled:
+                key += [('bandstop', low, high, fs, order) for low, high, fs_min in bands if fs > fs_min]
+        if band is not None and band[1] < fs/2: # Band must stay below Nyquist (fs may be measured)
+            key.append(('bandpass', band[0], band[1], fs, order))
+        key = tuple(key)
+        if key == self.key:
+            return False
+        self.key = key
+        self.sos = np.vstack([design_sos(*k) for k in key]) if key else np.zeros((0, 6))
+        self.zi = None
+        return True
+
+    # True if chain has at least one filter
+    @property
+    def active(self):
+        return len(self.key) > 0
+
+    # Forget filter state (next block starts from steady state of its first sample)
+    def reset(self):
+        self.zi = None
+
+    # Filter block (channels, N) continuing from the previous call
+    def process(self, block):
+        block = np.asarray(block, dtype=float)
+        if not self.active or block.shape[-1] == 0:
+            return block
+        if self.zi is None:
+            self.zi = sosfilt_zi(self.sos)[:, None, :]*block[:, 0][None, :, None]
+        y, self.zi = sosfilt(self.sos, block, axis=-1, zi=self.zi)
+        return y
+
+    # Filter a whole window from scratch (used after the chain changes), state continues after it
+    def refilter(self, data):
+        self.reset()
+        return self.process(data)
@@ -0,0 +1,196 @@
+# Performance instrumentation: per-stage latency histograms, counters and gauges.
+# Export: status text, Prometheus text format (textfile or local HTTP endpoint), JSON.
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Histogram bucket upper bounds in ms (last bucket - everything above)
+BOUNDS_MS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Latency histogram with fixed log-spaced buckets: observe() is a bisect and two additions
+class Histogram:
+    # Custom constructor
+    def __init__(self, bounds=BOUNDS_MS):
+        self.bounds = list(bounds)
+        self.counts = [0]*(len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0 # ms
+        self.max = 0.0 # ms
+
+    # Add a value in ms
+    def observe(self, ms):
+        self.counts[bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.sum += ms
+        if ms > self.max:
+            self.max = ms
+
+    # Estimated q-quantile in ms (linear inside the bucket)
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = q*self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                low = self.bounds[i - 1] if i > 0 else 0.0
+                high = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(low + (high - low)*(rank - seen)/c, self.max)
+            seen += c
+        return self.max
+
+    # Mean in ms
+    @property
+    def mean(self):
+        return self.sum/self.count if self.count else 0.0
+
+# Exponential average of a stage timing in ms
+def update_timing(timing, name, t0, alpha=0.9):
+    ms = (time.perf_counter() - t0)*1e3
+    timing[name] = alpha*timing.get(name, ms) + (1 - alpha)*ms
+    return ms
+
+# Registry of all metrics. Stage timings keep an exponential average (timing, for the status bar)
+# and a histogram. Counters and gauges owned by other objects are registered as callables and read
+# only when metrics are exported, so the acquisition path pays nothing for them.
+# Every metric is updated by one thread, readers may see a value one update old.
+class Metrics:
+    # Custom constructor
+    def __init__(self):
+        self.timing = {} # Average time of each stage in ms
+        self.histograms = {} # Stage name -> Histogram
+        self.counters = {} # Name -> callable returning a monotonically increasing number
+        self.gauges = {} # Name -> callable returning current value
+        self.started = time.time()
+        self.last = {} # Counter values at last rates() call
+        self.lastTime = time.perf_counter()
+        self.server = None
+
+    # Record stage duration since t0 (perf_counter), returns it in ms
+    def time(self, name, t0):
+        ms = update_timing(self.timing, name, t0)
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(ms)
+        return ms
+
+    # Register counter (callable returning total so far)
+    def counter(self, name, func):
+        self.counters[name] = func
+
+    # Register gauge (callable returning current value)
+    def gauge(self, name, func):
+        self.gauges[name] = func
+
+    # Clear histograms (counters belong to their owners)
+    def reset(self):
+        self.timing.clear()
+        self.histograms.clear()
+
+    # Counter rates per second since the previous call
+    def rates(self):
+        now = time.perf_counter()
+        dt = now - self.lastTime
+        values = {name: func() for name, func in self.counters.items()}
+        rates = {name: (v - self.last.get(name, v))/dt if dt > 0 else 0.0 for name, v in values.items()}
+        self.last = values
+        self.lastTime = now
+        return rates
+
+    # Everything as a dictionary (JSON dump)
+    def to_dict(self):
+        return {
+            'started': self.started,
+            'uptime': time.time() - self.started,
+            'stages': {name: {'count': h.count, 'mean_ms': h.mean, 'p50_ms': h.quantile(0.5),
+                              'p90_ms': h.quantile(0.9), 'p99_ms': h.quantile(0.99), 'max_ms': h.max,
+                              'buckets_ms': dict(zip([str(b) for b in h.bounds] + ['inf'], h.counts))}
+                       for name, h in list(self.histograms.items())},
+            'counters': {name: func() for name, func in self.counters.items()},
+            'gauges': {name: func() for name, func in self.gauges.items()},
+        }
+
+    # Multi-line status text (overlay)
+    def overview(self):
+        lines = ["%-9s %8s %8s %8s %8s" % ("stage", "mean ms", "p50", "p99", "max")]
+        for name, h in list(self.histograms.items()):
+            lines.append("%-9s %8.3f %8.3f %8.3f %8.2f" % (name, h.mean, h.quantile(0.5), h.quantile(0.99), h.max))
+        for name, rate in self.rates().items():
+            lines.append("%-22s %12.0f /s" % (name, rate))
+        for name, func in self.gauges.items():
+            lines.append("%-22s %12.1f" % (name, func()))
+        for name, func in self.counters.items():
+            lines.append("%-22s %12d total" % (name, func()))
+        return "\n".join(lines)
+
+    # Prometheus text exposition format
+    def prometheus(self, prefix='myostack'):
+        out = ["# TYPE %s_stage_seconds histogram" % prefix]
+        for name, h in list(self.histograms.items()):
+            cumulative = 0
+            for bound, c in zip(h.bounds + [float('inf')], h.counts):
+                cumulative += c
+                le = '+Inf' if bound == float('inf') else repr(bound/1e3)
+                out.append('%s_stage_seconds_bucket{stage="%s",le="%s"} %d' % (prefix, name, le, cumulative))
+            out.append('%s_stage_seconds_sum{stage="%s"} %r' % (prefix, name, h.sum/1e3))
+            out.append('%s_stage_seconds_count{stage="%s"} %d' % (prefix, name, h.count))
+        for name, func in self.counters.items():
+            out.append("# TYPE %s_%s_total counter" % (prefix, name))
+            out.append("%s_%s_total %r" % (prefix, name, func()))
+        for name, func in self.gauges.items():
+            out.append("# TYPE %s_%s gauge" % (prefix, name))
+            out.append("%s_%s %r" % (prefix, name, float(func())))
+        return "\n".join(out) + "\n"
+
+    # Write Prometheus textfile (node_exporter textfile collector), replaced atomically
+    def write_textfile(self, path):
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+    # Write JSON dump
+    def dump_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    # Serve /metrics (Prometheus) and /metrics.json on a local HTTP port in a background thread
+    def serve(self, port=9109, host='127.0.0.1'):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith('/metrics.json'):
+                    body, kind = json.dumps(metrics.to_dict()).encode(), 'application/json'
+                elif self.path.startswith('/metrics'):
+                    body, kind = metrics.prometheus().encode(), 'text/plain; version=0.0.4'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', kind)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address[1]
+
+    # Stop HTTP endpoint
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
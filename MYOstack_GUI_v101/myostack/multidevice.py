@@ -0,0 +1,254 @@
+# Several MYOstacks at once: one acquisition process per port, streams merged onto one sample timeline
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import multiprocessing
+import queue
+import time
+import numpy as np
+
+from .protocol import ProtocolParser
+from .sources import Source, open_source
+
+# Acquisition process of one device: read, parse, send ADC counts blocks (device, first sample index,
+# arrival time, counts, bad frames, bytes read) to out; commands for the device come through the commands queue
+def device_worker(index, name, baudRate, speed, channels, out, commands, stop):
+    source = open_source(name, baudRate, speed)
+    parser = ProtocolParser(channels)
+    while not stop.is_set() and not source.open():
+        time.sleep(0.5)
+    source.start()
+    count = 0
+    length = 0 # Bytes read since last block sent
+    while not stop.is_set():
+        source.dataReady.wait(0.1)
+        while not commands.empty():
+            source.write(commands.get())
+        msg = source.take()
+        if not msg:
+            continue
+        counts, bad = parser.parse(msg)
+        length += len(msg)
+        n = counts.shape[1]
+        if n > 0:
+            out.put((index, count, time.monotonic(), counts.astype(np.int32), bad, length))
+            count += n
+            length = 0
+    source.close()
+
+# Aligns streams of several devices onto one sample-indexed timeline. Every device has its own
+# clock: its rate is estimated from arrival throughput and the streams are resampled (linear
+# interpolation) to the mean rate, so the relative drift between devices is removed. The remaining
+# offset (start, rate estimate error) is measured as the arrival time of the current position of
+# every device and slowly corrected (over `settle` seconds).
+# A device that sent nothing for `timeout` seconds (stopped, unplugged or never started) does not
+# hold the others back: its channels repeat its last value (0 if it never sent data) until it is
+# back, then its stream continues from there. Received samples are kept in a preallocated ring of
+# `capacity` seconds per device.
+class Aligner:
+    # Custom constructor
+    def __init__(self, devices, channels=9, fs=500.0, warmup=2.0, maxDrift=0.02, settle=5.0, alpha=0.98,
+                 timeout=0.5, capacity=10.0):
+        self.devices = devices
+        self.channels = channels # Channels per device
+        self.fs = fs # Nominal sampling frequency
+        self.warmup = warmup # Seconds of data before rate estimates are used
+        self.maxDrift = maxDrift # Maximum relative deviation of a device rate from nominal
+        self.settle = settle # Time to remove an offset between devices in s
+        self.alpha = alpha # Smoothing of measured offsets (arrival times are jittery)
+        self.timeout = timeout # Seconds without data after which a device is filled in
+        self.capacity = int(capacity*fs) # Samples kept per device
+        self.buffer = np.zeros((devices, channels, self.capacity)) # Sample i of device k at [k, :, i % capacity]
+        self.offset = np.zeros(devices) # Smoothed time offset of every device from the mean in s
+        self.received = np.zeros(devices, dtype=np.int64) # Samples in device streams (received and filled)
+        self.shift = np.zeros(devices, dtype=np.int64) # Device sample index -> stream index (after dropouts)
+        self.first = [None]*devices # (arrival time, samples) of first block (since last dropout)
+        self.last = [None]*devices # (arrival time, samples) of last block
+        self.rate = np.full(devices, float(fs)) # Estimated device rates
+        self.position = None # Next output position in every device stream (fractional sample index)
+        self.output = 0 # Samples output
+        self.dropout = np.zeros(devices, dtype=bool) # Device is being filled in
+        self.dropouts = np.zeros(devices, dtype=np.int64) # Dropouts per device
+        self.filled = np.zeros(devices, dtype=np.int64) # Samples filled in per device
+        self.overwritten = np.zeros(devices, dtype=np.int64) # Samples lost because the ring was full
+
+    # Write samples (channels, n) to the end of the stream of a device
+    def _write(self, device, data):
+        n = data.shape[1]
+        if n > self.capacity:
+            data = data[:, n - self.capacity:]
+        start = (self.received[device] + n - data.shape[1]) % self.capacity
+        first = min(data.shape[1], self.capacity - start)
+        self.buffer[device, :, start: start + first] = data[:, :first]
+        self.buffer[device, :, :data.shape[1] - first] = data[:, first:]
+        self.received[device] += n
+        if self.position is not None:
+            lost = self.received[device] - self.capacity - int(self.position[device])
+            if lost > 0:
+                self.overwritten[device] += lost
+                self.position[device] += lost
+
+    # Last sample of a device (channels, 1), zeros before its first one
+    def _last(self, device):
+        if self.received[device] == 0:
+            return np.zeros((self.channels, 1))
+        i = (self.received[device] - 1) % self.capacity
+        return self.buffer[device, :, i: i + 1]
+
+    # Add block of one device: start - index of its first sample, t - arrival time of its last sample
+    def add(self, device, start, t, counts):
+        start += self.shift[device]
+        if self.dropout[device] or start < self.received[device]: # Back after a dropout: continue from here
+            self.dropout[device] = False
+            self.shift[device] += self.received[device] - start
+            start = self.received[device]
+            self.first[device] = None # Measure its rate again
+        if start > self.received[device]: # Gap in device stream: keep timeline, fill with last value
+            self._write(device, np.repeat(self._last(device), start - self.received[device], axis=1))
+        self._write(device, counts)
+        if self.first[device] is None:
+            self.first[device] = (t, self.received[device])
+        self.last[device] = (t, self.received[device])
+        t0, n0 = self.first[device]
+        if t - t0 >= self.warmup:
+            rate = (self.received[device] - n0)/(t - t0)
+            self.rate[device] = np.clip(rate, self.fs*(1 - self.maxDrift), self.fs*(1 + self.maxDrift))
+
+    # Aligned block (devices*channels, m) of everything all devices can provide (devices in dropout are
+    # filled in); now - current time.monotonic() (arrival times clock)
+    def take(self, now=None):
+        now = time.monotonic() if now is None else now
+        started = [f is not None for f in self.first]
+        if not any(started):
+            return np.zeros((self.devices*self.channels, 0))
+        if self.position is None:
+            if not all(started) and now - min(f[0] for f in self.first if f is not None) < self.timeout:
+                return np.zeros((self.devices*self.channels, 0))
+            # Start when the last device started: skip what others sent before
+            start = max(f[0] for f in self.first if f is not None)
+            self.position = np.array([f[1] - 1 + (start - f[0])*self.fs if f is not None else 0.0 for f in self.first])
+        # Devices without data for timeout seconds are filled in
+        live = np.array([last is not None and now - last[0] < self.timeout for last in self.last])
+        if not live.any(): # All stopped: nothing to align
+            return np.zeros((self.devices*self.channels, 0))
+        for k in np.flatnonzero(~live & ~self.dropout):
+            self.dropout[k] = True
+            self.dropouts[k] += 1
+            self.offset[k] = 0
+        # Arrival time of the current position of every live device, its deviation from the mean
+        t = np.zeros(self.devices)
+        for k in np.flatnonzero(live):
+            arrival, n = self.last[k]
+            t[k] = arrival - (n - 1 - self.position[k])/self.rate[k]
+        self.offset[live] = self.alpha*self.offset[live] + (1 - self.alpha)*(t[live] - t[live].mean())
+        # Device samples per output sample: rate ratio, slowed down when a device is ahead
+        step = np.where(live, self.rate/self.rate[live].mean()*(1 - self.offset/self.settle), 1.0)
+        # Output samples available from every live device (interpolation needs the next sample)
+        available = (self.received - 1 - self.position)/step
+        m = int(max(0, np.floor(available[live].min())))
+        if m == 0:
+            return np.zeros((self.devices*self.channels, 0))
+        for k in np.flatnonzero(~live): # Repeat last value up to the end of this block
+            missing = int(np.ceil(self.position[k] + step[k]*m)) + 1 - self.received[k]
+            if missing > 0:
+                self._write(k, np.repeat(self._last(k), missing, axis=1))
+                self.filled[k] += missing
+        # Linear interpolation of all devices at once
+        p = self.position[:, None] + step[:, None]*np.arange(m)
+        i = np.floor(p).astype(np.int64)
+        frac = (p - i)[:, :, None]
+        j = np.minimum(i + 1, self.received[:, None] - 1)
+        rows = np.arange(self.devices)[:, None]
+        a = self.buffer[rows, :, i % self.capacity] # (devices, m, channels)
+        b = self.buffer[rows, :, j % self.capacity]
+        out = (a + (b - a)*frac).transpose(0, 2, 1).reshape(self.devices*self.channels, m)
+        self.position += step*m
+        self.output += m
+        return out
+
+# Source of aligned ADC counts (devices*channels, N) from several devices, one process per device
+class MultiDevice(Source):
+    # Custom constructor
+    def __init__(self, ports=None, baudRate=1000000, channels=9, fs=500.0, speed=1.0):
+        Source.__init__(self)
+        if ports is None:
+            from .reader import list_ports
+            ports = list_ports()
+        self.ports = list(ports)
+        self.COM = ", ".join(self.ports)
+        self.baudRate = baudRate
+        self.speed = speed # Simulator/replay speed of 'sim' or file devices
+        self.channels = channels*len(self.ports)
+        self.aligner = Aligner(len(self.ports), channels, fs)
+        self.droppedFrames = 0
+        self.queue = multiprocessing.Queue(256) # Parsed blocks of all devices (bounded: workers wait when full)
+        self.stopEvent = multiprocessing.Event()
+        self.commands = [multiprocessing.Queue() for _ in self.ports] # Command bytes per device
+        self.workers = []
+
+    # Start acquisition processes
+    def open(self):
+        if not self.workers:
+            self.stopEvent.clear()
+            for i, port in enumerate(self.ports):
+                worker = multiprocessing.Process(target=device_worker, daemon=True,
+                    args=(i, port, self.baudRate, self.speed, self.aligner.channels, self.queue,
+                          self.commands[i], self.stopEvent))
+                worker.start()
+                self.workers.append(worker)
+        return True
+
+    # Collect parsed blocks from all devices and queue the aligned part (also without new blocks:
+    # devices that stopped are filled in after the aligner timeout). Everything queued is taken at once;
+    # consecutive blocks of a device are joined, so the aligner works once per device and read.
+    def read(self):
+        items = []
+        try:
+            items.append(self.queue.get(timeout=0.1))
+            while True:
+                items.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        runs = {} # Device -> [first sample index, next sample index, arrival time, blocks] of consecutive blocks
+        for device, start, t, counts, bad, length in items:
+            self.droppedFrames += bad
+            self.bytesRead += length # Device bytes (the queued chunks are aligned counts)
+            run = runs.get(device)
+            if run is not None and start == run[1]:
+                run[1:3] = start + counts.shape[1], t
+                run[3].append(counts)
+                continue
+            if run is not None:
+                self.aligner.add(device, run[0], run[2], np.hstack(run[3]))
+            runs[device] = [start, start + counts.shape[1], t, [counts]]
+        for device, (start, end, t, blocks) in runs.items():
+            self.aligner.add(device, start, t, np.hstack(blocks))
+        block = self.aligner.take()
+        if block.shape[1]:
+            self.push(block, 0)
+        return block.shape[1]
+
+    # All queued aligned counts as one array
+    def take(self):
+        self.dataReady.clear()
+        parts = []
+        while True:
+            try:
+                parts.append(self.chunks.popleft())
+            except IndexError:
+                break
+        return np.hstack(parts) if parts else np.zeros((self.channels, 0))
+
+    # Send command bytes to all devices
+    def write(self, data):
+        for commands in self.commands:
+            commands.put(bytes(data))
+
+    # Stop acquisition processes
+    def close(self):
+        self.stop()
+        self.stopEvent.set()
+        for worker in self.workers:
+            worker.join(2)
+        self.workers = []
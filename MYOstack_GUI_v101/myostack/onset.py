@@ -0,0 +1,207 @@
+# Muscle activation onset/offset detection on the streaming envelope
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import queue
+from collections import namedtuple
+import numpy as np
+
+from .envelope import EnvelopeDetector
+
+# Detected event: kind - 'onset' or 'offset', channel - sensor index, index - sample index of the first
+# sample of the confirmed run, time - its time in s on the sample timeline (filled in by the processor,
+# None from the detector alone), level - detection envelope there in mV,
+# latency - time from arrival of the serial bytes to the event in ms (None if unknown)
+Event = namedtuple('Event', 'kind channel index time level latency')
+
+# Per-channel detector with hysteresis on its own detection envelope of the filtered signal (same
+# chain as EnvelopeDetector, smoothing set for a group delay of `delay` s instead of the display
+# smoothing, so offsets are not delayed by a slowly decaying envelope). The baseline (mean and std of the resting envelope) is
+# calibrated over the first `calibration` seconds (after `settle` seconds of filter transients; median
+# and MAD, so short contractions during calibration do not raise it) and
+# then follows slow drift while the muscle is relaxed (time constant `adapt` s). A channel turns on
+# when the envelope stays above mean + onK*std for `minOn` s and off when it stays below the offset
+# threshold for `minOff` s; the event is stamped with the first sample of that run. The offset
+# threshold is relative to the activation: mean + offRatio*(peak - mean), peak - highest envelope since
+# the onset (at least mean + offK*std), so the smoothed envelope does not have to decay down to rest.
+# After an offset the onset threshold starts at the peak of the activation and decays back to the rest threshold
+# with time constant `refractory` s, like the tail of the envelope and the ringing of the filters
+# after a strong contraction (both proportional to its peak), so they cause no new onset.
+# Channels already active when calibration ends get no onset (its time is unknown) and no offset.
+class OnsetDetector:
+    # Custom constructor
+    def __init__(self, channels=9, fs=500.0, calibration=2.0, settle=0.5, onK=6.0, offK=4.0, minOn=0.01,
+                 minOff=0.03, offRatio=0.2, refractory=0.3, delay=0.015, adapt=10.0, minStd=0.01, queueSize=0):
+        self.channels = channels
+        self.calibration = calibration # Seconds of rest used for the baseline
+        self.settle = settle # Seconds skipped before calibrating
+        self.onK = onK # Onset threshold in baseline std above baseline mean
+        self.offK = offK # Lowest offset threshold (lower than onset: hysteresis)
+        self.offRatio = offRatio # Offset threshold as part of activation peak above baseline
+        self.refractory = refractory # Decay time constant of the onset threshold after an offset in s
+        self.delay = delay # Group delay of the detection envelope in s, None - process() gets an envelope
+        self.envelope = EnvelopeDetector(fs, channels)
+        self.minOn = minOn # Seconds above onset threshold needed for onset
+        self.minOff = minOff # Seconds below offset threshold needed for offset
+        self.adapt = adapt # Baseline tracking time constant in s, None - fixed baseline
+        self.minStd = minStd # Lower bound of baseline std in mV
+        self.listeners = [] # Callables receiving every Event (called in the processing thread)
+        self.events = queue.Queue(queueSize) if queueSize else None # Events for other threads (queueSize > 0)
+        self.droppedEvents = 0 # Events not queued (queue full)
+        self.eventCount = 0
+        self.mean = np.zeros(channels) # Baseline mean in mV
+        self.std = np.full(channels, minStd) # Baseline std in mV
+        self.set_fs(fs)
+        self.calibrate()
+
+    # Sampling frequency (keeps baseline)
+    def set_fs(self, fs):
+        self.fs = fs
+        if self.delay:
+            k = self.delay*fs/3 # Samples of delay of each of the 3 smoothing stages
+            self.envelope.alpha = k/(1 + k)
+            self.envelope.set_fs(fs)
+        self.onSamples = max(1, int(round(self.minOn*fs)))
+        self.offSamples = max(1, int(round(self.minOff*fs)))
+
+    # Start a new baseline calibration (muscles should be relaxed); no events until it is done
+    def calibrate(self, seconds=None):
+        if seconds is not None:
+            self.calibration = seconds
+        self.calibrated = False
+        self.calibrationSamples = 0 # Samples seen since calibrate()
+        self.samples = [] # Envelope blocks of calibration
+        self.reset()
+
+    # Clear activation state (keeps baseline)
+    def reset(self):
+        self.active = np.zeros(self.channels, dtype=bool)
+        self.run = np.zeros(self.channels, dtype=np.int64) # Length of the current run towards a switch
+        self.runStart = np.zeros(self.channels, dtype=np.int64) # Sample index of its first sample
+        self.runLevel = np.zeros(self.channels) # Envelope at its first sample
+        self.peak = np.zeros(self.channels) # Highest envelope since onset of active channels
+        self.unknown = np.zeros(self.channels, dtype=bool) # Active since calibration (onset not seen)
+        self.rearm = np.zeros(self.channels) # Onset threshold at the last offset (peak of the activation)
+        self.rearmStart = np.zeros(self.channels, dtype=np.int64) # Sample index of the offset
+
+    # Onset and lowest offset thresholds (channels,)
+    @property
+    def thresholds(self):
+        return self.mean + self.onK*self.std, self.mean + self.offK*self.std
+
+    # Offset thresholds (channels, N) of envelope block of active channels with peak (channels,) before it;
+    # returns (thresholds, peaks after every sample)
+    def _offset(self, envelope, peak, channels=slice(None)):
+        peaks = np.maximum.accumulate(np.maximum(envelope, peak[..., None]), axis=-1)
+        mean = self.mean[channels][..., None]
+        lowest = mean + self.offK*self.std[channels][..., None]
+        return np.maximum(lowest, mean + self.offRatio*(peaks - mean)), peaks
+
+    # Onset condition (channels, N) of envelope block of inactive channels starting at sample index `first`
+    def _onset(self, envelope, first, channels=slice(None)):
+        on = self.thresholds[0][channels][..., None]
+        age = first + np.arange(envelope.shape[-1]) - self.rearmStart[channels][..., None]
+        rearm = self.rearm[channels][..., None]*np.exp(-age/(self.refractory*self.fs))
+        return envelope > np.maximum(on, rearm)
+
+    # Collect calibration samples of envelope block (channels, N)
+    def _calibrate(self, envelope):
+        skip = int(self.settle*self.fs)
+        self.samples.append(envelope[:, max(0, skip - self.calibrationSamples):].copy())
+        self.calibrationSamples += envelope.shape[1]
+        if self.calibrationSamples - skip >= self.calibration*self.fs:
+            x = np.hstack(self.samples)
+            self.mean = np.median(x, axis=1)
+            self.std = np.maximum(1.4826*np.median(np.abs(x - self.mean[:, None]), axis=1), self.minStd)
+            self.samples = []
+            self.calibrated = True
+            # Channels contracted at the end of calibration
+            self.unknown = envelope[:, -1] > self.thresholds[0]
+            self.active = self.unknown.copy()
+            self.peak = envelope[:, -1].copy()
+
+    # Detect in block (channels, N) of filtered signal (or of envelope if delay is None) whose first sample
+    # has index `first`, returns events
+    def process(self, signal, first):
+        envelope = self.envelope.process(signal) if self.delay else signal
+        n = envelope.shape[1]
+        if n == 0:
+            return []
+        if not self.calibrated:
+            self._calibrate(envelope)
+            return []
+        on, off = self.thresholds
+        # Samples that move a channel towards a switch: above onset threshold (inactive) or below
+        # offset threshold (active); only channels with such samples or a run going on are checked
+        offset, peaks = self._offset(envelope, self.peak)
+        toward = np.where(self.active[:, None], envelope < offset, self._onset(envelope, first))
+        self.peak = np.where(self.active, peaks[:, -1], self.peak)
+        events = []
+        for ch in np.flatnonzero(toward.any(axis=1) | (self.run > 0)):
+            events += self._channel(ch, toward[ch], envelope[ch], first)
+        # Baseline follows slow drift of relaxed channels (blocks without any sample above offset threshold)
+        if self.adapt:
+            w = (1 - np.exp(-n/(self.adapt*self.fs)))*(~self.active & (envelope.max(axis=1) < off)) # Update weights
+            d = envelope - self.mean[:, None]
+            self.mean += w*d.mean(axis=1)
+            self.std = np.maximum(np.sqrt(self.std**2 + w*((d*d).mean(axis=1) - self.std**2)), self.minStd)
+        return events
+
+    # Runs of one channel in a block
+    def _channel(self, ch, toward, level, first):
+        events = []
+        run = self.run[ch]
+        i = 0
+        n = len(toward)
+        while i < n:
+            if not toward[i]:
+                run = 0
+                i += 1
+                continue
+            if run == 0:
+                self.runStart[ch] = first + i
+                self.runLevel[ch] = level[i]
+            # Consecutive samples from i
+            stop = i + np.argmin(toward[i:]) if not toward[i:].all() else n
+            needed = self.offSamples if self.active[ch] else self.onSamples
+            if run + stop - i >= needed:
+                self.active[ch] = not self.active[ch]
+                if self.unknown[ch]: # Activation seen since calibration ended: no events
+                    self.unknown[ch] = False
+                else:
+                    events.append(Event('onset' if self.active[ch] else 'offset', int(ch), int(self.runStart[ch]),
+                                        None, float(self.runLevel[ch]), None))
+                # Samples after the switch count towards the next one
+                i += needed - run
+                run = 0
+                if self.active[ch]: # Peak of this activation: from its first sample on
+                    self.peak[ch] = level[max(0, self.runStart[ch] - first): i].max(initial=self.runLevel[ch])
+                else:
+                    self.rearm[ch] = self.peak[ch]
+                    self.rearmStart[ch] = first + i
+                if i < n:
+                    toward = toward.copy()
+                    if self.active[ch]:
+                        offset, peaks = self._offset(level[i:], self.peak[ch], ch)
+                        toward[i:] = level[i:] < offset
+                        self.peak[ch] = peaks[-1]
+                    else:
+                        toward[i:] = self._onset(level[i:], first + i, ch)
+                continue
+            run += stop - i
+            i = stop
+        self.run[ch] = run
+        return events
+
+    # Deliver events to listeners and queue
+    def emit(self, events):
+        for event in events:
+            self.eventCount += 1
+            for listener in self.listeners:
+                listener(event)
+            if self.events is not None:
+                try:
+                    self.events.put_nowait(event)
+                except queue.Full:
+                    self.droppedEvents += 1
@@ -0,0 +1,110 @@
+# Vectorized parser for the MYOstack ASCII serial protocol ("d1;d2;...;d9\r\n")
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import numpy as np
+
+ADC_TO_MV = 3.3/4.094 # ADC counts to millivolts (4094 counts = 3300 mV)
+MAX_DIGITS = 9 # Longer fields are treated as malformed (also keeps float64 sums exact)
+
+_NL = ord('\n')
+_CR = ord('\r')
+_SEP = ord(';')
+_ZERO = ord('0')
+_NINE = ord('9')
+
+_ALLOWED = np.zeros(256, dtype=bool) # Bytes that can appear in a clean block
+_ALLOWED[list(b'0123456789;\r\n')] = True
+_TO_SPACES = bytes.maketrans(b';\r\n', b'   ')
+
+# Batch parser: raw serial bytes -> (channels, N) array of ADC counts
+class FrameParser:
+    # Custom constructor
+    def __init__(self, channels=9):
+        self.channels = channels
+        self.carry = b'' # Partial trailing frame kept for the next call
+        self.frames = 0 # Total good frames
+        self.dropped = 0 # Total dropped or malformed frames
+
+    # Forget partial frame (used on refresh)
+    def reset(self):
+        self.carry = b''
+
+    # Parse a chunk, returns (data, bad): data - int64 (channels, N), bad - dropped/malformed frame count.
+    # Frames with a wrong field count are dropped, non-numeric fields are stored as 0 (frame is kept).
+    def parse(self, chunk):
+        buf = self.carry + bytes(chunk)
+        end = buf.rfind(b'\n') + 1
+        self.carry = buf[end:]
+        if end == 0:
+            return np.zeros((self.channels, 0), dtype=np.int64), 0
+
+        a = np.frombuffer(buf, dtype=np.uint8, count=end)
+        data = self._parse_clean(buf[:end], a)
+        if data is not None:
+            self.frames += data.shape[1]
+            return data, 0
+        return self._parse_any(a)
+
+    # Fast path for a well-formed block (every line has exactly 9 numeric fields), None otherwise
+    def _parse_clean(self, block, a):
+        if not _ALLOWED[a].all():
+            return None
+        nl = np.flatnonzero(a == _NL)
+        sep = np.flatnonzero(a == _SEP)
+        # Every '\r' ends a line (a stray one would turn into a field separator below)
+        if len(sep) != (self.channels - 1)*len(nl) or not (a[nl - 1] == _CR).all() or \
+                np.count_nonzero(a == _CR) != len(nl):
+            return None
+        if not (np.bincount(np.searchsorted(nl, sep), minlength=len(nl)) == self.channels - 1).all():
+            return None
+        values = np.fromstring(block.translate(_TO_SPACES), dtype=np.int64, sep=' ')
+        if values.size != self.channels*len(nl): # Empty fields
+            return None
+        return values.reshape(-1, self.channels).T
+
+    # General path: validates every field, tolerates noise and broken lines
+    def _parse_any(self, a):
+        end = len(a)
+        is_nl = a == _NL
+        is_sep = a == _SEP
+        is_bound = is_nl | is_sep
+        # '\r' right before '\n' is part of the line terminator
+        is_term_cr = np.zeros(end, dtype=bool)
+        is_term_cr[:-1] = (a[:-1] == _CR) & is_nl[1:]
+        content = ~(is_bound | is_term_cr)
+        is_digit = (a >= _ZERO) & (a <= _NINE)
+
+        # Field of every byte (a boundary byte belongs to the field it closes)
+        field = np.cumsum(is_bound) - is_bound
+        bounds = np.flatnonzero(is_bound)
+        nfields = len(bounds)
+
+        # Field length and validity
+        length = np.bincount(field[content], minlength=nfields)
+        nondigit = np.bincount(field[content & ~is_digit], minlength=nfields)
+        valid = (length > 0) & (length <= MAX_DIGITS) & (nondigit == 0)
+
+        # Decimal value: digit*10^(number of content bytes after it in the same field)
+        cc = np.cumsum(content)
+        sel = content & is_digit
+        exponent = cc[bounds][field[sel]] - cc[sel]
+        exponent = np.minimum(exponent, MAX_DIGITS)
+        weights = (a[sel] - _ZERO)*np.power(10.0, exponent)
+        value = np.bincount(field[sel], weights=weights, minlength=nfields)
+        value[~valid] = 0
+
+        # Group fields into lines
+        line = np.cumsum(is_nl[bounds]) - is_nl[bounds]
+        per_line = np.bincount(line)
+        empty = (per_line == 1) & (length[is_nl[bounds]] == 0)
+        good_line = per_line == self.channels
+        good = good_line[line]
+
+        data = value[good].astype(np.int64).reshape(-1, self.channels).T
+        bad_fields = np.bincount(line[good & ~valid], minlength=len(per_line))
+        bad = int(np.count_nonzero(~good_line & ~empty) + np.count_nonzero(bad_fields[good_line]))
+        self.frames += data.shape[1]
+        self.dropped += bad
+        return data, bad
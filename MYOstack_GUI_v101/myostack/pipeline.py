@@ -0,0 +1,75 @@
+# DSP worker stage: takes serial chunks from a reader and runs the processing chain in its own thread
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import threading
+import time
+import numpy as np
+
+
+# Stage 1 - reader (SerialReader or any other Source, MultiDevice delivers parsed counts),
+# stage 2 - this worker (Processor.feed: parse, filters, envelope, spectrum),
+# stage 3 - renderer, takes Processor.snapshot() at its own frame rate.
+class Pipeline:
+    # Custom constructor
+    def __init__(self, source, processor):
+        self.source = source
+        self.processor = processor
+        self.running = False
+        self.thread = None
+        self.blocks = 0 # Processed chunks
+        self.sourceDropped = 0 # Dropped frames of a source that parses itself, already counted by the processor
+        # Source counters and read timing in the processor metrics
+        metrics = processor.metrics
+        source.metrics = metrics
+        metrics.counter('bytes', lambda: source.bytesRead)
+        metrics.counter('chunks', lambda: source.chunksRead)
+        metrics.counter('overruns', lambda: source.overruns)
+        metrics.counter('backpressure', lambda: source.backpressure)
+        metrics.gauge('queue_depth', lambda: source.depth)
+        metrics.gauge('queue_max_depth', lambda: source.maxDepth)
+        aligner = getattr(source, 'aligner', None) # Several devices (MultiDevice)
+        if aligner is not None:
+            metrics.counter('device_dropouts', lambda: int(aligner.dropouts.sum()))
+            metrics.counter('device_filled_samples', lambda: int(aligner.filled.sum()))
+            metrics.counter('device_overwritten_samples', lambda: int(aligner.overwritten.sum()))
+
+    # Start worker thread
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Stop worker thread
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+    # Worker loop
+    def run(self):
+        while self.running:
+            self.source.dataReady.wait(0.1)
+            since = self.source.pendingSince
+            msg = self.source.take()
+            counts = isinstance(msg, np.ndarray) # Parsed counts (MultiDevice) instead of bytes
+            if (msg.shape[1] if counts else len(msg)) > 0:
+                t0 = time.perf_counter()
+                self.processor.arrival = since
+                if counts:
+                    # Frames dropped by the device parsers count as dropped frames of the processor
+                    dropped = self.source.droppedFrames
+                    self.processor.droppedFrames += dropped - self.sourceDropped
+                    self.sourceDropped = dropped
+                    self.processor.feed_counts(msg)
+                else:
+                    self.processor.feed(msg)
+                self.processor.metrics.time('dsp', t0)
+                self.processor.metrics.time('latency', since) # Oldest chunk queued -> processed
+                self.blocks += 1
+
+    # Latest processed data for rendering
+    def snapshot(self):
+        return self.processor.snapshot()
@@ -0,0 +1,241 @@
+# MYOstack processing chain: parse -> scale -> filter -> envelope -> ring buffer (+ recording, spectrum)
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+
+from .parser import ADC_TO_MV
+from .protocol import ProtocolParser
+from .filters import FilterBank
+from .envelope import EnvelopeDetector
+from .ringbuffer import RingBuffer
+from .shared import SharedRingBuffer
+from .spectrum import SpectrumAnalyzer
+from .timeline import Timeline
+from .features import FeatureExtractor
+from .onset import OnsetDetector
+from .metrics import Metrics
+
+# Copy of the processed window for rendering
+Snapshot = namedtuple('Snapshot', 'time raw filtered envelope filled count version fftX fftY meanFreq medianFreq fs '
+                                   'features')
+
+# Processing chain for one MYOstack. Thread-safe: feed() may run in a worker thread
+# while configure()/snapshot() are called from the GUI thread.
+class Processor:
+    # Custom constructor
+    def __init__(self, channels=9, fs=500.0, window=6.2, recorder=None, processedRecorder=None, publisher=None,
+                 pyramid=None, featureRecorder=None, shared=None):
+        self.channels = channels
+        self.timeline = Timeline(fs) # Sample counter and measured sampling frequency
+        self.dataWidth = int(window*fs) # Samples in window
+        self.gain = np.ones(channels) # Sensors gain, index is the sensor number (change with set_gain)
+        self.scale = ADC_TO_MV/self.gain[:, None] # ADC counts to mV at the sensor input, rebuilt by set_gain
+        self.parser = ProtocolParser(channels) # ASCII lines or binary frames, whichever the device sends
+        self.filters = FilterBank(channels)
+        self.envelope = EnvelopeDetector(fs, channels)
+        self.recorder = recorder # Writer of raw data
+        self.processedRecorder = processedRecorder # Writer of filtered data and envelope (2*channels columns)
+        self.publisher = publisher # Network publisher of raw data, filtered data and envelope
+        self.pyramid = pyramid # Long history summary (PyramidWriter) of filtered data and envelope
+        self.features = FeatureExtractor(channels, fs) # RMS, MAV, WL, ZC, SSC of filtered data every hop
+        self.featureRecorder = featureRecorder # Writer of feature vectors (features*channels columns)
+        self.featureListeners = [] # Callables (index, features) called with every block of feature vectors
+        self.onsets = OnsetDetector(channels, fs) # Muscle activation events from the filtered signal
+        self.arrival = None # Time (perf_counter) the data being processed was received (set by Pipeline)
+        # Buffer rows: raw data, filtered data, envelope (time is derived from the sample counter)
+        self.RAW = slice(0, channels)
+        self.FILTERED = slice(channels, 2*channels)
+        self.ENVELOPE = slice(2*channels, 3*channels)
+        if shared is None:
+            self.buffer = RingBuffer(3*channels, self.dataWidth)
+        else: # Window also readable by other processes (SharedReader(shared))
+            self.buffer = SharedRingBuffer(3*channels, self.dataWidth, shared, channels, fs)
+        self.filterSettings = (False, False, None) # notch50, notch60, band
+        self.version = 0 # Incremented whenever buffer data changes
+        self.droppedFrames = 0 # Dropped or malformed frames
+        self.spectrum = SpectrumAnalyzer(channels, fs) # Welch PSD of filtered data, all channels
+        self.fftChannel = 0 # Channel of spectrum in snapshot
+        self.samplesProcessed = 0 # Samples since start (not reset by refresh)
+        self.metrics = Metrics() # Stage histograms, counters and gauges
+        self.timing = self.metrics.timing # Average time of each stage in ms
+        self.metrics.counter('samples', lambda: self.samplesProcessed)
+        self.metrics.counter('dropped_frames', lambda: self.droppedFrames)
+        self.metrics.gauge('sample_rate_hz', lambda: self.fs)
+        self.metrics.counter('activation_events', lambda: self.onsets.eventCount)
+        for name, r in (('recorder', recorder), ('processed_recorder', processedRecorder), ('pyramid', pyramid),
+                        ('feature_recorder', featureRecorder)):
+            if r is not None:
+                self.metrics.counter(name + '_dropped_blocks', lambda r=r: r.droppedBlocks)
+        if publisher is not None:
+            self.metrics.counter('published_messages', lambda: publisher.published)
+            self.metrics.counter('published_bytes', lambda: publisher.bytesPublished)
+            self.metrics.counter('publish_dropped', lambda: publisher.dropped)
+            self.metrics.gauge('subscribers', lambda: publisher.clients)
+        self.lock = threading.Lock()
+
+    # Signal discretization frequency in Hz (measured when acquiring in real time)
+    @property
+    def fs(self):
+        return self.timeline.fs
+
+    # Time between two signal measurements in s
+    @property
+    def dt(self):
+        return 1/self.timeline.fs
+
+    # Samples since refresh
+    @property
+    def loopNumber(self):
+        return int(self.timeline.count)
+
+    # Set filters and envelope smoothing; when filters change, the stored window is filtered again
+    def configure(self, notch50=False, notch60=False, band=None, alpha=None):
+        with self.lock:
+            if alpha is not None:
+                self.envelope.alpha = alpha
+            self.filterSettings = (notch50, notch60, band)
+            self._update_filters()
+
+    # Set sensor gains (channels,)
+    def set_gain(self, gain):
+        with self.lock:
+            self.gain[:] = gain
+            self.scale = ADC_TO_MV/self.gain[:, None]
+
+    # Rebuild filters for current settings and fs (caller holds lock)
+    def _update_filters(self):
+        if self.filters.configure(self.fs, *self.filterSettings):
+            filled = self.buffer.filled
+            raw = self.buffer.view(self.RAW)[:, self.dataWidth - filled:]
+            self.buffer.write_last(self.FILTERED, self.filters.refilter(raw))
+            self.version += 1
+
+    # Measured sampling frequency changed: filters, envelope and spectrum follow it
+    def _retune(self):
+        with self.lock:
+            self._update_filters()
+            self.envelope.set_fs(self.fs)
+            self.spectrum.set_fs(self.fs)
+            self.features.set_fs(self.fs)
+            self.onsets.set_fs(self.fs)
+            if isinstance(self.buffer, SharedRingBuffer):
+                self.buffer.set_fs(self.fs)
+
+    # Clear data (keeps settings)
+    def refresh(self):
+        with self.lock:
+            self.buffer.refresh()
+            self.parser.reset()
+            self.filters.reset()
+            self.spectrum.reset()
+            self.features.reset()
+            self.onsets.reset()
+            self.timeline.reset()
+            self.version += 1
+
+    # Release shared memory
+    def close(self):
+        if isinstance(self.buffer, SharedRingBuffer):
+            self.buffer.close()
+
+    # Start a new rest baseline calibration of activation detection
+    def calibrate(self, seconds=None):
+        with self.lock:
+            self.onsets.calibrate(seconds)
+
+    # Process serial bytes, returns number of new samples
+    def feed(self, msg):
+        t0 = time.perf_counter()
+        block, bad = self.parser.parse(msg)
+        self.metrics.time('parse', t0)
+        self.droppedFrames += bad
+        return self.feed_counts(block)
+
+    # Process block of ADC counts (channels, N) arriving in real time, returns number of new samples
+    def feed_counts(self, block):
+        n = block.shape[1]
+        if n > 0:
+            if self.timeline.arrive(n):
+                self._retune()
+            self.feed_block(block*self.scale)
+        return n
+
+    # Process block of samples in mV (channels, N)
+    def feed_block(self, block):
+        n = block.shape[1]
+        with self.lock:
+            t0 = time.perf_counter()
+            filtered = self.filters.process(block)
+            self.metrics.time('filter', t0)
+            t0 = time.perf_counter()
+            envelope = self.envelope.process(filtered)
+            self.metrics.time('envelope', t0)
+            t0 = time.perf_counter()
+            self.spectrum.process(filtered)
+            self.metrics.time('spectrum', t0)
+            t0 = time.perf_counter()
+            index, features = self.features.process(filtered)
+            self.metrics.time('features', t0)
+            first = self.timeline.advance(n)
+            index += first + n - self.features.count # Extractor sample count -> timeline sample index
+            t0 = time.perf_counter()
+            events = self.onsets.process(filtered, first)
+            self.metrics.time('onsets', t0)
+            # Event times from the timeline (anchored at every fs change, like recordings and the plot)
+            events = [e._replace(time=float(self.timeline.times(e.index + 1, 1)[0])) for e in events]
+            t = self.timeline.times(first + 1, n)
+            self.buffer.append(np.vstack((block, filtered, envelope)))
+            self.samplesProcessed += n
+            self.version += 1
+        if events:
+            self.emit_events(events)
+        if self.recorder is not None:
+            self.recorder.write(t, block)
+        if self.processedRecorder is not None:
+            self.processedRecorder.write(t, np.vstack((filtered, envelope)))
+        if self.pyramid is not None:
+            self.pyramid.write(np.vstack((filtered, envelope)))
+        if self.publisher is not None:
+            t0 = time.perf_counter()
+            self.publisher.publish(first, self.fs, block, filtered, envelope)
+            self.metrics.time('publish', t0)
+        if len(index):
+            self.emit_features(index, features)
+
+    # Deliver activation events with their latency (serial bytes received -> event)
+    def emit_events(self, events):
+        if self.arrival is not None:
+            ms = self.metrics.time('event_latency', self.arrival)
+            events = [e._replace(latency=ms) for e in events]
+        self.onsets.emit(events)
+
+    # Export feature vectors: index - (H,) sample indices of window ends, features - (H, features, channels)
+    def emit_features(self, index, features):
+        if self.featureRecorder is not None:
+            self.featureRecorder.write(self.timeline.times(index + 1, len(index)), features.reshape(len(index), -1).T)
+        if self.publisher is not None:
+            self.publisher.publish_features(index[0], self.fs/self.features.hopSamples, features)
+        for listener in self.featureListeners:
+            listener(index, features)
+
+    # Copy of the current window
+    def snapshot(self):
+        with self.lock:
+            window = self.buffer.view().copy()
+            filled = self.buffer.filled
+            count = self.loopNumber
+            version = self.version
+            fs = self.fs
+            freqs = self.spectrum.freqs
+            psd = self.spectrum.psd[self.fftChannel].copy()
+            meanFreq = self.spectrum.meanFreq.copy()
+            medianFreq = self.spectrum.medianFreq.copy()
+            features = self.features.values.copy()
+            t = self.timeline.times(count - self.dataWidth + 1, self.dataWidth)
+        return Snapshot(t, window[self.RAW], window[self.FILTERED], window[self.ENVELOPE],
+                        filled, count, version, freqs, psd, meanFreq, medianFreq, fs, features)
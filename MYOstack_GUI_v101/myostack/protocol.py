@@ -0,0 +1,262 @@
+# Binary MYOstack serial protocol and protocol auto-detection (binary frames or ASCII lines)
+#
+# Frame: sync (2 bytes), sequence number (uint16), samples, CRC-16/CCITT (uint16) of sequence and samples.
+# Little endian. Samples are 12-bit packed (two samples in 3 bytes, sync A5 5A) or 16-bit (sync A5 5B).
+# 9 sensors: 21 or 24 bytes per frame instead of about 46 as ASCII text.
+# The device is switched with one command byte (see COMMANDS); a device not knowing the command keeps
+# sending ASCII lines and the parser stays with them.
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import numpy as np
+
+from .parser import FrameParser
+
+SYNC = {12: b'\xa5\x5a', 16: b'\xa5\x5b'} # Sync word of every sample format
+COMMANDS = {'ascii': b'\x20', 'binary12': b'\x21', 'binary16': b'\x22'} # Protocol switch commands
+PROTOCOLS = tuple(COMMANDS)
+MAX_GAP = 4096 # Larger sequence jumps are device restarts, not lost frames
+
+# CRC-16/CCITT-FALSE table (polynomial 0x1021, initial value 0xFFFF)
+def _crc_table():
+    table = np.zeros(256, dtype=np.uint16)
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+        table[i] = crc & 0xFFFF
+    return table
+
+_CRC_TABLE = _crc_table()
+
+# CRC of every row of a (frames, bytes) uint8 array, one table step per byte column for all frames
+def crc16(rows):
+    crc = np.full(rows.shape[0], 0xFFFF, dtype=np.uint16)
+    for j in range(rows.shape[1]):
+        crc = (crc << 8) ^ _CRC_TABLE[(crc >> 8) ^ rows[:, j]]
+    return crc
+
+# Bytes of the samples of one frame
+def payload_size(channels, bits):
+    return 3*((channels + 1)//2) if bits == 12 else 2*channels
+
+# Bytes of one frame
+def frame_size(channels, bits):
+    return 6 + payload_size(channels, bits)
+
+# Encode ADC counts (channels, N) as binary frames numbered from `sequence` (as the device does)
+def encode_binary(counts, sequence=0, bits=12):
+    counts = np.asarray(counts, dtype=np.int64)
+    channels, n = counts.shape
+    if bits == 12:
+        s = np.zeros((n, channels + channels % 2), dtype=np.int64)
+        s[:, :channels] = counts.T & 0xFFF
+        s0, s1 = s[:, 0::2], s[:, 1::2]
+        payload = np.stack((s0 & 0xFF, (s0 >> 8) | ((s1 & 0xF) << 4), s1 >> 4), axis=2).reshape(n, -1)
+    else:
+        payload = np.ascontiguousarray(counts.T, dtype='<u2').view(np.uint8).reshape(n, -1)
+    seq = (sequence + np.arange(n)) & 0xFFFF
+    body = np.hstack((np.stack((seq & 0xFF, seq >> 8), axis=1), payload)).astype(np.uint8)
+    crc = crc16(body)
+    frames = np.hstack((np.tile(np.frombuffer(SYNC[bits], dtype=np.uint8), (n, 1)), body,
+                        np.stack((crc & 0xFF, crc >> 8), axis=1).astype(np.uint8)))
+    return frames.tobytes()
+
+# Decoder of binary frames: raw serial bytes -> (channels, N) ADC counts. Frames are found and
+# checked for all sync candidates at once (CRC of all candidates computed column by column), so
+# cost does not depend on a Python loop over frames. Lost frames are known exactly from sequence
+# numbers; with `fill` they are replaced by the last received frame, so the sample timeline stays exact.
+class BinaryParser:
+    # Custom constructor
+    def __init__(self, channels=9, bits=12, fill=True):
+        self.channels = channels
+        self.bits = bits
+        self.fill = fill # Repeat last frame for lost frames
+        self.size = frame_size(channels, bits)
+        self.sync = np.frombuffer(SYNC[bits], dtype=np.uint8)
+        self.carry = b'' # Incomplete frame (from its sync word) kept for the next call
+        self.rest = b'' # Bytes after the last good frame (text when the device went back to ASCII)
+        self.frames = 0 # Total good frames
+        self.dropped = 0 # Total lost frames (sequence gaps)
+        self.corrupted = 0 # Sync words followed by a wrong CRC (outside good frames)
+        self.restarts = 0 # Sequence jumps larger than MAX_GAP
+        self.gaps = [] # (index in last returned block, lost frames) of the last parse
+        self.lastSequence = None
+        self.lastValues = None # Last frame (channels,)
+
+    # Forget partial frame and sequence (used on refresh)
+    def reset(self):
+        self.carry = b''
+        self.rest = b''
+        self.lastSequence = None
+        self.lastValues = None
+
+    # Parse a chunk, returns (data, lost): data - int64 (channels, N) including filled frames,
+    # lost - frames lost in this chunk
+    def parse(self, chunk):
+        buf = self.carry + bytes(chunk)
+        a = np.frombuffer(buf, dtype=np.uint8)
+        L = self.size
+        syncs = np.flatnonzero((a[:-1] == self.sync[0]) & (a[1:] == self.sync[1]))
+        cand = syncs[syncs + L <= len(a)]
+        rows = a[cand[:, None] + np.arange(L)]
+        ok = crc16(rows[:, 2: L - 2]) == (rows[:, L - 2].astype(np.uint16) | (rows[:, L - 1].astype(np.uint16) << 8))
+        good = cand[ok]
+        if len(good) > 1 and (np.diff(good) < L).any(): # Sync word inside samples passed the CRC
+            keep = [0]
+            for i in range(1, len(good)):
+                if good[i] >= good[keep[-1]] + L:
+                    keep.append(i)
+            good, rows = good[keep], rows[ok][keep]
+        else:
+            rows = rows[ok]
+        # Candidates with a wrong CRC not inside a good frame
+        bad = cand[~ok]
+        inside = np.searchsorted(good, bad, side='right') - 1
+        self.corrupted += int(np.count_nonzero((inside < 0) | (bad >= good[np.maximum(inside, 0)] + L))) if len(good) \
+            else len(bad)
+        end = good[-1] + L if len(good) else 0
+        # Keep the first frame not complete yet (or a sync word split between chunks), however many chunks it spans
+        pending = syncs[(syncs + L > len(a)) & (syncs >= end)]
+        if len(pending):
+            self.carry = buf[pending[0]:]
+        elif len(a) > end and a[-1] == self.sync[0]:
+            self.carry = buf[-1:]
+        else:
+            self.carry = b''
+        self.rest = buf[end:] if len(good) else (self.rest + bytes(chunk))[-4096:]
+        self.gaps = []
+        if len(good) == 0:
+            return np.zeros((self.channels, 0), dtype=np.int64), 0
+        values = self._unpack(rows[:, 4: L - 2])
+        sequence = rows[:, 2].astype(np.int64) | (rows[:, 3].astype(np.int64) << 8)
+        previous = np.concatenate(([sequence[0] - 1 if self.lastSequence is None else self.lastSequence], sequence[:-1]))
+        lost = (sequence - previous - 1) & 0xFFFF
+        restart = lost > MAX_GAP
+        self.restarts += int(np.count_nonzero(restart))
+        lost[restart] = 0
+        if self.lastValues is None:
+            lost[0] = 0
+        total = int(lost.sum())
+        if total and self.fill:
+            # Frame i is preceded by lost[i] copies of the frame before it
+            before = np.vstack((self.lastValues if self.lastValues is not None else values[:1], values))
+            counts = np.concatenate((lost, [0])) + np.concatenate(([0], np.ones(len(values), dtype=np.int64)))
+            out = np.repeat(before, counts, axis=0)
+            where = np.flatnonzero(lost)
+            offsets = where + np.concatenate(([0], np.cumsum(lost)))[where]
+            self.gaps = list(zip(offsets.tolist(), lost[where].tolist()))
+        else:
+            out = values
+            where = np.flatnonzero(lost)
+            self.gaps = list(zip(where.tolist(), lost[where].tolist()))
+        self.lastSequence = int(sequence[-1])
+        self.lastValues = values[-1:]
+        self.frames += len(values)
+        self.dropped += total
+        return out.T, total
+
+    # Samples of frames (frames, payload bytes) -> (frames, channels)
+    def _unpack(self, payload):
+        if self.bits == 16:
+            return payload.copy().view('<u2').astype(np.int64)
+        b = payload.reshape(len(payload), -1, 3).astype(np.int64)
+        s = np.empty((len(payload), 2*b.shape[1]), dtype=np.int64)
+        s[:, 0::2] = b[:, :, 0] | ((b[:, :, 1] & 0xF) << 8)
+        s[:, 1::2] = (b[:, :, 1] >> 4) | (b[:, :, 2] << 4)
+        return s[:, :self.channels]
+
+# Complete ASCII lines needed to go back from binary frames to text
+TEXT_LINES = 2
+
+# Parser for whatever the device sends: ASCII lines or binary frames (found by their sync word).
+# Switches when the device switches, also in the middle of a chunk; same interface as FrameParser.
+# Binary frames may be split over any number of chunks; binary mode is left only after TEXT_LINES
+# complete valid ASCII lines without frames (not on a stray newline byte in binary data).
+class ProtocolParser:
+    # Custom constructor
+    def __init__(self, channels=9, fill=True):
+        self.channels = channels
+        self.ascii = FrameParser(channels)
+        self.binary = {bits: BinaryParser(channels, bits, fill) for bits in SYNC}
+        self.protocol = None # Detected protocol: 'ascii', 'binary12', 'binary16', None - no data yet
+
+    # Good frames of all protocols
+    @property
+    def frames(self):
+        return self.ascii.frames + sum(p.frames for p in self.binary.values())
+
+    # Dropped or lost frames of all protocols
+    @property
+    def dropped(self):
+        return self.ascii.dropped + sum(p.dropped for p in self.binary.values())
+
+    # Binary parser of the detected protocol, None for ASCII
+    @property
+    def current(self):
+        return self.binary[int(self.protocol[6:])] if self.protocol and self.protocol != 'ascii' else None
+
+    # Forget partial frames (used on refresh)
+    def reset(self):
+        self.ascii.reset()
+        for p in self.binary.values():
+            p.reset()
+
+    # Bytes after the last binary frame are complete valid ASCII lines (device went back to text)
+    def _is_text(self, rest):
+        if b'\n' not in rest or np.frombuffer(rest, dtype=np.uint8).max() >= 0x80: # Sync words, most binary data
+            return False
+        lines = rest[rest.find(b'\n') + 1: rest.rfind(b'\n') + 1] # First line may be incomplete
+        data, bad = FrameParser(self.channels).parse(lines)
+        return bad == 0 and data.shape[1] >= TEXT_LINES
+
+    # Parse a chunk, returns (data, bad) like FrameParser.parse
+    def parse(self, chunk):
+        buf = bytes(chunk)
+        binary = self.current
+        if binary is not None:
+            data, bad = binary.parse(buf)
+            if data.shape[1] or not self._is_text(binary.rest):
+                return data, bad
+            # Text only: device is back to ASCII
+            text = binary.rest
+            binary.reset()
+            self.protocol = 'ascii'
+            return self.ascii.parse(text)
+        # ASCII never has bytes >= 0x80: a sync word starts binary frames (or is line noise).
+        # A parser holding an incomplete frame gets the whole chunk; otherwise bytes before the
+        # first sync word are text.
+        pending = [p for p in self.binary.values() if p.carry]
+        if pending and len(pending[0].carry) == 1: # Only the first byte of a sync word: detect again
+            buf = pending[0].carry + buf
+            pending[0].reset()
+            pending = []
+        if pending:
+            binary, start = pending[0], 0
+        else:
+            starts = sorted((buf.find(SYNC[bits]), bits) for bits in SYNC if SYNC[bits] in buf)
+            if buf[-1:] == SYNC[12][:1]: # Sync word split between chunks
+                starts.append((len(buf) - 1, 12))
+            if not starts:
+                data, bad = self.ascii.parse(buf)
+                if data.shape[1]:
+                    self.protocol = 'ascii'
+                return data, bad
+            binary, start = self.binary[starts[0][1]], starts[0][0]
+        held = binary.carry + buf[start:]
+        data, bad = binary.parse(buf[start:])
+        if data.shape[1]:
+            self.protocol = 'binary%d' % binary.bits
+            textData, textBad = self.ascii.parse(buf[:start])
+            self.ascii.reset()
+            for p in self.binary.values():
+                if p is not binary:
+                    p.reset()
+            return np.hstack((textData, data)), bad + textBad
+        # No frame yet: bytes no longer held as a possible frame start are text
+        text = buf[:start] + held[:len(held) - len(binary.carry)]
+        textData, textBad = self.ascii.parse(text)
+        if textData.shape[1]:
+            self.protocol = 'ascii'
+        return textData, textBad
@@ -0,0 +1,166 @@
+# Network publishing of raw data, filtered data and envelope as binary blocks (TCP, UDP or local socket)
+# Wire format and client: client.py
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+from .client import KINDS, HEADER, DTYPE, UDP_PAYLOAD, encode, parse_address
+
+# One connected client: its own bounded queue and sender thread, so a slow client only loses
+# its own oldest messages and never blocks acquisition
+class Subscription:
+    # Custom constructor
+    def __init__(self, sock, address, queueSize=256):
+        self.sock = sock
+        self.address = address
+        self.queue = deque(maxlen=queueSize) # Oldest message is dropped when full
+        self.ready = threading.Event()
+        self.running = True
+        self.sent = 0 # Messages sent
+        self.dropped = 0 # Messages dropped (queue full)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Queue message (called by the publishing thread)
+    def put(self, msg):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(msg)
+        self.ready.set()
+
+    # Sender thread
+    def run(self):
+        try:
+            while self.running:
+                self.ready.wait(0.5)
+                self.ready.clear()
+                while self.queue:
+                    self.sock.sendall(self.queue.popleft())
+                    self.sent += 1
+        except OSError:
+            pass
+        self.running = False
+        self.sock.close()
+
+    # Stop sender thread
+    def close(self):
+        self.running = False
+        self.ready.set()
+        self.thread.join(1)
+
+# Publishes blocks to every connected client of a TCP or Unix socket server ('tcp://host:port',
+# 'unix:///path'), or sends them as datagrams to a UDP destination ('udp://host:port', blocks are
+# split to fit a datagram). Every kind has its own sequence number; the first sample index and the
+# publish time (time.time()) are in every message.
+class Publisher:
+    # Custom constructor
+    def __init__(self, url='tcp://127.0.0.1:5555', kinds=KINDS, queueSize=256):
+        self.url = url
+        self.scheme, self.address = parse_address(url)
+        self.kinds = [KINDS.index(k) for k in kinds] # Published kinds
+        self.queueSize = queueSize # Messages queued per client
+        self.sequence = [0]*len(KINDS)
+        self.subscriptions = []
+        self.published = 0 # Messages published
+        self.bytesPublished = 0
+        self.udpDropped = 0 # Datagrams not sent (socket buffer full)
+        self.running = True
+        self.lock = threading.Lock()
+        if self.scheme == 'udp':
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.setblocking(False)
+            return
+        if self.scheme == 'unix':
+            if os.path.exists(self.address):
+                os.remove(self.address)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(self.address)
+        self.address = self.sock.getsockname() # Actual port when port 0 was given
+        self.sock.listen()
+        self.sock.settimeout(0.5)
+        self.thread = threading.Thread(target=self.accept, daemon=True)
+        self.thread.start()
+
+    # Accept thread
+    def accept(self):
+        while self.running:
+            try:
+                sock, address = self.sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            sock.settimeout(None)
+            if self.scheme == 'tcp':
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.lock:
+                self.subscriptions = [s for s in self.subscriptions if s.running]
+                self.subscriptions.append(Subscription(sock, address, self.queueSize))
+
+    # Connected clients
+    @property
+    def clients(self):
+        return sum(s.running for s in self.subscriptions)
+
+    # Messages dropped for slow clients
+    @property
+    def dropped(self):
+        return sum(s.dropped for s in self.subscriptions) + self.udpDropped
+
+    # Publish a block of samples: first - sample index of the first one, fs - sampling frequency,
+    # raw, filtered, envelope - (channels, N). Never blocks.
+    def publish(self, first, fs, raw, filtered, envelope):
+        now = time.time()
+        for kind, data in enumerate((raw, filtered, envelope)):
+            if kind in self.kinds:
+                self._send(kind, first, now, fs, data)
+
+    # Publish feature vectors (H, features, channels) of windows ending at sample index first,
+    # first + hop, ...; rate - feature vectors per second
+    def publish_features(self, first, rate, features):
+        kind = KINDS.index('features')
+        if kind in self.kinds:
+            self._send(kind, first, time.time(), rate, features.reshape(len(features), -1).T)
+
+    # Encode and queue (or send) one kind
+    def _send(self, kind, first, now, fs, data):
+        if self.scheme == 'udp':
+            step = max(1, (UDP_PAYLOAD - HEADER.size)//(data.shape[0]*DTYPE.itemsize))
+            for i in range(0, data.shape[1], step):
+                msg = encode(kind, self.sequence[kind], first + i, now, fs, data[:, i: i + step])
+                self.sequence[kind] += 1
+                try:
+                    self.sock.sendto(msg, self.address)
+                except (BlockingIOError, OSError):
+                    self.udpDropped += 1
+                    continue
+                self.published += 1
+                self.bytesPublished += len(msg)
+            return
+        msg = encode(kind, self.sequence[kind], first, now, fs, data)
+        self.sequence[kind] += 1
+        for s in self.subscriptions:
+            if s.running:
+                s.put(msg)
+        self.published += 1
+        self.bytesPublished += len(msg)
+
+    # Stop server and disconnect clients
+    def close(self):
+        self.running = False
+        self.sock.close()
+        with self.lock:
+            for s in self.subscriptions:
+                s.close()
+            self.subscriptions = []
+        if self.scheme == 'unix' and os.path.exists(self.url.partition('://')[2]):
+            os.remove(self.url.partition('://')[2])
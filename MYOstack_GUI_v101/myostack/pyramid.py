@@ -0,0 +1,191 @@
+# On-disk multi-resolution min/max/mean pyramid of a session for scrolling through long histories
+# Build for a recording: python -m myostack.pyramid <recording.txt|.myo> [<output.pyr>]
+#
+# A pyramid is a directory: meta.json and one file per level. Level k has a bin for every
+# base*factor^k samples, a bin is float32 (min, max, mean) of every column: file shape (bins, 3, columns).
+# Levels are appended while acquiring and memory-mapped by readers, so a view reads only the
+# bins it shows.
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+import numpy as np
+
+DTYPE = np.float32
+MIN, MAX, MEAN = 0, 1, 2 # Index of statistic in a bin
+
+# Level file name
+def level_path(path, k):
+    return os.path.join(path, "level%d.f32" % k)
+
+# Builds the pyramid from blocks (columns, N). Blocks are queued by write() and summarized by a
+# background thread (like Recorder), so acquisition never waits for the disk.
+class PyramidWriter:
+    # Custom constructor
+    def __init__(self, directory='.', columns=18, fs=500.0, base=8, factor=4, levels=8, path=None,
+                 queueSize=256, flushInterval=1.0, blocking=False, kind='processed'):
+        self.path = path or os.path.join(directory, datetime.now().strftime("%Y_%m_%d_%H_%M_%S") + '.pyr')
+        self.columns = columns
+        self.base = base # Samples per bin of level 0
+        self.factor = factor # Bins of a level per bin of the next one
+        self.levels = levels
+        self.flushInterval = flushInterval # Seconds between flushes to disk
+        self.blocking = blocking # Wait for free space in queue instead of dropping (offline building)
+        self.meta = {'columns': columns, 'fs': fs, 'base': base, 'factor': factor, 'levels': levels,
+                     'started': time.time(), 'samples': 0, 'kind': kind}
+        os.makedirs(self.path, exist_ok=True)
+        self._write_meta()
+        self.files = [open(level_path(self.path, k), 'wb') for k in range(levels)]
+        self.pending = np.zeros((columns, 0)) # Samples not filling a level 0 bin yet
+        self.pendingBins = [np.zeros((0, 3, columns), dtype=DTYPE) for k in range(levels)] # Bins not filling next level bin
+        self.samples = 0
+        self.droppedBlocks = 0
+        self.queue = queue.Queue(queueSize)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    # Queue block (columns, N). Returns False if dropped.
+    def write(self, block):
+        try:
+            self.queue.put(np.array(block), block=self.blocking)
+            return True
+        except queue.Full:
+            self.droppedBlocks += 1
+            return False
+
+    # Summarize remaining blocks and close files
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    # Store meta.json
+    def _write_meta(self):
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f, indent=1)
+
+    # Add block to level 0 and carry full bins to upper levels
+    def add(self, block):
+        data = np.hstack((self.pending, block))
+        n = data.shape[1]//self.base
+        self.pending = data[:, n*self.base:]
+        self.samples += block.shape[1]
+        if n == 0:
+            return
+        b = data[:, :n*self.base].reshape(self.columns, n, self.base)
+        bins = np.stack((b.min(axis=2), b.max(axis=2), b.mean(axis=2)), axis=1).transpose(2, 1, 0).astype(DTYPE)
+        for k in range(self.levels):
+            self.files[k].write(bins.tobytes())
+            if k + 1 == self.levels:
+                break
+            data = np.concatenate((self.pendingBins[k], bins))
+            n = len(data)//self.factor
+            self.pendingBins[k] = data[n*self.factor:]
+            if n == 0:
+                break
+            g = data[:n*self.factor].reshape(n, self.factor, 3, self.columns)
+            bins = np.stack((g[:, :, MIN].min(axis=1), g[:, :, MAX].max(axis=1), g[:, :, MEAN].mean(axis=1)), axis=1)
+
+    # Writer thread
+    def _run(self):
+        flushed = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flushInterval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if len(item):
+                self.add(item)
+            if time.monotonic() - flushed >= self.flushInterval:
+                for f in self.files:
+                    f.flush()
+                flushed = time.monotonic()
+        for f in self.files:
+            f.close()
+        self.meta['samples'] = self.samples
+        self._write_meta()
+
+# Reader of a pyramid (also while it is being written)
+class Pyramid:
+    # Custom constructor
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.columns = self.meta['columns']
+        self.fs = self.meta['fs']
+        self.base = self.meta['base']
+        self.factor = self.meta['factor']
+        self.levels = self.meta['levels']
+        self.maps = {} # Level -> memory map (remapped when the file grew)
+
+    # Samples per bin of level k
+    def bin_samples(self, k):
+        return self.base*self.factor**k
+
+    # Bins of level k, memory-mapped (bins, 3, columns)
+    def level(self, k):
+        size = os.path.getsize(level_path(self.path, k))//(3*self.columns*np.dtype(DTYPE).itemsize)
+        m = self.maps.get(k)
+        if m is None or len(m) != size:
+            if size == 0:
+                return np.zeros((0, 3, self.columns), dtype=DTYPE)
+            m = self.maps[k] = np.memmap(level_path(self.path, k), dtype=DTYPE, mode='r', shape=(size, 3, self.columns))
+        return m
+
+    # Duration of summarized data in s
+    @property
+    def duration(self):
+        return len(self.level(0))*self.base/self.fs
+
+    # Finest level showing seconds of data in at most `bins` bins
+    def choose_level(self, seconds, bins):
+        for k in range(self.levels):
+            if seconds*self.fs/self.bin_samples(k) <= bins:
+                return k
+        return self.levels - 1
+
+    # Bins covering [start, end] seconds with at most about `pixels` bins: returns (t, data),
+    # t - (n,) bin start times in s, data - (n, 3, len(columns)) copied from the mapped level
+    def query(self, start, end, pixels, columns=None):
+        k = self.choose_level(max(end - start, 0), max(pixels, 1))
+        size = self.bin_samples(k)
+        level = self.level(k)
+        i0 = max(0, int(np.floor(start*self.fs/size)))
+        i1 = min(len(level), int(np.ceil(end*self.fs/size)) + 1)
+        if i1 <= i0:
+            return np.zeros(0), np.zeros((0, 3, self.columns if columns is None else len(columns)))
+        data = np.array(level[i0: i1] if columns is None else level[i0: i1][:, :, columns])
+        return (i0 + np.arange(i1 - i0))*size/self.fs, data
+
+# Min/max bins as one curve (like min/max decimation): x, y of length 2n
+def envelope_curve(t, data, column):
+    x = np.repeat(t, 2)
+    y = np.stack((data[:, MIN, column], data[:, MAX, column]), axis=1).reshape(-1)
+    return x, y
+
+# Build a pyramid of the samples of a recording
+def build(recording, path=None, **kwargs):
+    from .recorder import file_info, read_blocks
+    channels, fs = file_info(recording)
+    path = path or os.path.splitext(recording)[0] + '.pyr'
+    writer = PyramidWriter(columns=channels, fs=fs, path=path, blocking=True, kind='raw', **kwargs)
+    for t, block in read_blocks(recording):
+        writer.write(block)
+    writer.close()
+    return path
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python -m myostack.pyramid <recording.txt|.myo> [<output.pyr>]")
+        sys.exit(1)
+    print("Written:", build(*sys.argv[1:]))
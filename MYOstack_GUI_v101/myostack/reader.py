@@ -0,0 +1,73 @@
+# Serial port reader: blocking sized reads with timeout, chunks delivered through a deque
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import time
+
+from .sources import Source
+
+# Names of available serial ports
+def list_ports():
+    import serial.tools.list_ports
+    return [port.device for port in serial.tools.list_ports.comports(include_links=False)]
+
+# Device of the last serial port found, '' if there is none
+def find_port():
+    ports = list_ports()
+    return ports[-1] if ports else ''
+
+# Reads serial data without busy-waiting. read() blocks until chunkSize bytes arrived or
+# timeout elapsed, so chunks are size- or time-bounded. The consumer drains them at its own
+# rate with take() (see Source).
+class SerialReader(Source):
+    # Custom constructor
+    def __init__(self, COM='', baudRate=1000000, chunkSize=4096, timeout=0.02, maxChunks=1024):
+        Source.__init__(self, maxChunks)
+        self.COM = COM # Port name, '' - use first port found
+        self.baudRate = baudRate
+        self.chunkSize = chunkSize # Maximum bytes per chunk
+        self.timeout = timeout # Maximum time per chunk in s
+        self.ser = None
+
+    # True if port is open
+    @property
+    def connected(self):
+        return self.ser is not None
+
+    # Try to open the port once, returns True if it is open
+    def open(self):
+        import serial
+        if self.ser is not None:
+            return True
+        port = find_port() if self.COM == '' else (self.COM if self.COM in list_ports() else '')
+        if port == '':
+            return False
+        time.sleep(0.5)
+        self.COM = port
+        self.ser = serial.Serial(port, self.baudRate, timeout=self.timeout)
+        return True
+
+    # Wait for the port to appear and open it
+    def connect(self, scanInterval=0.5):
+        while not self.open():
+            time.sleep(scanInterval)
+
+    # One blocking read (returns after chunkSize bytes or timeout), queues chunk; returns its size
+    def read(self):
+        msg = self.ser.read(max(self.chunkSize, self.ser.in_waiting))
+        if msg:
+            self.push(msg)
+        return len(msg)
+
+    # Send command bytes to the device
+    def write(self, data):
+        if self.ser is not None:
+            self.ser.write(data)
+
+    # Stop and close port
+    def close(self):
+        self.stop()
+        if self.ser is not None:
+            self.ser.close()
+            self.ser = None
@@ -0,0 +1,200 @@
+# Recording of MYOstack data: background writer thread, text and binary file formats
+# Convert between formats: python -m myostack.recorder <source> <destination>
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import os
+import sys
+import queue
+import struct
+import threading
+import time
+from datetime import datetime
+from itertools import islice
+import numpy as np
+
+# Binary format: 64 byte header (magic, channels, fs, time of first sample) + float32 frames (N, channels)
+BIN_MAGIC = b'MYOSTK01'
+BIN_HEADER = struct.Struct('<8sIdd')
+BIN_HEADER_SIZE = 64
+BIN_DTYPE = np.float32
+
+FORMATS = {'txt': '.txt', 'bin': '.myo'} # Format name -> file extension
+
+# Format of file by extension
+def file_format(path):
+    return 'bin' if path.endswith(FORMATS['bin']) else 'txt'
+
+# Text format head (same as GUI data file)
+def txt_header(channels, now=None):
+    now = now or datetime.now()
+    head = now.strftime("Date: %Y.%m.%d\rTime: %H:%M:%S") + "\r\n"
+    names = " | ".join("data%d" % (i + 1) for i in range(channels))
+    return head + "File format: \r\nseconds | " + names + " \r\n"
+
+# Write block of samples: t - (N,) seconds, block - (channels, N)
+def write_block(f, fmt, t, block):
+    if fmt == 'bin':
+        f.write(np.ascontiguousarray(block.T, dtype=BIN_DTYPE).tobytes())
+    else:
+        rows = np.column_stack((t, block.T))
+        np.savetxt(f, rows, fmt=['%.3f'] + ['%.10g']*block.shape[0], newline='\r\n')
+
+# Open file for writing and write its header
+def open_writer(path, fmt, channels, fs, t0=0.0):
+    f = open(path, 'wb')
+    if fmt == 'bin':
+        f.write(BIN_HEADER.pack(BIN_MAGIC, channels, fs, t0).ljust(BIN_HEADER_SIZE, b'\0'))
+    else:
+        f.write(txt_header(channels).encode())
+    return f
+
+# Binary file header: (channels, fs, t0)
+def read_bin_header(path):
+    with open(path, 'rb') as f:
+        magic, channels, fs, t0 = BIN_HEADER.unpack(f.read(BIN_HEADER.size))
+    if magic != BIN_MAGIC:
+        raise ValueError("Not a MYOstack binary file: " + path)
+    return channels, fs, t0
+
+# Memory-mapped binary recording, shape (N, channels), and its header
+def open_bin(path):
+    channels, fs, t0 = read_bin_header(path)
+    frames = (os.path.getsize(path) - BIN_HEADER_SIZE)//(channels*np.dtype(BIN_DTYPE).itemsize)
+    data = np.memmap(path, dtype=BIN_DTYPE, mode='r', offset=BIN_HEADER_SIZE, shape=(frames, channels))
+    return data, channels, fs, t0
+
+# Read recording in blocks: yields (t, block), t - (N,) seconds, block - (channels, N)
+def read_blocks(path, chunk=10000):
+    if file_format(path) == 'bin':
+        data, channels, fs, t0 = open_bin(path)
+        for i in range(0, len(data), chunk):
+            block = np.asarray(data[i: i + chunk], dtype=np.float64).T
+            yield t0 + (i + np.arange(block.shape[1]))/fs, block
+        return
+    with open(path, 'rb') as f:
+        lines = (line for line in f if line[:1].isdigit())
+        while True:
+            part = list(islice(lines, chunk))
+            if not part:
+                return
+            rows = [np.fromstring(line, sep=' ') for line in part]
+            width = max(len(r) for r in rows)
+            rows = np.array([r for r in rows if len(r) == width])
+            yield rows[:, 0], rows[:, 1:].T
+
+# Channels and sampling frequency of a recording (text files: estimated from time column)
+def file_info(path):
+    if file_format(path) == 'bin':
+        channels, fs, t0 = read_bin_header(path)
+        return channels, fs
+    for t, block in read_blocks(path, chunk=1000):
+        fs = (len(t) - 1)/(t[-1] - t[0]) if len(t) > 1 and t[-1] > t[0] else 500.0
+        return block.shape[0], fs
+    return 0, 500.0
+
+# Convert recording between text and binary formats (by extension)
+def convert(src, dst, chunk=10000):
+    channels, fs = file_info(src)
+    fmt = file_format(dst)
+    f = None
+    try:
+        for t, block in read_blocks(src, chunk):
+            if f is None:
+                f = open_writer(dst, fmt, channels, fs, t[0])
+            write_block(f, fmt, t, block)
+    finally:
+        if f is not None:
+            f.close()
+
+# Recorder: blocks are queued by acquisition and written by a background thread.
+# write() never blocks (unless blocking=True): when the queue is full the block is dropped and counted.
+# Files are created when the first block arrives (binary header needs its time).
+class Recorder:
+    # Custom constructor
+    def __init__(self, fmt='txt', channels=9, fs=500.0, directory='.', queueSize=256,
+                 flushInterval=1.0, rotateBytes=None, rotateSeconds=None, suffix='', path=None, blocking=False):
+        self.fmt = fmt
+        self.channels = channels
+        self.fs = fs
+        self.directory = directory
+        self.flushInterval = flushInterval # Seconds between flushes to disk
+        self.rotateBytes = rotateBytes # Start new file after this size (None - never)
+        self.rotateSeconds = rotateSeconds # Start new file after this time (None - never)
+        self.suffix = suffix # Added to generated file names
+        self.path = path # Name of the first file (None - generated from date and time)
+        self.blocking = blocking # Wait for free space in queue instead of dropping (offline processing)
+        self.queue = queue.Queue(queueSize)
+        self.files = [] # Paths of written files
+        self.droppedBlocks = 0
+        self.writtenSamples = 0
+        self.f = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    # Queue block for writing: t - (N,) seconds, block - (channels, N). Returns False if dropped.
+    def write(self, t, block):
+        try:
+            self.queue.put((np.array(t), np.array(block)), block=self.blocking)
+            return True
+        except queue.Full:
+            self.droppedBlocks += 1
+            return False
+
+    # Write remaining blocks and close file
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    # New file named by the current date and time, t0 - time of its first sample
+    def _open(self, t0):
+        if self.path is not None and not self.files:
+            path = self.path
+        else:
+            name = datetime.now().strftime("%Y_%m_%d_%H_%M_%S") + self.suffix
+            path = os.path.join(self.directory, name + FORMATS[self.fmt])
+            k = 1
+            while path in self.files or os.path.exists(path):
+                path = os.path.join(self.directory, "%s_%d%s" % (name, k, FORMATS[self.fmt]))
+                k += 1
+        self.f = open_writer(path, self.fmt, self.channels, self.fs, t0)
+        self.files.append(path)
+        self.opened = time.monotonic()
+
+    # Writer thread
+    def _run(self):
+        flushed = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flushInterval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                t, block = item
+                if self.f is None or self._rotate_due():
+                    if self.f is not None:
+                        self.f.close()
+                    self._open(t[0])
+                write_block(self.f, self.fmt, t, block)
+                self.writtenSamples += block.shape[1]
+            if self.f is not None and time.monotonic() - flushed >= self.flushInterval:
+                self.f.flush()
+                flushed = time.monotonic()
+        if self.f is not None:
+            self.f.close()
+
+    # True if current file should be closed and a new one started
+    def _rotate_due(self):
+        if self.rotateBytes is not None and self.f.tell() >= self.rotateBytes:
+            return True
+        return self.rotateSeconds is not None and time.monotonic() - self.opened >= self.rotateSeconds
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python -m myostack.recorder <source.txt|.myo> <destination.txt|.myo>")
+        sys.exit(1)
+    convert(sys.argv[1], sys.argv[2])
@@ -0,0 +1,72 @@
+# Rendering helpers (Qt-free): min/max decimation, change tracking and frame rate counter
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import time
+import numpy as np
+
+# Decimate curves to ~2 points per pixel keeping the min and the max of every pixel column
+# (spikes stay visible). x - (N,), y - (N,) or (channels, N). Returns x, y shaped like y.
+def minmax_decimate(x, y, pixels):
+    y = np.asarray(y)
+    single = y.ndim == 1
+    if single:
+        y = y[None, :]
+    n = y.shape[1]
+    if pixels <= 0 or n <= 2*pixels:
+        return (x, y[0]) if single else (np.broadcast_to(x, y.shape), y)
+    k = -(-n//pixels) # Samples per pixel column
+    m = (n//k)*k
+    parts = [y[:, :m].reshape(y.shape[0], -1, k)]
+    starts = [np.arange(0, m, k)]
+    if m < n:
+        parts.append(y[:, m:][:, None, :])
+        starts.append(np.array([m]))
+    xs = []
+    ys = []
+    for part, start in zip(parts, starts):
+        imin = part.argmin(axis=2)
+        imax = part.argmax(axis=2)
+        first = np.minimum(imin, imax) + start # Keep time order inside the column
+        second = np.maximum(imin, imax) + start
+        index = np.stack((first, second), axis=2).reshape(y.shape[0], -1)
+        xs.append(index)
+        ys.append(np.take_along_axis(y, index, axis=1))
+    index = np.hstack(xs)
+    yd = np.hstack(ys)
+    xd = np.asarray(x)[index]
+    return (xd[0], yd[0]) if single else (xd, yd)
+
+# Remembers the last key of every named item, so unchanged items are not redrawn
+class ChangeTracker:
+    # Custom constructor
+    def __init__(self):
+        self.keys = {}
+
+    # True (and remembers key) if key differs from the last one of this item
+    def changed(self, name, key):
+        if name in self.keys and np.array_equal(self.keys[name], key):
+            return False
+        self.keys[name] = key
+        return True
+
+    # Forget everything (next changed() is always True)
+    def reset(self):
+        self.keys.clear()
+
+# Achieved frame rate (exponential average)
+class FpsCounter:
+    # Custom constructor
+    def __init__(self, alpha=0.9):
+        self.alpha = alpha
+        self.fps = 0.0
+        self.last = None
+
+    # Call once per drawn frame, returns current fps
+    def tick(self):
+        now = time.perf_counter()
+        if self.last is not None and now > self.last:
+            self.fps = self.alpha*self.fps + (1 - self.alpha)/(now - self.last) if self.fps else 1/(now - self.last)
+        self.last = now
+        return self.fps
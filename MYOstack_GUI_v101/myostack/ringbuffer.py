@@ -0,0 +1,58 @@
+# Preallocated multi-channel ring buffer with a zero-copy time-ordered view
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import numpy as np
+
+# Rows x size ring buffer. Every sample is stored twice (at i and i + size), so the
+# last `size` samples are always one contiguous slice: view() never copies.
+class RingBuffer:
+    # Custom constructor
+    def __init__(self, rows, size, dtype=np.float64):
+        self.rows = rows
+        self.size = size
+        self.buf = np.zeros((rows, 2*size), dtype=dtype)
+        self.pos = 0 # Next write index, also index of the oldest sample
+        self.count = 0 # Samples appended since the last refresh
+
+    # Clear buffer (same semantics as GUI.refresh: zero data, start from the beginning)
+    def refresh(self):
+        self.buf[:] = 0
+        self.pos = 0
+        self.count = 0
+
+    # Number of valid samples in the window
+    @property
+    def filled(self):
+        return min(self.count, self.size)
+
+    # Append block (rows, n), cost is O(n)
+    def append(self, block):
+        n = block.shape[1]
+        self.count += n
+        if n >= self.size:
+            block = block[:, n - self.size:]
+            self.buf[:, :self.size] = block
+            self.buf[:, self.size:] = block
+            self.pos = 0
+            return
+        first = min(n, self.size - self.pos)
+        self.buf[:, self.pos: self.pos + first] = block[:, :first]
+        self.buf[:, self.pos + self.size: self.pos + self.size + first] = block[:, :first]
+        rest = n - first
+        if rest:
+            self.buf[:, :rest] = block[:, first:]
+            self.buf[:, self.size: self.size + rest] = block[:, first:]
+        self.pos = (self.pos + n) % self.size
+
+    # Time-ordered window (oldest first) of the selected rows, zero-copy, read-only use
+    def view(self, rows=slice(None)):
+        return self.buf[rows, self.pos: self.pos + self.size]
+
+    # Overwrite the last data.shape[-1] samples of the selected rows
+    def write_last(self, rows, data):
+        m = data.shape[-1]
+        idx = (self.pos + np.arange(self.size - m, self.size)) % self.size
+        self.buf[rows, idx] = data
+        self.buf[rows, idx + self.size] = data
@@ -0,0 +1,112 @@
+# Validated acquisition and display settings with change notification and profile files
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import json
+
+GAINS = range(1, 12) # Valid sensor gains
+
+# Settings of a session. Values change only through update(), which validates them (ValueError,
+# nothing is changed) and tells listeners which names changed, so processing stages rebuild
+# coefficients and gain vectors only then and nothing is re-read or redesigned per block or frame.
+class Settings:
+    # Custom constructor
+    def __init__(self, channels=9):
+        self.channels = channels
+        self.notch50 = False # Notch filters 50 Hz and harmonics
+        self.notch60 = False # Notch filters 60 Hz and harmonics
+        self.bandpass = False # Bandpass filter enabled
+        self.low = 10.0 # Bandpass low frequency in Hz
+        self.high = 200.0 # Bandpass high frequency in Hz
+        self.alpha = 0.95 # Envelope smoothing, 0..1
+        self.gains = [1.0]*channels # Sensor gains, index is the sensor number - 1
+        self.fftChannel = 0 # Sensor of the spectrum plot (index)
+        self.showSignal = True
+        self.showEnvelope = False
+        self.listeners = [] # Callables (settings, changed names) called after every change
+
+    # Effective bandpass (low, high) or None. Showing signal and envelope together also filters
+    # (as the GUI always did).
+    @property
+    def band(self):
+        if (self.bandpass or (self.showSignal and self.showEnvelope)) and 0 < self.low < self.high:
+            return (self.low, self.high)
+        return None
+
+    # Validated value of a setting
+    def _check(self, name, value):
+        if name in ('notch50', 'notch60', 'bandpass', 'showSignal', 'showEnvelope'):
+            return bool(value)
+        if name in ('low', 'high'):
+            value = float(value)
+            if not value > 0:
+                raise ValueError("Frequency must be positive: %r" % value)
+            return value
+        if name == 'alpha':
+            value = float(value)
+            if not 0 <= value <= 1:
+                raise ValueError("Envelope smoothing must be in 0..1: %r" % value)
+            return value
+        if name == 'gains':
+            value = [float(g) for g in value]
+            if len(value) != self.channels or any(g not in GAINS for g in value):
+                raise ValueError("Gains must be %d values of 1..11" % self.channels)
+            return value
+        if name == 'fftChannel':
+            value = int(value)
+            if not 0 <= value < self.channels:
+                raise ValueError("No sensor %d" % (value + 1))
+            return value
+        raise KeyError("Unknown setting: " + name)
+
+    # Change settings, notify listeners of changed ones; returns set of changed names
+    def update(self, **values):
+        checked = {name: self._check(name, value) for name, value in values.items()}
+        changed = {name for name, value in checked.items() if getattr(self, name) != value}
+        for name in changed:
+            setattr(self, name, checked[name])
+        if changed:
+            for listener in self.listeners:
+                listener(self, changed)
+        return changed
+
+    # Gain of one sensor (number from 1)
+    def set_gain(self, sensor, gain):
+        if not 1 <= sensor <= self.channels:
+            raise ValueError("No sensor %d" % sensor)
+        gains = list(self.gains)
+        gains[sensor - 1] = gain
+        return self.update(gains=gains)
+
+    # Settings as a dictionary (profile)
+    def to_dict(self):
+        return {name: getattr(self, name) for name in ('notch50', 'notch60', 'bandpass', 'low', 'high', 'alpha',
+                                                       'gains', 'fftChannel', 'showSignal', 'showEnvelope')}
+
+    # Save profile (JSON)
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    # Load profile (JSON); unknown names are ignored, gains of a profile for another number of
+    # sensors are used as far as they go. Returns set of changed names.
+    def load(self, path):
+        with open(path) as f:
+            values = json.load(f)
+        values = {name: value for name, value in values.items() if name in self.to_dict()}
+        if 'gains' in values:
+            values['gains'] = (list(values['gains']) + self.gains)[:self.channels]
+        return self.update(**values)
+
+    # Keep a processor configured: applied now and after every relevant change
+    def attach(self, processor):
+        def apply(settings, changed):
+            if changed & {'notch50', 'notch60', 'bandpass', 'low', 'high', 'alpha', 'showSignal', 'showEnvelope'}:
+                processor.configure(self.notch50, self.notch60, self.band, self.alpha)
+            if 'gains' in changed:
+                processor.set_gain(self.gains)
+            if 'fftChannel' in changed:
+                processor.fftChannel = self.fftChannel
+        apply(self, set(self.to_dict()))
+        self.listeners.append(apply)
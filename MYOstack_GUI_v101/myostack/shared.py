@@ -0,0 +1,223 @@
+# Processor ring buffer in shared memory: local processes map live raw data, filtered data and
+# envelope as NumPy arrays without any copy or message passing
+#
+#   from myostack.shared import SharedReader
+#   reader = SharedReader('myostack')
+#   while True:
+#       first, data, lost = reader.read_new() # data: (3*channels, n), rows raw, filtered, envelope
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import os
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+from .ringbuffer import RingBuffer
+
+MAGIC = 0x4D594F53 # 'MYOS'
+VERSION = 2
+# Header: int64 slots (fs is a float64 in its slot), owner - process id of the writer
+H_MAGIC, H_VERSION, H_ROWS, H_SIZE, H_CHANNELS, H_SEQUENCE, H_COUNT, H_POS, H_FS, H_OWNER = range(10)
+HEADER_SLOTS = 16
+
+# Attach to an existing block without letting this process' resource tracker remove it at exit
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError: # Python < 3.13: no tracking parameter
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            return shared_memory.SharedMemory(name)
+        finally:
+            resource_tracker.register = register
+
+# Block `name` is still written by a running process (not left by a crashed session)
+def _in_use(name):
+    try:
+        shm = _attach(name)
+    except FileNotFoundError:
+        return False
+    owner = None
+    if shm.size >= 8*HEADER_SLOTS:
+        header = shm.buf[:8*HEADER_SLOTS].cast('q')
+        if header[H_MAGIC] == MAGIC and header[H_VERSION] == VERSION:
+            owner = header[H_OWNER]
+        header.release()
+    shm.close()
+    if owner is None: # Not ours: leave it alone
+        return True
+    if os.name == 'nt': # Blocks disappear with their last handle: an existing one is in use
+        return True
+    try:
+        os.kill(owner, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+# Header (int64 memoryview: item access is much cheaper than NumPy scalars), fs (float64 memoryview)
+# and data array over a shared memory block
+def _arrays(shm, rows=None, size=None):
+    header = shm.buf[:8*HEADER_SLOTS].cast('q')
+    fs = shm.buf[8*H_FS: 8*H_FS + 8].cast('d')
+    if rows is None:
+        rows, size = header[H_ROWS], header[H_SIZE]
+    data = np.ndarray((rows, 2*size), dtype=np.float64, buffer=shm.buf, offset=8*HEADER_SLOTS)
+    return header, fs, data
+
+# RingBuffer whose storage is a named shared memory block (single writer). Every change is framed by
+# a sequence counter (seqlock): odd while writing, so readers detect and retry torn copies without
+# any lock, and the writer never waits for readers. A block left by a crashed session is replaced;
+# if another running writer owns `name`, '<name>_<pid>' is used instead (see `name`).
+class SharedRingBuffer(RingBuffer):
+    # Custom constructor
+    def __init__(self, rows, size, name='myostack', channels=None, fs=500.0):
+        self.rows = rows
+        self.size = size
+        self.pos = 0
+        self.count = 0
+        length = 8*(HEADER_SLOTS + 2*rows*size)
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=length)
+        except FileExistsError:
+            if _in_use(name):
+                name = '%s_%d' % (name, os.getpid())
+            else: # Left by a crashed session (attached with tracking: unlink() unregisters it)
+                old = shared_memory.SharedMemory(name)
+                old.close()
+                old.unlink()
+            self.shm = shared_memory.SharedMemory(name, create=True, size=length)
+        self.name = name # Name readers attach to
+        self.header, self.fs, self.buf = _arrays(self.shm, rows, size)
+        self.buf[:] = 0
+        for i, value in ((H_MAGIC, MAGIC), (H_VERSION, VERSION), (H_ROWS, rows), (H_SIZE, size),
+                         (H_CHANNELS, channels or rows), (H_SEQUENCE, 0), (H_COUNT, 0), (H_POS, 0),
+                         (H_OWNER, os.getpid())):
+            self.header[i] = value
+        self.set_fs(fs)
+
+    # Sampling frequency shown to readers
+    def set_fs(self, fs):
+        self.fs[0] = fs
+
+    # Begin and end of a change (sequence odd in between)
+    def _begin(self):
+        self.header[H_SEQUENCE] += 1
+
+    def _end(self):
+        self.header[H_COUNT] = self.count
+        self.header[H_POS] = self.pos
+        self.header[H_SEQUENCE] += 1
+
+    def refresh(self):
+        self._begin()
+        RingBuffer.refresh(self)
+        self._end()
+
+    def append(self, block):
+        self._begin()
+        RingBuffer.append(self, block)
+        self._end()
+
+    def write_last(self, rows, data):
+        self._begin()
+        RingBuffer.write_last(self, rows, data)
+        self._end()
+
+    # Release and remove the block (readers keep their mapping until they close)
+    def close(self):
+        if self.buf is None:
+            return
+        self.header.release()
+        self.fs.release()
+        self.buf = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError: # Already removed by someone else
+            pass
+
+# Reader of a SharedRingBuffer from any local process. view() maps the window with no copy;
+# latest() and read_new() return consistent copies (retried while the writer is changing the data).
+class SharedReader:
+    # Custom constructor
+    def __init__(self, name='myostack'):
+        self.shm = _attach(name)
+        self.header, self.fsView, self.buf = _arrays(self.shm)
+        if self.header[H_MAGIC] != MAGIC:
+            raise ValueError("Not a MYOstack shared buffer: " + name)
+        self.rows = self.header[H_ROWS]
+        self.size = self.header[H_SIZE]
+        self.channels = self.header[H_CHANNELS]
+        self.RAW = slice(0, self.channels)
+        self.FILTERED = slice(self.channels, 2*self.channels)
+        self.ENVELOPE = slice(2*self.channels, 3*self.channels)
+        self.next = self.header[H_COUNT] # Next sample index for read_new()
+        self.retries = 0 # Copies repeated because the writer was active
+
+    # Samples written since the last refresh
+    @property
+    def count(self):
+        return self.header[H_COUNT]
+
+    # Sampling frequency
+    @property
+    def fs(self):
+        return self.fsView[0]
+
+    # Current window (rows, size), oldest first, zero-copy: values change while the writer runs
+    def view(self, rows=slice(None)):
+        pos = self.header[H_POS]
+        return self.buf[rows, pos: pos + self.size]
+
+    # Consistent copy of samples [start, count) of the window: returns (start, data)
+    def _copy(self, start, rows):
+        while True:
+            sequence = self.header[H_SEQUENCE]
+            if sequence % 2 == 0:
+                count, pos = self.header[H_COUNT], self.header[H_POS]
+                start = min(max(start, count - self.size, 0), count)
+                data = self.buf[rows, pos + self.size - (count - start): pos + self.size].copy()
+                if self.header[H_SEQUENCE] == sequence:
+                    return start, data
+            self.retries += 1
+            time.sleep(0)
+
+    # Last n samples: (index of the first one, data (rows, n))
+    def latest(self, n, rows=slice(None)):
+        return self._copy(self.count - min(n, self.size), rows)
+
+    # Samples written since the previous call: (first, data, lost), lost - samples overwritten
+    # before they were read (reader too slow) or -1 after a refresh
+    def read_new(self, rows=slice(None)):
+        count = self.count
+        lost = 0
+        if count < self.next: # Writer refreshed
+            self.next = 0
+            lost = -1
+        first, data = self._copy(self.next, rows)
+        if lost == 0:
+            lost = first - self.next
+        self.next = first + data.shape[1]
+        return first, data, lost
+
+    # Wait until new samples are written, returns False on timeout
+    def wait(self, timeout=1.0, interval=0.001):
+        end = time.perf_counter() + timeout
+        while self.count == self.next:
+            if time.perf_counter() >= end:
+                return False
+            time.sleep(interval)
+        return True
+
+    # Unmap block
+    def close(self):
+        self.header.release()
+        self.fsView.release()
+        self.buf = None
+        self.shm.close()
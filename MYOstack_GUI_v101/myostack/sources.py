@@ -0,0 +1,293 @@
+# Data sources: common chunk queue interface, simulated MYOstack device and recording replay
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import io
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+
+from .parser import ADC_TO_MV
+from .protocol import COMMANDS, encode_binary, frame_size
+
+# Encode ADC counts (channels, N) as the device does: "v1;v2;...;v9\r\n" per frame
+def encode_ascii(counts):
+    out = io.BytesIO()
+    np.savetxt(out, np.asarray(counts).T, fmt='%d', delimiter=';', newline='\r\n')
+    return out.getvalue()
+
+# Base of all sources. A source produces raw device bytes in a background thread (read()
+# is called in a loop) and queues them in a deque (append and popleft are atomic, no lock
+# is needed); the consumer waits for dataReady and drains the queue with take().
+class Source:
+    # Custom constructor
+    def __init__(self, maxChunks=1024):
+        self.COM = '' # Source name shown in GUI
+        self.baudRate = 0
+        self.protocol = None # Protocol requested when opened ('binary12', 'binary16', 'ascii'), None - device default
+        self.maxChunks = maxChunks # Queue capacity in chunks
+        self.chunks = deque()
+        self.dataReady = threading.Event() # Set when a chunk is queued
+        self.pendingSince = None # Time (perf_counter) of the oldest chunk not taken yet
+        self.running = False
+        self.finished = False # True when a finite source has no more data
+        self.thread = None
+        self.metrics = None # Metrics receiving 'read' timing (set by Pipeline)
+        # Counters
+        self.bytesRead = 0
+        self.chunksRead = 0
+        self.overruns = 0 # Chunks dropped because the consumer did not keep up (queue full)
+        self.backpressure = 0 # Chunks queued while the queue was more than half full
+        self.maxDepth = 0 # Maximum queue depth seen
+
+    # Prepare source, returns True when it can be read
+    def open(self):
+        return True
+
+    # Produce data (must block or sleep for a while), returns number of bytes
+    def read(self):
+        raise NotImplementedError
+
+    # Queue chunk for the consumer; size - device bytes it stands for (default len(msg))
+    def push(self, msg, size=None):
+        depth = len(self.chunks)
+        if depth >= self.maxChunks:
+            self.overruns += 1
+            return
+        if depth > self.maxChunks//2:
+            self.backpressure += 1
+        if depth == 0:
+            self.pendingSince = time.perf_counter()
+        self.maxDepth = max(self.maxDepth, depth + 1)
+        self.chunks.append(msg)
+        self.bytesRead += len(msg) if size is None else size
+        self.chunksRead += 1
+        self.dataReady.set()
+
+    # All queued data as one bytes object (consumer side)
+    def take(self):
+        self.dataReady.clear()
+        parts = []
+        while True:
+            try:
+                parts.append(self.chunks.popleft())
+            except IndexError:
+                return b''.join(parts)
+
+    # Queue depth in chunks
+    @property
+    def depth(self):
+        return len(self.chunks)
+
+    # Ask the device for the requested protocol. A device that does not know it keeps sending ASCII
+    # (the parser detects what arrives).
+    def negotiate(self):
+        if self.protocol is not None:
+            self.write(COMMANDS[self.protocol])
+
+    # Read loop
+    def run(self):
+        while self.running and not self.open():
+            time.sleep(0.5)
+        self.negotiate()
+        while self.running and not self.finished:
+            t0 = time.perf_counter()
+            self.read()
+            if self.metrics is not None:
+                self.metrics.time('read', t0) # Includes waiting for data
+
+    # Start read loop in a background thread
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Stop read loop
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    # Send command bytes to the device (ignored by sources without a device)
+    def write(self, data):
+        pass
+
+    # Stop and release resources
+    def close(self):
+        self.stop()
+
+# Paced source: produces frames at fs*speed in real time (speed 0 or None - as fast as possible).
+# Speaks the device protocols: ASCII lines by default, binary frames after a protocol command
+# (unless binary is False, like old firmware). With baudRate the serial link is emulated: frames
+# that do not fit into it are dropped, as by the device when its transmit buffer is full.
+class PacedSource(Source):
+    # Custom constructor
+    def __init__(self, fs=500.0, speed=1.0, interval=0.01, chunkSize=(64, 512), maxFrames=2000, seed=0,
+                 baudRate=None, binary=True):
+        Source.__init__(self)
+        self.baudRate = baudRate or 0
+        self.binary = binary # Device understands protocol commands
+        self.encoding = 'ascii' # Protocol of produced bytes
+        self.sequence = 0 # Frame counter of binary frames
+        self.bytesSent = 0 # Bytes that went through the emulated link
+        self.framesLost = 0 # Frames dropped by the emulated link
+        self.framesLostBefore = 0 # Of them before the first frame sent and after the last one sent
+        self.framesLostAfter = 0 # (no gap a receiver can see)
+        self.framesSent = 0 # Frames that went through the emulated link
+        self.fs = fs
+        self.speed = speed
+        self.interval = interval # Time between reads in s
+        self.chunkSize = chunkSize # Range of bytes per pushed chunk, like USB serial transfers
+        self.maxFrames = maxFrames # Frames per read at maximum speed
+        self.rng = np.random.default_rng(seed)
+        self.frames = 0 # Frames produced
+        self.startTime = None
+
+    # Next n frames of ADC counts (channels, n), fewer at the end of data
+    def frames_block(self, n):
+        raise NotImplementedError
+
+    # Produce frames due since start and push them in device-sized chunks
+    def read(self):
+        if self.startTime is None:
+            self.startTime = time.perf_counter()
+        if self.speed:
+            time.sleep(self.interval)
+            n = int((time.perf_counter() - self.startTime)*self.fs*self.speed) - self.frames
+        else:
+            n = self.maxFrames
+        if n <= 0:
+            return 0
+        counts = self.frames_block(n)
+        n = counts.shape[1]
+        self.frames += n
+        if self.encoding == 'ascii':
+            msg = encode_ascii(counts)
+        else:
+            msg = encode_binary(counts, self.sequence, int(self.encoding[6:]))
+        self.sequence += n
+        if self.baudRate and self.speed:
+            # 10 bits per byte (8N1); bytes above the link budget are not sent (whole frames)
+            budget = int((time.perf_counter() - self.startTime)*self.speed*self.baudRate/10) - self.bytesSent
+            if len(msg) > budget:
+                if self.encoding == 'ascii':
+                    ends = np.flatnonzero(np.frombuffer(msg, dtype=np.uint8) == ord('\n')) + 1
+                else:
+                    ends = frame_size(self.channels, int(self.encoding[6:]))*np.arange(1, n + 1)
+                k = int(np.searchsorted(ends, budget, side='right'))
+                msg = msg[:ends[k - 1]] if k else b''
+            else:
+                k = n
+            if k and not self.framesSent:
+                self.framesLostBefore = self.framesLost
+            self.framesLostAfter = n - k if k else self.framesLostAfter + n
+            self.framesLost += n - k
+            self.framesSent += k
+            self.bytesSent += len(msg)
+        i = 0
+        while i < len(msg):
+            size = int(self.rng.integers(self.chunkSize[0], self.chunkSize[1] + 1))
+            self.push(msg[i: i + size])
+            i += size
+        return len(msg)
+
+    # Device commands: protocol switch, other commands are ignored
+    def write(self, data):
+        for name, command in COMMANDS.items():
+            if self.binary and command in bytes(data):
+                self.encoding = name
+
+# Synthetic MYOstack: 12-bit samples around mid-scale, gaussian noise and random EMG bursts
+class SimulatedSource(PacedSource):
+    # Custom constructor
+    def __init__(self, fs=500.0, channels=9, speed=1.0, noise=5.0, burstRate=0.5, burstLength=0.5,
+                 burstAmplitude=300.0, duration=None, **kwargs):
+        PacedSource.__init__(self, fs, speed, **kwargs)
+        self.COM = 'Simulator'
+        self.channels = channels
+        self.noise = noise # Noise std in ADC counts
+        self.burstRate = burstRate # Bursts per second per channel
+        self.burstLength = burstLength # Mean burst length in s
+        self.burstAmplitude = burstAmplitude # Burst std in ADC counts
+        self.duration = duration # Seconds of signal to produce (None - endless)
+        self.burstLeft = np.zeros(channels) # Samples left in current burst per channel
+
+    # Next n frames
+    def frames_block(self, n):
+        if self.duration is not None:
+            n = min(n, int(self.duration*self.fs) - self.frames)
+            if n <= 0:
+                self.finished = True
+                return np.zeros((self.channels, 0), dtype=np.int64)
+        x = 2047 + self.noise*self.rng.standard_normal((self.channels, n))
+        # Burst gate: a burst starts with probability burstRate/fs per sample
+        gate = np.zeros((self.channels, n), dtype=bool)
+        for i in range(self.channels):
+            k = 0
+            while k < n:
+                if self.burstLeft[i] > 0:
+                    m = int(min(self.burstLeft[i], n - k))
+                    gate[i, k: k + m] = True
+                    self.burstLeft[i] -= m
+                    k += m
+                else:
+                    wait = int(self.rng.exponential(self.fs/self.burstRate)) if self.burstRate > 0 else n
+                    k += wait
+                    if k < n:
+                        self.burstLeft[i] = max(1, int(self.rng.exponential(self.burstLength*self.fs)))
+        x += gate*self.burstAmplitude*self.rng.standard_normal((self.channels, n))
+        return np.clip(np.round(x), 0, 4095).astype(np.int64)
+
+# Replay of a recorded session (.txt or .myo) as device bytes at 1x, Nx or maximum speed.
+# Recorded values are in mV after gain, they are converted back to counts assuming gain 1.
+class ReplaySource(PacedSource):
+    # Custom constructor
+    def __init__(self, path, speed=1.0, loop=False, **kwargs):
+        from .recorder import file_info
+        self.channels, fs = file_info(path)
+        PacedSource.__init__(self, fs, speed, **kwargs)
+        self.COM = os.path.basename(path)
+        self.path = path
+        self.loop = loop # Start again at the end of file
+        self.blocks = None
+        self.pending = np.zeros((self.channels, 0)) # Samples read from file and not sent yet
+
+    # Next n frames
+    def frames_block(self, n):
+        from .recorder import read_blocks
+        while self.pending.shape[1] < n:
+            if self.blocks is None:
+                self.blocks = read_blocks(self.path)
+            try:
+                t, block = next(self.blocks)
+            except StopIteration:
+                self.blocks = None
+                if not self.loop:
+                    self.finished = True
+                    break
+                continue
+            self.pending = np.hstack((self.pending, block))
+        block, self.pending = self.pending[:, :n], self.pending[:, n:]
+        return np.clip(np.round(block/ADC_TO_MV), 0, None).astype(np.int64)
+
+# Source by name: 'sim' - simulator, existing file - replay, otherwise serial port ('' - first found);
+# several comma-separated names or 'all' (every serial port) - merged devices (MultiDevice);
+# protocol - requested device protocol (see protocol.py)
+def open_source(name='', baudRate=1000000, speed=1.0, protocol=None):
+    if ',' in name or name.lower() == 'all':
+        from .multidevice import MultiDevice
+        ports = None if name.lower() == 'all' else [s.strip() for s in name.split(',') if s.strip()]
+        source = MultiDevice(ports, baudRate, speed=speed)
+    elif name.lower() in ('sim', 'simulator'):
+        source = SimulatedSource(speed=speed)
+    elif name != '' and os.path.isfile(name):
+        source = ReplaySource(name, speed=speed)
+    else:
+        from .reader import SerialReader
+        source = SerialReader(name, baudRate)
+    source.protocol = protocol
+    return source
@@ -0,0 +1,88 @@
+# Streaming Welch spectrum: detrended, windowed overlapping frames per channel, rfft only when a hop
+# of samples arrived (the average of the last frames equals scipy.signal.welch over them)
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import get_window
+
+# Averaged power spectral density of all channels and EMG fatigue metrics (mean and median power frequency)
+class SpectrumAnalyzer:
+    # Custom constructor
+    def __init__(self, channels=9, fs=500.0, nperseg=256, hop=64, averages=8, window='hann', metricLow=10.0):
+        self.channels = channels
+        self.nperseg = nperseg # Samples per frame
+        self.hop = hop # New samples between frames
+        self.averages = averages # Frames in Welch average
+        self.window = window
+        self.metricLow = metricLow # Lowest frequency used for mean/median frequency in Hz (skips DC offset)
+        self.fs = fs
+        self._design()
+        self.reset()
+
+    # Cached window, scale and frequency axis for fs
+    def _design(self):
+        self.win = get_window(self.window, self.nperseg)
+        self.freqs = np.fft.rfftfreq(self.nperseg, 1/self.fs)
+        self.scale = np.full(len(self.freqs), 2/(self.fs*np.sum(self.win**2))) # One-sided PSD
+        self.scale[0] /= 2
+        if self.nperseg % 2 == 0:
+            self.scale[-1] /= 2
+        self.metricBins = self.freqs >= self.metricLow
+
+    # Sampling frequency: frames keep their samples, computed spectra are rescaled to the new density
+    def set_fs(self, fs):
+        self.frames *= self.fs/fs
+        self.fs = fs
+        self._design()
+        if self.count:
+            self.update_metrics()
+
+    # Clear state
+    def reset(self):
+        self.buf = np.zeros((self.channels, self.nperseg)) # Last nperseg samples
+        self.sinceHop = 0 # Samples since last frame
+        self.received = 0 # Samples added (frames start once nperseg of them filled the buffer)
+        self.frames = np.zeros((self.averages, self.channels, len(self.freqs))) # PSD of last frames
+        self.count = 0 # Frames computed
+        self.psd = np.zeros((self.channels, len(self.freqs))) # Averaged PSD
+        self.meanFreq = np.zeros(self.channels) # Mean power frequency in Hz
+        self.medianFreq = np.zeros(self.channels) # Median power frequency in Hz
+
+    # Add block (channels, N), returns number of new frames
+    def process(self, block):
+        n = block.shape[1]
+        data = np.hstack((self.buf, block))
+        first = self.nperseg + self.hop - self.sinceHop # End of first new frame in data
+        # Frames reaching into the zeros of the initial buffer are skipped
+        empty = 2*self.nperseg - self.received # End of first frame of received samples only
+        if first < empty:
+            first += -(-(empty - first)//self.hop)*self.hop
+        self.buf = data[:, -self.nperseg:]
+        self.sinceHop = (self.sinceHop + n) % self.hop
+        self.received += n
+        if first > data.shape[1]:
+            return 0
+        # Only the last `averages` frames matter
+        ends = np.arange(first, data.shape[1] + 1, self.hop)[-self.averages:]
+        frames = sliding_window_view(data, self.nperseg, axis=1)[:, ends - self.nperseg]
+        frames = frames - frames.mean(axis=-1, keepdims=True) # Constant detrend (as scipy.signal.welch)
+        psd = np.abs(np.fft.rfft(frames*self.win, axis=-1))**2*self.scale
+        for k in range(len(ends)):
+            self.frames[self.count % self.averages] = psd[:, k]
+            self.count += 1
+        self.update_metrics()
+        return len(ends)
+
+    # Welch average and mean/median power frequency of all channels
+    def update_metrics(self):
+        self.psd = self.frames[:min(self.count, self.averages)].mean(axis=0)
+        psd = self.psd[:, self.metricBins]
+        freqs = self.freqs[self.metricBins]
+        total = psd.sum(axis=1)
+        valid = total > 0
+        self.meanFreq = np.where(valid, (psd*freqs).sum(axis=1)/np.where(valid, total, 1), 0)
+        index = np.argmax(np.cumsum(psd, axis=1) >= total[:, None]/2, axis=1)
+        self.medianFreq = np.where(valid, freqs[index], 0)
@@ -0,0 +1,77 @@
+# Sample-indexed timeline: int64 sample counter, time derived on demand, sample rate measured from arrivals
+#
+# Code is placed under the MIT license
+# Copyright (c) 2021 ELEMYO
+
+import time
+from collections import deque
+import numpy as np
+
+# Time of sample i is t_a + (i - i_a)/fs from the anchor (i_a, t_a) of the current fs, so there is no
+# accumulated rounding. fs starts at the nominal rate and follows the rate measured from arrival
+# throughput (samples over the last `span` seconds) when it differs by more than `retune` (relative)
+# and stays within `tolerance` of nominal (replay at other speeds or bursts after a pause keep nominal).
+# A new fs starts a new anchor at the next sample: times already given out never change and stay monotonic.
+class Timeline:
+    # Custom constructor
+    def __init__(self, fs=500.0, span=10.0, minSpan=3.0, tolerance=0.2, retune=0.005, maxGap=1.0):
+        self.nominal = fs # Nominal sampling frequency in Hz
+        self.fs = fs # Sampling frequency used for time axis and processing
+        self.measured = None # Last measured sampling frequency (None - not enough data)
+        self.span = span # Seconds of arrivals used for measurement
+        self.minSpan = minSpan # Seconds of arrivals needed for measurement
+        self.tolerance = tolerance # Maximum relative deviation of measured rate from nominal
+        self.retune = retune # Relative change of measured rate that updates fs
+        self.maxGap = maxGap # Pause between arrivals that restarts measurement in s
+        self.count = np.int64(0) # Samples since reset (index of the next sample)
+        self.arrivals = deque() # (time, samples arrived in total)
+        self.total = 0 # Samples arrived in total (not reset)
+        self._anchor()
+
+    # Start timeline at sample 0, time 0 with current fs
+    def _anchor(self):
+        self.anchorIndex = [0] # First sample index of every fs since reset
+        self.anchorTime = [0.0] # Its time in s
+        self.anchorFs = [self.fs] # fs from there on
+
+    # Restart sample counter (measured rate is kept)
+    def reset(self):
+        self.count = np.int64(0)
+        self._anchor()
+
+    # Count n new samples, returns index of the first one
+    def advance(self, n):
+        start = self.count
+        self.count += n
+        return start
+
+    # Times in s of n samples starting at sample index start (may be negative: before the start)
+    def times(self, start, n):
+        if start >= self.anchorIndex[-1] or len(self.anchorIndex) == 1:
+            return self.anchorTime[-1] + (start - self.anchorIndex[-1] + np.arange(n))/self.fs
+        i = start + np.arange(n)
+        k = np.maximum(np.searchsorted(self.anchorIndex, i, side='right') - 1, 0)
+        return np.asarray(self.anchorTime)[k] + (i - np.asarray(self.anchorIndex)[k])/np.asarray(self.anchorFs)[k]
+
+    # Register arrival of n samples at time now (perf_counter), returns True if fs changed
+    def arrive(self, n, now=None):
+        now = time.perf_counter() if now is None else now
+        if self.arrivals and now - self.arrivals[-1][0] > self.maxGap:
+            self.arrivals.clear()
+        self.total += n
+        self.arrivals.append((now, self.total))
+        while now - self.arrivals[0][0] > self.span:
+            self.arrivals.popleft()
+        t0, n0 = self.arrivals[0]
+        if now - t0 < self.minSpan:
+            return False
+        # Samples counted after the first arrival, over the time since it
+        self.measured = (self.total - n0)/(now - t0)
+        if (abs(self.measured/self.nominal - 1) <= self.tolerance and
+                abs(self.measured/self.fs - 1) > self.retune):
+            self.anchorTime.append(float(self.times(self.count, 1)[0]))
+            self.anchorIndex.append(int(self.count))
+            self.anchorFs.append(self.measured)
+            self.fs = self.measured
+            return True
+        return False